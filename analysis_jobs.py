@@ -0,0 +1,260 @@
+"""
+Analysis Jobs Module
+Runs /analyze-solicitations as a background job so long analyses do not
+hold a web request open. Progress is persisted per phase and per document.
+"""
+
+import os
+import json
+import uuid
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, request, jsonify
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Create Blueprint
+analysis_jobs_bp = Blueprint('analysis_jobs', __name__, url_prefix='/api/analysis-jobs')
+
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "2"))
+
+# Database reference and pipeline (set by init function)
+db = None
+AnalysisJob = None
+run_pipeline = None
+app_context = None
+executor = None
+
+
+def init_analysis_jobs_db(database, pipeline, context):
+    """
+    Initialize the job model and worker pool.
+
+    Args:
+        database: The app's SQLAlchemy instance
+        pipeline: run_solicitation_analysis(urls, on_event, solicitation_number, refresh) -> (payload, http_status)
+        context: app.app_context, used to give worker threads an app context
+    """
+    global db, AnalysisJob, run_pipeline, app_context, executor
+    db = database
+    run_pipeline = pipeline
+    app_context = context
+    executor = ThreadPoolExecutor(max_workers=ANALYSIS_JOB_WORKERS, thread_name_prefix='analysis-job')
+
+    class AnalysisJobModel(db.Model):
+        __tablename__ = 'analysis_jobs'
+
+        id = db.Column(db.String(36), primary_key=True)
+        status = db.Column(db.String(20), default='queued', index=True)  # queued, running, completed, failed
+        phase = db.Column(db.String(20), default='queued')  # queued, upload, extraction, summary, done
+        urls = db.Column(db.Text, nullable=False)  # JSON list
+        solicitation_number = db.Column(db.String(100), nullable=True)
+        refresh = db.Column(db.Boolean, default=False)  # bypass the summary store
+        progress = db.Column(db.Text, nullable=True)  # JSON: upload stats + per-document status
+        result = db.Column(db.Text, nullable=True)  # JSON: same body as /analyze-solicitations
+        http_status = db.Column(db.Integer, nullable=True)
+        error = db.Column(db.Text, nullable=True)
+        created_at = db.Column(db.DateTime, default=datetime.utcnow)
+        started_at = db.Column(db.DateTime, nullable=True)
+        finished_at = db.Column(db.DateTime, nullable=True)
+        updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    globals()['AnalysisJob'] = AnalysisJobModel
+    return AnalysisJobModel
+
+
+def submit_analysis_job(urls, solicitation_number=None, refresh=False):
+    """Create a job row and queue it on the worker pool. Returns the job."""
+    job = AnalysisJob(
+        id=str(uuid.uuid4()),
+        status='queued',
+        phase='queued',
+        urls=json.dumps(urls),
+        solicitation_number=solicitation_number,
+        refresh=refresh,
+        progress=json.dumps(_empty_progress(len(urls))),
+    )
+    db.session.add(job)
+    db.session.commit()
+    executor.submit(_run_job, job.id)
+    return job
+
+
+def resume_analysis_jobs():
+    """
+    Re-queue jobs left queued or running by a previous process.
+    Upload and extraction caches make the repeated work cheap.
+    """
+    jobs = AnalysisJob.query.filter(AnalysisJob.status.in_(['queued', 'running'])).all()
+    for job in jobs:
+        job.status = 'queued'
+        job.phase = 'queued'
+        job.progress = json.dumps(_empty_progress(len(json.loads(job.urls))))
+        job.updated_at = datetime.utcnow()
+    db.session.commit()
+    for job in jobs:
+        executor.submit(_run_job, job.id)
+    if jobs:
+        print(f"[analysis-jobs] Re-queued {len(jobs)} interrupted job(s)", flush=True)
+    return len(jobs)
+
+
+def _empty_progress(url_count):
+    return {
+        'documents_requested': url_count,
+        'upload_stats': None,
+        'documents_total': None,
+        'documents_done': 0,
+        'documents': [],
+        'summary_status': None,
+    }
+
+
+def _run_job(job_id):
+    """Worker entry point: run the pipeline and persist progress as it happens."""
+    with app_context():
+        job = AnalysisJob.query.get(job_id)
+        if not job:
+            return
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        job.updated_at = job.started_at
+        db.session.commit()
+
+        progress = json.loads(job.progress) if job.progress else _empty_progress(len(json.loads(job.urls)))
+        lock = threading.Lock()
+
+        def on_event(event, data):
+            with lock:
+                if event == 'phase':
+                    job.phase = data['phase']
+                elif event == 'uploaded':
+                    progress['upload_stats'] = data['stats']
+                    progress['documents_total'] = data['documents']
+                elif event == 'document':
+                    progress['documents_done'] += 1
+                    entry = {'document_index': data['document_index'], 'status': data['status']}
+                    if data['status'] == 'failed':
+                        entry['error'] = data['data'].get('error')
+                    progress['documents'].append(entry)
+                elif event == 'summary':
+                    progress['summary_status'] = data['status']
+                job.progress = json.dumps(progress)
+                job.updated_at = datetime.utcnow()
+                db.session.commit()
+
+        try:
+            payload, http_status = run_pipeline(json.loads(job.urls), on_event=on_event,
+                                                solicitation_number=job.solicitation_number,
+                                                refresh=bool(job.refresh))
+            job.result = json.dumps(payload)
+            job.http_status = http_status
+            job.status = 'completed' if http_status == 200 else 'failed'
+            job.error = payload.get('error') if http_status != 200 else None
+        except Exception as e:
+            db.session.rollback()
+            print(f"[analysis-jobs] Job {job_id} crashed: {e}", flush=True)
+            job.status = 'failed'
+            job.http_status = 500
+            job.error = str(e)
+        job.phase = 'done'
+        job.finished_at = datetime.utcnow()
+        job.updated_at = job.finished_at
+        db.session.commit()
+        print(f"[analysis-jobs] Job {job_id} finished: {job.status}", flush=True)
+
+
+def _processing_stats(progress, result):
+    """Same processing_stats shape as the synchronous /analyze-solicitations response."""
+    if result and 'processing_stats' in result:
+        return result['processing_stats']
+    upload_stats = progress.get('upload_stats') or {}
+    analyzed = len([d for d in progress.get('documents', []) if d['status'] == 'analyzed'])
+    return {
+        'documents_requested': progress.get('documents_requested', 0),
+        'documents_uploaded': upload_stats.get('uploaded', 0),
+        'documents_skipped': upload_stats.get('skipped', 0),
+        'documents_analyzed': analyzed,
+        'documents_in_summary': 0,
+        'documents_duplicate': len(upload_stats.get('duplicates', [])),
+        'duplicates': upload_stats.get('duplicates', []),
+        'skipped_details': upload_stats.get('skipped_details', []),
+        'download_cache': upload_stats.get('download_cache', {'hits': 0, 'misses': 0}),
+    }
+
+
+def _job_to_dict(job):
+    progress = json.loads(job.progress) if job.progress else {}
+    result = json.loads(job.result) if job.result else None
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'phase': job.phase,
+        'solicitation_number': job.solicitation_number,
+        'refresh': bool(job.refresh),
+        'error': job.error,
+        'progress': {
+            'documents_total': progress.get('documents_total'),
+            'documents_done': progress.get('documents_done', 0),
+            'documents': progress.get('documents', []),
+            'summary_status': progress.get('summary_status'),
+        },
+        'processing_stats': _processing_stats(progress, result),
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'updated_at': job.updated_at.isoformat() if job.updated_at else None,
+    }
+
+
+# API Routes
+@analysis_jobs_bp.route('', methods=['POST'])
+def create_analysis_job():
+    """Submit solicitation URLs for background analysis. Returns a job id right away."""
+    data = request.get_json(silent=True) or {}
+    urls = data.get('urls')
+
+    if not urls or not isinstance(urls, list):
+        return jsonify({'error': "Missing or invalid 'urls' array."}), 400
+
+    try:
+        job = submit_analysis_job(urls, solicitation_number=data.get('solicitation_number'),
+                                  refresh=bool(data.get('refresh')))
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f"/api/analysis-jobs/{job.id}",
+        'result_url': f"/api/analysis-jobs/{job.id}/result",
+    }), 202
+
+
+@analysis_jobs_bp.route('/<job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    """Get job status with per-phase and per-document progress"""
+    job = AnalysisJob.query.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(_job_to_dict(job))
+
+
+@analysis_jobs_bp.route('/<job_id>/result', methods=['GET'])
+def get_analysis_job_result(job_id):
+    """
+    Get the finished job's result: the same body and status code the
+    synchronous /analyze-solicitations route would have returned.
+    Returns 202 with the job status while the job is still running.
+    """
+    job = AnalysisJob.query.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status in ('queued', 'running'):
+        return jsonify(_job_to_dict(job)), 202
+    if not job.result:
+        return jsonify({'error': job.error or 'Job failed', 'processing_stats': _job_to_dict(job)['processing_stats']}), job.http_status or 500
+    return jsonify(json.loads(job.result)), job.http_status or 200
@@ -1,12 +1,15 @@
 import os
 import io
 import time
+import hashlib
 import tempfile
-import requests
-from flask import Flask, request, jsonify, Blueprint
+import threading
+import contextvars
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, request, jsonify, Blueprint, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from openai import OpenAI
 from dotenv import load_dotenv
 import json
 import re
@@ -19,6 +22,27 @@ from email_webhook import webhook_bp, init_webhook_db
 from email_poller import init_poller_db
 from background_jobs import init_background_jobs, get_scheduler_status, start_negotiation_for_session
 from suggestions import suggestions_bp
+from cache_store import SqliteCache
+from http_cache import HttpBodyCache, HTTP_CACHE_ENABLED
+from http_session import http_get, get_pool_metrics
+from summary_merge import schema_from_prompt, merge_extractions, apply_resolutions, resolve_conflicts_locally
+from document_conversion import (
+    DIRECT_UPLOAD_SUFFIXES, CONVERT_TO_PDF_TYPES, TEXT_NATIVE_TYPES, ATTACHMENT_TEXT_MODE, PDF_CHUNK_PAGES,
+    detect_file_type, magic_type, sniff_file_type, extract_text, split_pdf,
+)
+from conversion_pool import ConversionFailed, convert_to_pdf_isolated, get_conversion_pool
+from rate_limiter import get_limiter_status
+from llm_gateway import get_gateway
+from model_router import get_router, track_degraded
+import llm_metrics
+from token_budget import PromptBudget, get_budget_stats
+from schemas import StructuredOutputError, register_schema, template_schema, get_schema_stats
+from analysis_jobs import analysis_jobs_bp, init_analysis_jobs_db, resume_analysis_jobs
+from bulk_analysis import bulk_bp, init_bulk_analysis_db, start_bulk_runner
+from solicitation_summaries import (
+    SUMMARY_STORE_ENABLED, summaries_bp, init_solicitation_summaries_db, find_stored_summary, save_summary,
+    latest_summary,
+)
 
 load_dotenv()
 app = Flask(__name__)
@@ -102,7 +126,12 @@ CORS(app, resources={
         "origins": "*"
     }
 })
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Every OpenAI call goes through the shared gateway (one connection pool,
+# concurrency caps, retry policy and per-call-site metrics). File uploads use
+# its client directly, with the SDK's own retries.
+llm_gateway = get_gateway()
+model_router = get_router()
+openai_client = llm_gateway.client.with_options(max_retries=2)
 
 # Your detailed instruction prompt
 SYSTEM_PROMPT = {
@@ -204,229 +233,503 @@ def parse_raw_output(raw_output):
         print("Failed to parse raw_output:", e)
         return None
 
-DIRECT_UPLOAD_SUFFIXES = {
-    "pdf": ".pdf",
-    "docx": ".docx",
-    "txt": ".txt",
-    "md": ".md",
-}
+# Concurrency limits for the attachment pipeline. Downloads are network-bound,
+# text extraction is CPU-bound and uploads are bounded by OpenAI, so each stage
+# gets its own cap. The caps are process-wide so concurrent analyses share them
+# instead of multiplying them. PDF rendering runs in the conversion process
+# pool, whose size (CONVERSION_WORKERS) is its cap.
+ATTACHMENT_DOWNLOAD_CONCURRENCY = int(os.getenv("ATTACHMENT_DOWNLOAD_CONCURRENCY", "8"))
+ATTACHMENT_CONVERT_CONCURRENCY = int(os.getenv("ATTACHMENT_CONVERT_CONCURRENCY", "2"))
+ATTACHMENT_UPLOAD_CONCURRENCY = int(os.getenv("ATTACHMENT_UPLOAD_CONCURRENCY", "4"))
+ATTACHMENT_PER_HOST_CONNECTIONS = int(os.getenv("ATTACHMENT_PER_HOST_CONNECTIONS", "4"))
+
+# Attachments are streamed into a spooled buffer that stays in memory up to
+# ATTACHMENT_SPOOL_MEMORY_BYTES and rolls over to disk beyond that, so memory
+# stays flat regardless of file size. Anything over ATTACHMENT_MAX_BYTES is skipped.
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(512 * 1024 ** 2)))
+ATTACHMENT_SPOOL_MEMORY_BYTES = int(os.getenv("ATTACHMENT_SPOOL_MEMORY_BYTES", str(8 * 1024 ** 2)))
+DOWNLOAD_CHUNK_BYTES = 256 * 1024
+
+# Conditional-GET cache of downloaded attachment bodies (see http_cache.py).
+http_cache = HttpBodyCache()
+
+_download_slots = threading.BoundedSemaphore(ATTACHMENT_DOWNLOAD_CONCURRENCY)
+_convert_slots = threading.BoundedSemaphore(ATTACHMENT_CONVERT_CONCURRENCY)
+_upload_slots = threading.BoundedSemaphore(ATTACHMENT_UPLOAD_CONCURRENCY)
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+
+def _get_host_slots(url):
+    """Return the semaphore capping concurrent connections to the URL's host."""
+    from urllib.parse import urlparse
+    host = (urlparse(url).hostname or '').lower()
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(ATTACHMENT_PER_HOST_CONNECTIONS)
+        return _host_slots[host]
+
+
+# Content-addressed cache of OpenAI file uploads, keyed by the SHA-256 of the
+# bytes that were uploaded. Converted attachments also get an alias keyed by the
+# hash of the downloaded source so a hit skips the conversion as well.
+UPLOAD_CACHE_ENABLED = os.getenv("UPLOAD_CACHE_ENABLED", "true").lower() == "true"
+upload_cache = SqliteCache(
+    "openai_upload_cache.db",
+    table="uploads",
+    ttl_seconds=int(os.getenv("UPLOAD_CACHE_TTL_HOURS", "72")) * 3600,
+    max_entries=int(os.getenv("UPLOAD_CACHE_MAX_ENTRIES", "5000")),
+    max_bytes=int(os.getenv("UPLOAD_CACHE_MAX_BYTES", str(5 * 1024 ** 3))),
+)
+
+
+def _cached_upload(key):
+    """Return the cached upload entry ({"file_id", "sha256", ...}) for a cache key, or None."""
+    if not UPLOAD_CACHE_ENABLED:
+        return None
+    try:
+        entry = upload_cache.get(key)
+    except Exception as e:
+        print(f"  Upload cache lookup failed: {e}", flush=True)
+        return None
+    return entry
 
-CONVERT_TO_PDF_TYPES = {"xlsx", "xls", "csv", "html"}
 
+def _remember_upload(keys, file_id, sha256, size, expires_at=None, warnings=None):
+    """
+    Record an OpenAI file_id (and any conversion warnings) under every cache
+    key that should resolve to it. Only the upload:<sha256> key counts the
+    file's bytes against UPLOAD_CACHE_MAX_BYTES; aliases count nothing.
+    """
+    if not UPLOAD_CACHE_ENABLED:
+        return
+    ttl_seconds = upload_cache.ttl_seconds
+    if expires_at:
+        # Never keep a file_id past the expiry OpenAI reported for the file.
+        remaining = max(0, int(expires_at - time.time()))
+        ttl_seconds = min(ttl_seconds, remaining) if ttl_seconds else remaining
+    entry = {"file_id": file_id, "sha256": sha256, "size": size, "expires_at": expires_at, "warnings": warnings or []}
+    try:
+        for key in keys:
+            upload_cache.set(key, entry, size=size if key == f"upload:{sha256}" else 0, ttl_seconds=ttl_seconds)
+    except Exception as e:
+        print(f"  Upload cache write failed: {e}", flush=True)
 
-def _detect_file_type(url, content_type):
-    """Detect file type from URL extension and Content-Type header."""
-    from urllib.parse import urlparse
-    ext = os.path.splitext(urlparse(url).path)[1].lower()
-    
-    type_map = {
-        '.pdf': 'pdf',
-        '.docx': 'docx',
-        '.doc': 'doc',
-        '.xlsx': 'xlsx',
-        '.xls': 'xls',
-        '.html': 'html',
-        '.htm': 'html',
-        '.txt': 'txt',
-        '.md': 'md',
-        '.csv': 'csv',
-    }
-    if ext in type_map:
-        return type_map[ext]
-    
-    ct = (content_type or '').lower()
-    if 'pdf' in ct:
-        return 'pdf'
-    if 'wordprocessingml' in ct:
-        return 'docx'
-    if 'msword' in ct:
-        return 'doc'
-    if 'spreadsheetml' in ct:
-        return 'xlsx'
-    if 'ms-excel' in ct:
-        return 'xls'
-    if 'text/markdown' in ct:
-        return 'md'
-    if 'text/csv' in ct:
-        return 'csv'
-    if 'html' in ct:
-        return 'html'
-    if 'text/plain' in ct:
-        return 'txt'
-    
-    return 'unknown'
 
-def _sniff_file_type(file_content):
-    """Best-effort file type sniffing for generic URLs/content-types."""
-    if file_content[:5] == b'%PDF-':
-        return 'pdf'
+def _download_attachment(url):
+    """
+    Stream an attachment into a spooled buffer, hashing it on the way.
+
+    Returns (buffer, sha256, file_type, cache_status). The buffer is None when
+    the first chunk already shows the file cannot be used, in which case the
+    rest is never downloaded. Raises ValueError when the file exceeds
+    ATTACHMENT_MAX_BYTES.
 
-    # Office Open XML formats are ZIP containers.
-    if file_content[:2] == b'PK':
+    URLs seen before are revalidated against the on-disk HTTP cache with
+    If-None-Match/If-Modified-Since; on a 304 the cached body file is
+    returned and cache_status is "hit". Otherwise cache_status is "miss"
+    ("bypass" when the cache is disabled).
+    """
+    cached_entry, cached_body = http_cache.lookup(url) if HTTP_CACHE_ENABLED else (None, None)
+    headers = {}
+    if cached_entry:
+        if cached_entry["etag"]:
+            headers["If-None-Match"] = cached_entry["etag"]
+        if cached_entry["last_modified"]:
+            headers["If-Modified-Since"] = cached_entry["last_modified"]
+
+    try:
+        with _get_host_slots(url), _download_slots:
+            with http_get(url, stream=True, headers=headers) as response:
+                if response.status_code == 304 and cached_body is not None:
+                    http_cache.touch(url)
+                    file_type = detect_file_type(url, cached_entry["content_type"])
+                    body, cached_body = cached_body, None
+                    if file_type in {'unknown', 'doc', 'xls'}:
+                        sniffed_type = sniff_file_type(body)
+                        if sniffed_type != 'unknown':
+                            file_type = sniffed_type
+                    body.seek(0)
+                    return body, cached_entry["sha256"], file_type, "hit"
+                response.raise_for_status()
+
+                content_type = response.headers.get('Content-Type', '')
+                file_type = detect_file_type(url, content_type)
+                declared_size = response.headers.get('Content-Length', '')
+                if declared_size.isdigit() and int(declared_size) > ATTACHMENT_MAX_BYTES:
+                    raise ValueError(f"File too large ({int(declared_size)} bytes, limit {ATTACHMENT_MAX_BYTES})")
+
+                buffer = tempfile.SpooledTemporaryFile(max_size=ATTACHMENT_SPOOL_MEMORY_BYTES)
+                digest = hashlib.sha256()
+                size = 0
+                try:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                        if not chunk:
+                            continue
+                        if size == 0:
+                            magic = magic_type(chunk)
+                            if magic == 'pdf' and file_type in {'unknown', 'doc', 'xls'}:
+                                file_type = 'pdf'
+                            elif magic == 'unknown' and file_type in {'unknown', 'doc'}:
+                                # Neither a PDF nor an Office Open XML container: it will be
+                                # skipped whatever the rest of the body holds.
+                                buffer.close()
+                                return None, None, file_type, "miss" if HTTP_CACHE_ENABLED else "bypass"
+                        size += len(chunk)
+                        if size > ATTACHMENT_MAX_BYTES:
+                            raise ValueError(f"File too large (over {ATTACHMENT_MAX_BYTES} bytes)")
+                        digest.update(chunk)
+                        buffer.write(chunk)
+                except Exception:
+                    buffer.close()
+                    raise
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+    finally:
+        if cached_body is not None:
+            cached_body.close()
+
+    sha256 = digest.hexdigest()
+    # Without validators a cached body could never be revalidated, so only
+    # responses that carry one are stored.
+    if HTTP_CACHE_ENABLED and (etag or last_modified):
         try:
-            import zipfile
-            with zipfile.ZipFile(io.BytesIO(file_content)) as zf:
-                names = zf.namelist()
-                if any(name.startswith("word/") for name in names):
-                    return 'docx'
-                if any(name.startswith("xl/") for name in names):
-                    return 'xlsx'
-        except Exception:
-            pass
+            http_cache.store(url, buffer, sha256, size, etag, last_modified, content_type)
+        except Exception as e:
+            print(f"  HTTP cache write failed: {e}", flush=True)
+
+    if file_type in {'unknown', 'doc', 'xls'}:
+        sniffed_type = sniff_file_type(buffer)
+        if sniffed_type != 'unknown':
+            file_type = sniffed_type
+    buffer.seek(0)
+    return buffer, sha256, file_type, "miss" if HTTP_CACHE_ENABLED else "bypass"
+
+
+class _ContentClaims:
+    """
+    Ownership of downloaded content hashes within one request, so identical
+    attachments behind different URLs are converted and uploaded only once
+    even while they download concurrently.
 
-    return 'unknown'
+    The first download to finish does the work; settle() then hands its
+    result to the lowest URL index with the same bytes, so which URL is the
+    canonical copy does not depend on download timing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._owners = {}
+        self._indexes = {}
+
+    def claim(self, sha256, index):
+        """Return the URL index that processes sha256 (index itself if it is the first)."""
+        with self._lock:
+            self._indexes.setdefault(sha256, []).append(index)
+            return self._owners.setdefault(sha256, index)
+
+    def settle(self, results):
+        """Move each processed result to the lowest URL index that claimed its hash, in place."""
+        for sha256, owner in self._owners.items():
+            lowest = min(self._indexes[sha256])
+            if lowest == owner:
+                continue
+            processed = dict(results[owner], download_cache=results[lowest].get("download_cache"))
+            results[owner] = {"duplicate_of": lowest, "download_cache": results[owner].get("download_cache")}
+            results[lowest] = processed
+            for index in self._indexes[sha256]:
+                if index not in (owner, lowest):
+                    results[index]["duplicate_of"] = lowest
 
 
-def _convert_to_pdf(file_content, file_type):
-    """Convert non-PDF file content to PDF bytes. Returns PDF bytes or None."""
+def _process_attachment(url, index=None, claims=None):
+    """
+    Download, sniff, convert and upload a single attachment.
+
+    Returns the _prepare_attachment result, {"skip_reason": ...} when the
+    download failed, or {"duplicate_of": <url index>} when claims shows
+    another URL in the request already has the same bytes. Every result
+    carries "download_cache" ("hit", "miss" or "bypass") so the caller can do
+    the stats accounting in URL order.
+    """
+    source = None
+    cache_status = None
     try:
-        if file_type == 'docx':
-            from docx import Document
-            doc = Document(io.BytesIO(file_content))
-            paragraphs = []
-            for para in doc.paragraphs:
-                text = para.text.strip()
-                if text:
-                    escaped = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                    paragraphs.append(f"<p>{escaped}</p>")
-            
-            for table in doc.tables:
-                paragraphs.append("<table border='1' cellpadding='4' cellspacing='0' style='border-collapse:collapse;width:100%'>")
-                for row in table.rows:
-                    paragraphs.append("<tr>")
-                    for cell in row.cells:
-                        cell_text = cell.text.strip().replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                        paragraphs.append(f"<td>{cell_text}</td>")
-                    paragraphs.append("</tr>")
-                paragraphs.append("</table>")
-            
-            html = f"<html><body style='font-family:Arial,sans-serif;font-size:11pt;line-height:1.5'>{''.join(paragraphs)}</body></html>"
-        
-        elif file_type in ('xlsx', 'xls', 'csv'):
-            if file_type == 'csv':
-                import csv as csv_module
-                reader = csv_module.reader(io.StringIO(file_content.decode('utf-8', errors='replace')))
-                rows = list(reader)
-                table_html = "<table border='1' cellpadding='4' cellspacing='0' style='border-collapse:collapse;width:100%'>"
-                for row in rows:
-                    table_html += "<tr>" + "".join(f"<td>{c}</td>" for c in row) + "</tr>"
-                table_html += "</table>"
-                html = f"<html><body style='font-family:Arial,sans-serif;font-size:10pt'>{table_html}</body></html>"
-            else:
-                from openpyxl import load_workbook
-                wb = load_workbook(io.BytesIO(file_content), read_only=True, data_only=True)
-                sheets_html = []
-                for sheet_name in wb.sheetnames:
-                    ws = wb[sheet_name]
-                    sheets_html.append(f"<h2>{sheet_name}</h2>")
-                    sheets_html.append("<table border='1' cellpadding='4' cellspacing='0' style='border-collapse:collapse;width:100%'>")
-                    for row in ws.iter_rows(values_only=True):
-                        sheets_html.append("<tr>")
-                        for cell in row:
-                            val = str(cell) if cell is not None else ""
-                            val = val.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                            sheets_html.append(f"<td>{val}</td>")
-                        sheets_html.append("</tr>")
-                    sheets_html.append("</table>")
-                wb.close()
-                html = f"<html><body style='font-family:Arial,sans-serif;font-size:10pt'>{''.join(sheets_html)}</body></html>"
-        
-        elif file_type == 'html':
-            html = file_content.decode('utf-8', errors='replace')
-        
-        elif file_type == 'txt':
-            text = file_content.decode('utf-8', errors='replace')
-            escaped = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-            html = f"<html><body style='font-family:monospace;font-size:10pt;white-space:pre-wrap'>{escaped}</body></html>"
-        
+        source, source_hash, file_type, cache_status = _download_attachment(url)
+        owner = claims.claim(source_hash, index) if claims is not None and source is not None else index
+        if owner != index:
+            print(f"  Duplicate content ({source_hash[:12]}) of attachment {owner + 1}, not processing again", flush=True)
+            result = {"duplicate_of": owner}
         else:
-            return None
-        
-        from weasyprint import HTML
-        pdf_bytes = HTML(string=html).write_pdf()
-        return pdf_bytes
-    
+            result = _prepare_attachment(url, source, source_hash, file_type)
     except Exception as e:
-        print(f"Error converting {file_type} to PDF: {e}")
+        print(f"Error downloading or uploading file from {url}: {e}", flush=True)
+        result = {"skip_reason": str(e)}
+    finally:
+        if source is not None:
+            source.close()
+    result["download_cache"] = cache_status
+    return result
+
+
+def _prepare_attachment(url, source, source_hash, file_type):
+    """
+    Turn a downloaded attachment into a model input, converting and
+    uploading it as needed.
+
+    Text-native formats (docx, xlsx, csv, txt, md) are extracted locally and
+    sent inline as input_text instead of being uploaded; PDF rendering or the
+    original upload is only used when extraction fails.
+
+    Returns {"file_input": ..., "sha256": ..., "warnings": [...]} on success,
+    where sha256 is the hash of the uploaded bytes (or of the extracted text)
+    and warnings lists sheets that were sampled or text that was truncated,
+    or {"skip_reason": ...} when the attachment was skipped.
+    """
+    warnings = []
+    print(f"  File type detected: {file_type} for {url[:80]}...", flush=True)
+
+    if source is not None and ATTACHMENT_TEXT_MODE == 'text' and file_type in TEXT_NATIVE_TYPES:
+        with _convert_slots:
+            text = extract_text(source, file_type, warnings)
+        if text:
+            print(f"  Extracted {file_type} as text ({len(text)} chars)", flush=True)
+            return {
+                "file_input": {"type": "input_text", "text": text},
+                "sha256": hashlib.sha256(text.encode('utf-8')).hexdigest(),
+                "warnings": warnings,
+            }
+        warnings = []
+        print(f"  Text extraction failed for {file_type}, falling back to file upload", flush=True)
+
+    if source is not None and file_type == 'pdf':
+        chunked = _prepare_pdf_chunks(source, source_hash)
+        if chunked:
+            return chunked
+
+    cache_keys = []
+
+    if source is not None and file_type in DIRECT_UPLOAD_SUFFIXES:
+        cache_keys.append(f"upload:{source_hash}")
+        cached = _cached_upload(cache_keys[0])
+        if cached:
+            print(f"  Upload cache hit for {file_type} file ({cached['file_id']})", flush=True)
+            return {"file_input": {"type": "input_file", "file_id": cached["file_id"]}, "sha256": source_hash, "warnings": []}
+        upload_buffer = source
+        upload_hash = source_hash
+        upload_size = source.seek(0, io.SEEK_END)
+        source.seek(0)
+        upload_suffix = DIRECT_UPLOAD_SUFFIXES[file_type]
+        print(f"  Uploading original {file_type} file", flush=True)
+    elif file_type == 'doc':
+        reason = "Legacy .doc format (unsupported)"
+        print(f"  Skipping: {reason} for {url[:80]}...", flush=True)
+        return {"skip_reason": reason}
+    elif source is not None and file_type in CONVERT_TO_PDF_TYPES:
+        cache_keys.append(f"converted:{file_type}:{source_hash}")
+        cached = _cached_upload(cache_keys[0])
+        if cached:
+            print(f"  Upload cache hit for converted {file_type} file ({cached['file_id']})", flush=True)
+            return {
+                "file_input": {"type": "input_file", "file_id": cached["file_id"]},
+                "sha256": cached["sha256"],
+                "warnings": cached.get("warnings") or [],
+            }
+        try:
+            file_bytes = convert_to_pdf_isolated(source, file_type, warnings)
+        except ConversionFailed as e:
+            reason = str(e)
+            print(f"  Skipping: {reason} for {url[:80]}...", flush=True)
+            return {"skip_reason": reason}
+        if not file_bytes:
+            reason = f"Failed to convert {file_type} to PDF"
+            print(f"  Skipping: {reason} for {url[:80]}...", flush=True)
+            return {"skip_reason": reason}
+        upload_suffix = ".pdf"
+        print(f"  Converted {file_type} to PDF ({len(file_bytes)} bytes)", flush=True)
+        upload_hash = hashlib.sha256(file_bytes).hexdigest()
+        upload_size = len(file_bytes)
+        cache_keys.append(f"upload:{upload_hash}")
+        cached = _cached_upload(cache_keys[-1])
+        if cached:
+            print(f"  Upload cache hit for converted PDF ({cached['file_id']})", flush=True)
+            _remember_upload(cache_keys[:1], cached["file_id"], upload_hash, upload_size, cached.get("expires_at"), warnings)
+            return {"file_input": {"type": "input_file", "file_id": cached["file_id"]}, "sha256": upload_hash, "warnings": warnings}
+        upload_buffer = io.BytesIO(file_bytes)
+    else:
+        reason = f"Unsupported file type: {file_type}"
+        print(f"  Skipping: {reason} for {url[:80]}...", flush=True)
+        return {"skip_reason": reason}
+
+    with _upload_slots:
+        upload = openai_client.files.create(
+            file=(f"{upload_hash[:16]}{upload_suffix}", upload_buffer),
+            purpose="user_data"
+        )
+    _remember_upload(cache_keys, upload.id, upload_hash, upload_size, getattr(upload, "expires_at", None), warnings)
+
+    return {"file_input": {"type": "input_file", "file_id": upload.id}, "sha256": upload_hash, "warnings": warnings}
+
+
+def _upload_pdf_bytes(data, name_suffix=".pdf"):
+    """Upload PDF bytes through the upload cache. Returns (file_id, sha256, expires_at)."""
+    data_hash = hashlib.sha256(data).hexdigest()
+    cached = _cached_upload(f"upload:{data_hash}")
+    if cached:
+        return cached["file_id"], data_hash, cached.get("expires_at")
+    with _upload_slots:
+        upload = openai_client.files.create(
+            file=(f"{data_hash[:16]}{name_suffix}", io.BytesIO(data)),
+            purpose="user_data"
+        )
+    expires_at = getattr(upload, "expires_at", None)
+    _remember_upload([f"upload:{data_hash}"], upload.id, data_hash, len(data), expires_at)
+    return upload.id, data_hash, expires_at
+
+
+def _prepare_pdf_chunks(source, source_hash):
+    """
+    Split a long PDF into page ranges and upload each one (see split_pdf).
+
+    Returns {"file_input": None, "chunks": [...], "sha256", "warnings"} where
+    each chunk is {"file_input", "sha256", "pages"}, or None when the PDF is
+    short enough (or unsplittable) and should be uploaded whole.
+    """
+    manifest_key = f"chunks:{source_hash}"
+    cached = _cached_upload(manifest_key)
+    if cached:
+        print(f"  Upload cache hit for {len(cached['chunks'])} PDF chunk(s)", flush=True)
+        return {"file_input": None, "chunks": cached["chunks"], "sha256": source_hash, "warnings": []}
+
+    parts = split_pdf(source)
+    if not parts:
         return None
+    print(f"  Splitting PDF into {len(parts)} chunk(s) of up to {PDF_CHUNK_PAGES} pages", flush=True)
+    chunks = []
+    expiries = []
+    for part in parts:
+        file_id, chunk_hash, expires_at = _upload_pdf_bytes(part["data"], f"-p{part['first_page']}.pdf")
+        chunks.append({
+            "file_input": {"type": "input_file", "file_id": file_id},
+            "sha256": chunk_hash,
+            "pages": f"{part['first_page']}-{part['last_page']}",
+        })
+        if expires_at:
+            expiries.append(expires_at)
+    if UPLOAD_CACHE_ENABLED:
+        ttl_seconds = upload_cache.ttl_seconds
+        if expiries:
+            remaining = max(0, int(min(expiries) - time.time()))
+            ttl_seconds = min(ttl_seconds, remaining) if ttl_seconds else remaining
+        try:
+            upload_cache.set(manifest_key, {"chunks": chunks}, ttl_seconds=ttl_seconds)
+        except Exception as e:
+            print(f"  Upload cache write failed: {e}", flush=True)
+    return {"file_input": None, "chunks": chunks, "sha256": source_hash, "warnings": []}
+
 
+def _normalize_attachment_url(url):
+    """URL identity for de-duplication: surrounding whitespace and the fragment never change the file."""
+    return url.strip().split('#', 1)[0]
 
-def download_and_upload_files(urls):
-    uploaded_files = []
+
+def download_and_upload_files(urls, on_event=None):
+    """
+    Download every URL and upload it to OpenAI.
+
+    Returns (documents, stats) where each document is
+    {"url", "sha256", "file_input"} in request order (long PDFs carry
+    "chunks" instead of a file_input, see _prepare_pdf_chunks). Documents whose sheets
+    were sampled are also listed in skipped_details with "partial": True.
+    When on_event is given, a "skipped" event ({"url", "reason"}) is reported
+    for each skipped attachment, in URL order, once every download has
+    finished and duplicates are settled, so it matches skipped_details.
+
+    Repeated URLs are fetched once, and attachments whose downloaded bytes
+    (or resulting model input) match an earlier one are neither converted,
+    uploaded nor extracted again. They are listed in stats["duplicates"]
+    with the 1-based index of the document they duplicate.
+    """
+    documents = []
     stats = {
         "requested": len(urls),
         "uploaded": 0,
         "skipped": 0,
         "skipped_details": [],
+        "duplicates": [],
+        "download_cache": {"hits": 0, "misses": 0},
     }
-    for url in urls:
-        tmp_path = None
-        try:
-            response = requests.get(url, timeout=60)
-            response.raise_for_status()
-            
-            content_type = response.headers.get('Content-Type', '')
-            file_type = _detect_file_type(url, content_type)
-            sniffed_type = _sniff_file_type(response.content)
-            if sniffed_type != 'unknown' and file_type in {'unknown', 'doc', 'xls'}:
-                file_type = sniffed_type
-            print(f"  File type detected: {file_type} for {url[:80]}...", flush=True)
-            
-            if file_type in DIRECT_UPLOAD_SUFFIXES:
-                file_bytes = response.content
-                upload_suffix = DIRECT_UPLOAD_SUFFIXES[file_type]
-                print(f"  Uploading original {file_type} file", flush=True)
-            elif file_type == 'doc':
-                reason = "Legacy .doc format (unsupported)"
-                stats["skipped"] += 1
-                stats["skipped_details"].append({"url": url[:100], "reason": reason})
-                print(f"  Skipping: {reason} for {url[:80]}...", flush=True)
-                continue
-            elif file_type in CONVERT_TO_PDF_TYPES:
-                file_bytes = _convert_to_pdf(response.content, file_type)
-                if not file_bytes:
-                    reason = f"Failed to convert {file_type} to PDF"
-                    stats["skipped"] += 1
-                    stats["skipped_details"].append({"url": url[:100], "reason": reason})
-                    print(f"  Skipping: {reason} for {url[:80]}...", flush=True)
-                    continue
-                upload_suffix = ".pdf"
-                print(f"  Converted {file_type} to PDF ({len(file_bytes)} bytes)", flush=True)
-            else:
-                reason = f"Unsupported file type: {file_type}"
-                stats["skipped"] += 1
-                stats["skipped_details"].append({"url": url[:100], "reason": reason})
-                print(f"  Skipping: {reason} for {url[:80]}...", flush=True)
+    if not urls:
+        return documents, stats
+
+    results = [None] * len(urls)
+    first_by_url = {}
+    for i, url in enumerate(urls):
+        owner = first_by_url.setdefault(_normalize_attachment_url(url), i)
+        if owner != i:
+            results[i] = {"duplicate_of": owner, "match": "url"}
+    pending = [i for i in range(len(urls)) if results[i] is None]
+
+    # Attachments move through the download/convert/upload stages in parallel;
+    # the per-stage semaphores bound how much of each stage runs at once.
+    claims = _ContentClaims()
+    max_workers = min(len(pending), ATTACHMENT_DOWNLOAD_CONCURRENCY + ATTACHMENT_UPLOAD_CONCURRENCY)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_process_attachment, urls[i], i, claims): i for i in pending}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+    claims.settle(results)
+
+    # First pass: number the unique documents in URL order. Different bytes
+    # can still produce the same model input (same extracted text, or a
+    # converted file already uploaded), so outputs are de-duplicated too.
+    document_index_of = {}
+    index_by_sha = {}
+    for i, (url, result) in enumerate(zip(urls, results)):
+        if result.get("download_cache") == "hit":
+            stats["download_cache"]["hits"] += 1
+        elif result.get("download_cache") == "miss":
+            stats["download_cache"]["misses"] += 1
+        if "file_input" not in result:
+            continue
+        if result["sha256"] in index_by_sha:
+            results[i] = {"duplicate_of": index_by_sha[result["sha256"]], "match": "content"}
+            continue
+        document = {"url": url, "sha256": result["sha256"], "file_input": result["file_input"]}
+        if result.get("chunks"):
+            document["chunks"] = result["chunks"]
+        documents.append(document)
+        document_index_of[i] = len(documents)
+        index_by_sha[result["sha256"]] = i
+        stats["uploaded"] += 1
+        # Sampled sheets are still analyzed, but the caller should know
+        # the model only saw part of them.
+        for warning in result.get("warnings", []):
+            stats["skipped_details"].append({"url": url[:100], "reason": warning, "partial": True})
+
+    # Second pass: link duplicates to the document they repeat, or report
+    # them with the skip reason of the attachment they repeat.
+    for i, (url, result) in enumerate(zip(urls, results)):
+        if "duplicate_of" in result:
+            owner = result["duplicate_of"]
+            while "duplicate_of" in results[owner]:
+                owner = results[owner]["duplicate_of"]
+            if owner in document_index_of:
+                stats["duplicates"].append({
+                    "url": url[:100],
+                    "duplicate_of_url": urls[owner][:100],
+                    "duplicate_of_document_index": document_index_of[owner],
+                    "match": result.get("match", "content"),
+                })
                 continue
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=upload_suffix) as tmp:
-                tmp.write(file_bytes)
-                tmp_path = tmp.name
-
-            with open(tmp_path, "rb") as f:
-                upload = openai_client.files.create(
-                    file=f,
-                    purpose="user_data"
-                )
-
-            uploaded_files.append({
-                "type": "input_file",
-                "file_id": upload.id
-            })
-            stats["uploaded"] += 1
-
-        except Exception as e:
-            reason = str(e)
+            result = {"skip_reason": f"Duplicate of skipped attachment: {results[owner].get('skip_reason')}"}
+        if "file_input" not in result:
             stats["skipped"] += 1
-            stats["skipped_details"].append({"url": url[:100], "reason": reason})
-            print(f"Error downloading or uploading file from {url}: {e}", flush=True)
-        finally:
-            if tmp_path:
-                try:
-                    os.unlink(tmp_path)
-                except Exception as del_err:
-                    print(f"Warning: Could not delete temp file {tmp_path}: {del_err}", flush=True)
-    return uploaded_files, stats
+            stats["skipped_details"].append({"url": url[:100], "reason": result["skip_reason"]})
+            if on_event:
+                on_event("skipped", {"url": url[:100], "reason": result["skip_reason"]})
+    return documents, stats
 
 
 # Prompt for extracting key info from a single document
@@ -563,166 +866,391 @@ Merge rules:
 Input data (list of per-document JSONs):
 """
 
-
-def _is_rate_limit_error(e):
-    """Check if exception is a 429 rate limit error — these should be retried"""
-    err_str = str(e).lower()
-    return "429" in str(e) or "rate_limit" in err_str or "rate limit" in err_str
+# Used when fields were pre-merged locally: only the conflicting values of one
+# schema section are sent, so the model sees a fraction of the extractions.
+CONFLICT_MERGE_PROMPT = """
+Several solicitation documents gave different values for the fields below. Each field lists the candidate values with the document they came from.
+Resolve each field to a single value:
+- For identifiers, dates and yes/no fields: pick the value best supported by the documents; prefer values from amendments (later documents) when they supersede earlier ones.
+- For narrative/summary fields: synthesize the candidates into one clear, comprehensive value.
+Return ONLY a valid JSON object whose keys are exactly the field names given, each mapped to its resolved value. No explanation, no markdown, no extra text.
+
+Section: {section}
+Conflicting fields:
+"""
 
 
-def _is_retryable_error(e):
-    """For final summary only: retry on both 429 and 500"""
-    err_str = str(e).lower()
-    return (
-        "429" in str(e) or "rate_limit" in err_str or "rate limit" in err_str
-        or "500" in str(e) or "server_error" in err_str
-    )
+EXTRACTION_MODEL = "gpt-4o-mini"  # Use mini for individual doc extraction (cheaper & faster)
+EXTRACTION_PROMPT_HASH = hashlib.sha256(EXTRACTION_PROMPT.encode("utf-8")).hexdigest()[:16]
+
+# Parsed per-document extractions keyed by (document hash, model, prompt hash),
+# so re-running an analysis only pays for documents or prompts that changed.
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+extraction_cache = SqliteCache(
+    "extraction_cache.db",
+    table="extractions",
+    ttl_seconds=int(os.getenv("EXTRACTION_CACHE_TTL_HOURS", "336")) * 3600,
+    max_entries=int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "20000")),
+)
+
+
+def _extraction_cache_key(content_hash):
+    return f"{content_hash}:{EXTRACTION_MODEL}:{EXTRACTION_PROMPT_HASH}"
+
+
+SUMMARY_MODEL = "gpt-4o"  # Use full model for final synthesis
+SUMMARY_PROMPT_HASH = hashlib.sha256(
+    (FINAL_SUMMARY_PROMPT + CONFLICT_MERGE_PROMPT).encode("utf-8")).hexdigest()[:16]
+# Documents are extracted concurrently; the shared per-model limiter keeps the
+# aggregate request rate inside the quota OpenAI reports.
+EXTRACTION_CONCURRENCY = int(os.getenv("EXTRACTION_CONCURRENCY", "4"))
+# Larger document sets are summarized as a tree: groups of at most
+# SUMMARY_MERGE_GROUP_SIZE extractions are merged concurrently, then the
+# partial merges are merged again, so latency grows with log(documents).
+SUMMARY_MERGE_GROUP_SIZE = max(2, int(os.getenv("SUMMARY_MERGE_GROUP_SIZE", "6")))
+SUMMARY_MERGE_CONCURRENCY = int(os.getenv("SUMMARY_MERGE_CONCURRENCY", "4"))
+# Page-range chunks of one long PDF are extracted concurrently, on top of
+# EXTRACTION_CONCURRENCY documents; the rate limiter caps the total.
+PDF_CHUNK_CONCURRENCY = int(os.getenv("PDF_CHUNK_CONCURRENCY", "4"))
+# Resolve agreeing fields and list fields locally and only ask the model about
+# conflicting values. SUMMARY_LOCAL_PREMERGE=false sends whole extractions.
+SUMMARY_LOCAL_PREMERGE = os.getenv("SUMMARY_LOCAL_PREMERGE", "true").lower() == "true"
+EXTRACTION_SCHEMA = schema_from_prompt(EXTRACTION_PROMPT)
+# Extractions and merged summaries share the prompt's template. Its scalar
+# fields may hold any JSON type, so it is enforced locally (json_object mode).
+register_schema("solicitation_extraction", template_schema(EXTRACTION_SCHEMA), strict=False)
+
+
+def analyze_single_document(file_input, content_hash=None):
+    """
+    Analyze a single document and extract key information.
 
+    When content_hash (SHA-256 of the uploaded bytes or inline text) is given, successful
+    extractions are served from and stored in the extraction cache.
+    """
+    cache_key = _extraction_cache_key(content_hash) if content_hash and EXTRACTION_CACHE_ENABLED else None
+    if cache_key:
+        try:
+            cached = extraction_cache.get(cache_key)
+        except Exception as e:
+            print(f"  Extraction cache lookup failed: {e}", flush=True)
+            cached = None
+        if cached is not None:
+            print(f"  Extraction cache hit for document {content_hash[:12]}", flush=True)
+            return cached
 
-def analyze_single_document(file_input):
-    """Analyze a single document and extract key information"""
-    max_retries = 4
-    backoff_secs = [2, 5, 10, 20]
+    try:
+        extracted = llm_gateway.responses_json(
+            "extraction.document",
+            "solicitation_extraction",
+            model=EXTRACTION_MODEL,
+            input=[
+                {
+                    "role": "user",
+                    "content": [
+                        file_input,
+                        {"type": "input_text", "text": EXTRACTION_PROMPT}
+                    ]
+                }
+            ]
+        )
+    except StructuredOutputError as e:
+        print(f"  Extraction reply could not be repaired: {e}", flush=True)
+        return {"raw_text": e.raw}
+    except Exception as e:
+        print(f"  Extraction failed after retries, skipping document: {e}", flush=True)
+        return {"error": str(e)}
 
-    for attempt in range(max_retries):
+    if cache_key and isinstance(extracted, dict):
         try:
-            response = openai_client.responses.create(
-                model="gpt-4o-mini",  # Use mini for individual doc extraction (cheaper & faster)
-                input=[
-                    {
-                        "role": "user",
-                        "content": [
-                            file_input,
-                            {"type": "input_text", "text": EXTRACTION_PROMPT}
-                        ]
-                    }
-                ]
-            )
-            raw_output = response.output_text
-            # Try to parse JSON
-            try:
-                # Clean up the response - remove markdown code blocks if present
-                cleaned = raw_output.strip()
-                if cleaned.startswith("```json"):
-                    cleaned = cleaned[7:]
-                if cleaned.startswith("```"):
-                    cleaned = cleaned[3:]
-                if cleaned.endswith("```"):
-                    cleaned = cleaned[:-3]
-                return json.loads(cleaned.strip())
-            except Exception:
-                return {"raw_text": raw_output}
+            extraction_cache.set(cache_key, extracted)
         except Exception as e:
-            if _is_rate_limit_error(e) and attempt < max_retries - 1:
-                wait = backoff_secs[attempt]
-                print(f"  Rate limit hit, retrying in {wait}s (attempt {attempt + 1}/{max_retries})...", flush=True)
-                time.sleep(wait)
-            else:
-                if not _is_rate_limit_error(e):
-                    print(f"  Server error on document, skipping: {e}", flush=True)
-                else:
-                    print(f"  Rate limit exhausted, skipping document: {e}", flush=True)
-                return {"error": str(e)}
+            print(f"  Extraction cache write failed: {e}", flush=True)
+    return extracted
+
+
+def analyze_document(document):
+    """
+    Extract one document. Long PDFs split into chunks are extracted chunk by
+    chunk in parallel and merged back into one extraction with the same
+    schema. A chunk that fails is retried on its own; if some chunks still
+    fail, the rest are used and the failed page ranges are listed under
+    "chunk_errors".
+    """
+    chunks = document.get("chunks")
+    if not chunks:
+        return analyze_single_document(document["file_input"], document["sha256"])
+
+    def extract_chunk(chunk):
+        return analyze_single_document(chunk["file_input"], chunk["sha256"])
+
+    def failed(result):
+        return "error" in result or "raw_text" in result
+
+    results = [None] * len(chunks)
+    pending = list(range(len(chunks)))
+    for attempt in range(2):
+        with ThreadPoolExecutor(max_workers=min(len(pending), PDF_CHUNK_CONCURRENCY)) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, extract_chunk, chunks[c]) for c in pending]
+            for c, future in zip(pending, futures):
+                results[c] = future.result()
+        pending = [c for c in pending if failed(results[c])]
+        if not pending:
+            break
+        if attempt == 0:
+            print(f"  Retrying {len(pending)} failed chunk(s): pages {', '.join(chunks[c]['pages'] for c in pending)}", flush=True)
+
+    succeeded = [results[c] for c in range(len(chunks)) if not failed(results[c])]
+    if not succeeded:
+        return {"error": f"All {len(chunks)} chunks failed: {results[0].get('error', 'unparseable output')}"}
+
+    merged, conflicts, _, _ = merge_extractions(succeeded, EXTRACTION_SCHEMA)
+    merged = resolve_conflicts_locally(merged, conflicts)
+    if pending:
+        merged["chunk_errors"] = [
+            {"pages": chunks[c]["pages"], "error": results[c].get("error", "unparseable output")} for c in pending
+        ]
+    print(f"  Merged {len(succeeded)}/{len(chunks)} chunk extraction(s)", flush=True)
+    return merged
+
+
+def _merge_with_model(items, label="create_final_summary"):
+    """Merge a list of extraction JSONs with one SUMMARY_MODEL call."""
+    # Compact separators: indentation only costs input tokens.
+    return _summary_completion(FINAL_SUMMARY_PROMPT + json.dumps(items, separators=(",", ":")), label)
+
+
+def _summary_completion(content, label, schema="solicitation_extraction", call_site="summary.merge"):
+    """
+    Send one prompt to SUMMARY_MODEL in structured-output mode and return the
+    parsed reply, or {"error", ...}. The gateway retries 429/5xx; malformed
+    replies are repaired rather than re-run.
+    """
+    try:
+        return llm_gateway.chat_json(
+            call_site,
+            schema,
+            model=SUMMARY_MODEL,
+            messages=[
+                {
+                    "role": "user",
+                    "content": content
+                }
+            ],
+            max_tokens=16000,
+            temperature=0.1
+        )
+    except StructuredOutputError as e:
+        preview = (e.raw[:500] + "...") if e.raw and len(e.raw) > 500 else e.raw
+        print(f"[{label}] Unrepairable reply: {e}", flush=True)
+        print(f"[{label}] Raw output preview: {preview}", flush=True)
+        return {"error": f"Invalid JSON from model: {e}", "raw_output_preview": preview}
+    except Exception as e:
+        import traceback
+        print(f"[{label}] Exception: {e}", flush=True)
+        print(f"[{label}] Traceback: {traceback.format_exc()}", flush=True)
+        return {"error": str(e)}
 
 
 def create_final_summary(extracted_data_list):
-    """Combine extracted data from all documents into final summary"""
-    raw_output = None
-    max_retries = 4
-    backoff_secs = [2, 5, 10, 20]
+    """
+    Combine extracted data from all documents into final summary.
 
-    for attempt in range(max_retries):
-        try:
-            combined_data = json.dumps(extracted_data_list, indent=2)
-
-            response = openai_client.chat.completions.create(
-                model="gpt-4o",  # Use full model for final synthesis
-                messages=[
-                    {
-                        "role": "user",
-                        "content": FINAL_SUMMARY_PROMPT + combined_data
-                    }
-                ],
-                max_tokens=16000,
-                temperature=0.1
-            )
-
-            raw_output = response.choices[0].message.content
-            # Clean and parse
-            cleaned = raw_output.strip()
-            if cleaned.startswith("```json"):
-                cleaned = cleaned[7:]
-            if cleaned.startswith("```"):
-                cleaned = cleaned[3:]
-            if cleaned.endswith("```"):
-                cleaned = cleaned[:-3]
-            return json.loads(cleaned.strip())
-        except json.JSONDecodeError as e:
-            preview = (raw_output[:500] + "...") if raw_output and len(raw_output) > 500 else raw_output
-            print(f"[create_final_summary] JSONDecodeError: {e}", flush=True)
-            print(f"[create_final_summary] Raw output preview: {preview}", flush=True)
-            return {"error": f"Invalid JSON from model: {e}", "raw_output_preview": preview}
-        except Exception as e:
-            if _is_retryable_error(e) and attempt < max_retries - 1:
-                wait = backoff_secs[attempt]
-                print(f"[create_final_summary] Retryable error (429/500), retrying in {wait}s (attempt {attempt + 1}/{max_retries})...", flush=True)
-                time.sleep(wait)
+    With SUMMARY_LOCAL_PREMERGE, fields are merged locally first and only
+    conflicting values go to the model, one call per schema section. The
+    result carries a field_provenance map of which documents each field came
+    from. Otherwise, or when some extraction is unstructured, the whole
+    extractions are merged by the model (see _tree_merge_summary).
+    """
+    if not SUMMARY_LOCAL_PREMERGE:
+        return _tree_merge_summary(extracted_data_list)
+
+    merged, conflicts, provenance, unstructured = merge_extractions(extracted_data_list, EXTRACTION_SCHEMA)
+    if unstructured:
+        print(f"[create_final_summary] {len(unstructured)} unstructured extraction(s); merging everything with the model", flush=True)
+        summary = _tree_merge_summary(extracted_data_list)
+        if "error" not in summary:
+            for entry in provenance.values():
+                entry["resolved"] = "model"
+            summary["field_provenance"] = provenance
+        return summary
+
+    conflict_count = sum(len(fields) for fields in conflicts.values())
+    full_size = len(json.dumps(extracted_data_list, separators=(",", ":")))
+    conflict_size = len(json.dumps(conflicts, separators=(",", ":")))
+    print(f"[create_final_summary] Local pre-merge: {len(provenance) - conflict_count}/{len(provenance)} fields resolved locally, "
+          f"{conflict_count} conflicting field(s) in {len(conflicts)} section(s) "
+          f"({conflict_size} of {full_size} chars sent to the model)", flush=True)
+
+    resolutions = {}
+    if conflicts:
+        sections = list(conflicts)
+        with ThreadPoolExecutor(max_workers=min(len(sections), SUMMARY_MERGE_CONCURRENCY)) as executor:
+            futures = {
+                executor.submit(
+                    contextvars.copy_context().run,
+                    _summary_completion,
+                    CONFLICT_MERGE_PROMPT.replace("{section}", section)
+                    + json.dumps(conflicts[section], separators=(",", ":")),
+                    f"create_final_summary {section}",
+                    "field_resolutions",
+                    "summary.conflicts",
+                ): section
+                for section in sections
+            }
+            for future in as_completed(futures):
+                section = futures[future]
+                result = future.result()
+                if "error" in result:
+                    print(f"[create_final_summary] Conflict resolution failed for {section}: {result['error']}", flush=True)
+                    continue
+                resolutions[section] = result
+
+    summary = apply_resolutions(merged, conflicts, provenance, resolutions)
+    summary["field_provenance"] = provenance
+    return summary
+
+
+def _tree_merge_summary(extracted_data_list):
+    """
+    Merge whole extractions with the model.
+
+    Up to SUMMARY_MERGE_GROUP_SIZE extractions are merged in a single call.
+    Larger sets are merged as a tree: contiguous groups are merged
+    concurrently, then the partial merges are grouped and merged again until
+    one remains. A group that still fails after its retries is carried up to
+    the next level unmerged, so one bad group does not discard the others.
+    """
+    level = list(extracted_data_list)
+    depth = 0
+    while len(level) > SUMMARY_MERGE_GROUP_SIZE:
+        depth += 1
+        groups = [level[i:i + SUMMARY_MERGE_GROUP_SIZE] for i in range(0, len(level), SUMMARY_MERGE_GROUP_SIZE)]
+        print(f"[create_final_summary] Tree level {depth}: merging {len(level)} item(s) in {len(groups)} group(s)", flush=True)
+
+        merged = [None] * len(groups)
+        with ThreadPoolExecutor(max_workers=min(len(groups), SUMMARY_MERGE_CONCURRENCY)) as executor:
+            futures = {
+                executor.submit(contextvars.copy_context().run, _merge_with_model, group,
+                                f"create_final_summary L{depth}G{g + 1}"): g
+                for g, group in enumerate(groups)
+            }
+            for future in as_completed(futures):
+                merged[futures[future]] = future.result()
+
+        next_level = []
+        for group, result in zip(groups, merged):
+            if "error" in result:
+                print(f"[create_final_summary] Group merge failed ({result['error']}); carrying {len(group)} item(s) up", flush=True)
+                next_level.extend(group)
             else:
-                import traceback
-                print(f"[create_final_summary] Exception: {e}", flush=True)
-                print(f"[create_final_summary] Traceback: {traceback.format_exc()}", flush=True)
-                return {"error": str(e)}
+                next_level.append(result)
+        if len(next_level) >= len(level):
+            return {"error": f"Summary merge made no progress at tree level {depth}: every group failed"}
+        level = next_level
+
+    return _merge_with_model(level)
+
+
+def _processing_stats(upload_stats, documents_analyzed, documents_in_summary):
+    return {
+        "documents_requested": upload_stats["requested"],
+        "documents_uploaded": upload_stats["uploaded"],
+        "documents_skipped": upload_stats["skipped"],
+        "documents_analyzed": documents_analyzed,
+        "documents_in_summary": documents_in_summary,
+        "documents_duplicate": len(upload_stats["duplicates"]),
+        "duplicates": upload_stats["duplicates"],
+        "skipped_details": upload_stats["skipped_details"],
+        "download_cache": upload_stats["download_cache"],
+    }
 
 
-@app.route("/analyze-solicitations", methods=["POST"])
-def analyze_solicitations():
-    data = request.get_json()
-    urls = data.get("urls")
+def run_solicitation_analysis(urls, on_event=None, solicitation_number=None, refresh=False):
+    """
+    Run the download -> per-document extraction -> final summary pipeline.
 
-    if not urls or not isinstance(urls, list):
-        return jsonify({"error": "Missing or invalid 'urls' array."}), 400
+    A document set that was summarized before is answered from the summary
+    store without model calls, unless refresh is set. Complete summaries are
+    stored under solicitation_number (or the extracted one).
+
+    on_event(event, data) is called from the calling thread as the pipeline
+    progresses: "phase" ({"phase"}), "skipped" ({"url", "reason"}),
+    "uploaded" ({"stats", "documents"}), "document" ({"document_index",
+    "status", "data"}) and "summary" ({"status"}).
+
+    Returns (payload, http_status) where payload is the /analyze-solicitations response body.
+    """
+    with track_degraded() as degraded_answers:
+        return _run_solicitation_analysis(urls, on_event, solicitation_number, refresh, degraded_answers)
+
+
+def _run_solicitation_analysis(urls, on_event, solicitation_number, refresh, degraded_answers):
+    def emit(event, data):
+        if on_event:
+            on_event(event, data)
 
     print(f"[analyze-solicitations] Documents requested: {len(urls)}", flush=True)
 
     # Upload files to OpenAI
-    file_inputs, upload_stats = download_and_upload_files(urls)
+    emit("phase", {"phase": "upload"})
+    documents, upload_stats = download_and_upload_files(urls, on_event=on_event)
+    emit("uploaded", {"stats": upload_stats, "documents": len(documents)})
 
     # Log upload stats
     print(f"[analyze-solicitations] Upload phase: requested={upload_stats['requested']}, "
           f"uploaded={upload_stats['uploaded']}, skipped={upload_stats['skipped']}", flush=True)
     if upload_stats["skipped_details"]:
         for d in upload_stats["skipped_details"]:
-            print(f"  - Skipped: {d['reason']} | {d['url']}...", flush=True)
+            label = "Sampled" if d.get("partial") else "Skipped"
+            print(f"  - {label}: {d['reason']} | {d['url']}...", flush=True)
 
-    if not file_inputs:
-        return jsonify({
+    if not documents:
+        return {
             "error": "Failed to upload any files.",
-            "processing_stats": {
-                "documents_requested": upload_stats["requested"],
-                "documents_uploaded": 0,
-                "documents_skipped": upload_stats["skipped"],
-                "documents_analyzed": 0,
-                "documents_in_summary": 0,
-                "skipped_details": upload_stats["skipped_details"],
-            }
-        }), 500
+            "processing_stats": _processing_stats(upload_stats, 0, 0),
+        }, 500
+
+    if SUMMARY_STORE_ENABLED and not refresh:
+        stored, record = find_stored_summary(documents)
+        if stored is not None:
+            stored["processing_stats"] = _processing_stats(upload_stats, len(documents), len(documents))
+            stored["processing_stats"].update(summary_id=record.id, summary_from_store=True)
+            emit("summary", {"status": "completed"})
+            print(f"[analyze-solicitations] Done. Summary {record.id} served from the summary store, "
+                  f"no model calls.", flush=True)
+            return stored, 200
 
     # Step 1: Process each document separately to extract key info
-    print(f"[analyze-solicitations] Step 1: Extracting key information from {len(file_inputs)} document(s)...", flush=True)
-    extracted_data = []
-    for i, file_input in enumerate(file_inputs):
-        if i > 0:
-            time.sleep(3)  # Delay between documents to avoid rate limits
-        print(f"  Processing document {i+1}/{len(file_inputs)}...", flush=True)
-        doc_data = analyze_single_document(file_input)
+    emit("phase", {"phase": "extraction"})
+    print(f"[analyze-solicitations] Step 1: Extracting key information from {len(documents)} document(s)...", flush=True)
+
+    def extract(i, document):
+        print(f"  Processing document {i+1}/{len(documents)}...", flush=True)
+        doc_data = analyze_document(document)
         doc_data["document_index"] = i + 1
-        extracted_data.append(doc_data)
+        return doc_data
+
+    extracted_data = [None] * len(documents)
+    with ThreadPoolExecutor(max_workers=min(len(documents), EXTRACTION_CONCURRENCY)) as executor:
+        futures = {executor.submit(contextvars.copy_context().run, extract, i, document): i
+                   for i, document in enumerate(documents)}
+        # Report each document as soon as it finishes, from this thread.
+        for future in as_completed(futures):
+            i = futures[future]
+            doc_data = future.result()
+            extracted_data[i] = doc_data
+            emit("document", {
+                "document_index": i + 1,
+                "status": "failed" if "error" in doc_data else "analyzed",
+                "data": doc_data,
+            })
 
     # Filter out documents that failed to analyze
     successful_data = [d for d in extracted_data if "error" not in d]
     failed_count = len(extracted_data) - len(successful_data)
 
-    print(f"[analyze-solicitations] Extraction phase: analyzed={len(successful_data)}/{len(file_inputs)}, "
+    print(f"[analyze-solicitations] Extraction phase: analyzed={len(successful_data)}/{len(documents)}, "
           f"failed={failed_count}", flush=True)
     if failed_count > 0:
         for i, d in enumerate(extracted_data):
@@ -730,47 +1258,253 @@ def analyze_solicitations():
                 print(f"  - Document {i+1} failed: {d.get('error', 'unknown')}", flush=True)
 
     if not successful_data:
-        return jsonify({
+        return {
             "error": "All documents failed to analyze.",
-            "processing_stats": {
-                "documents_requested": upload_stats["requested"],
-                "documents_uploaded": upload_stats["uploaded"],
-                "documents_skipped": upload_stats["skipped"],
-                "documents_analyzed": 0,
-                "documents_in_summary": 0,
-                "skipped_details": upload_stats["skipped_details"],
-            }
-        }), 500
+            "processing_stats": _processing_stats(upload_stats, 0, 0),
+        }, 500
 
     # Step 2: Combine all extracted data into final summary
+    emit("phase", {"phase": "summary"})
     print(f"[analyze-solicitations] Step 2: Creating final summary from {len(successful_data)} document(s)...", flush=True)
     try:
         final_summary = create_final_summary(successful_data)
-        processing_stats = {
-            "documents_requested": upload_stats["requested"],
-            "documents_uploaded": upload_stats["uploaded"],
-            "documents_skipped": upload_stats["skipped"],
-            "documents_analyzed": len(successful_data),
-            "documents_in_summary": len(successful_data),
-            "skipped_details": upload_stats["skipped_details"],
-        }
-        final_summary["processing_stats"] = processing_stats
+        final_summary["processing_stats"] = _processing_stats(upload_stats, len(successful_data), len(successful_data))
+        # Calls of this run answered by a fallback model or from the fallback
+        # cache mark it degraded.
+        degraded = any(degraded_answers.values())
+        if degraded:
+            final_summary["processing_stats"]["degraded"] = True
+        # Only complete, non-degraded summaries are stored; any other would be
+        # served for this document set until it changed.
+        if SUMMARY_STORE_ENABLED and failed_count == 0 and not degraded and "error" not in final_summary:
+            record = save_summary(final_summary, documents, solicitation_number)
+            if record:
+                final_summary["processing_stats"]["summary_id"] = record.id
+        emit("summary", {"status": "failed" if "error" in final_summary else "completed"})
         print(f"[analyze-solicitations] Done. Summary generated from {len(successful_data)}/{upload_stats['requested']} "
               f"requested documents.", flush=True)
-        return jsonify(final_summary)
+        return final_summary, 200
     except Exception as e:
-        return jsonify({
+        emit("summary", {"status": "failed"})
+        return {
             "error": str(e),
             "extracted_data": extracted_data,
-            "processing_stats": {
-                "documents_requested": upload_stats["requested"],
-                "documents_uploaded": upload_stats["uploaded"],
-                "documents_skipped": upload_stats["skipped"],
-                "documents_analyzed": len(successful_data),
-                "documents_in_summary": 0,
-                "skipped_details": upload_stats["skipped_details"],
-            }
-        }), 500
+            "processing_stats": _processing_stats(upload_stats, len(successful_data), 0),
+        }, 500
+
+
+@app.route("/analyze-solicitations", methods=["POST"])
+def analyze_solicitations():
+    data = request.get_json()
+    urls = data.get("urls")
+
+    if not urls or not isinstance(urls, list):
+        return jsonify({"error": "Missing or invalid 'urls' array."}), 400
+
+    payload, status = run_solicitation_analysis(
+        urls, solicitation_number=data.get("solicitation_number"), refresh=bool(data.get("refresh")))
+    return jsonify(payload), status
+
+
+STREAM_HEARTBEAT_SECONDS = 15
+
+
+@app.route("/analyze-solicitations/stream", methods=["POST"])
+def analyze_solicitations_stream():
+    """
+    Streaming variant of /analyze-solicitations.
+
+    Emits each document's extraction as soon as it finishes, skip events as
+    they happen, then the final summary. NDJSON by default; Server-Sent
+    Events when the client sends Accept: text/event-stream or ?format=sse.
+    Every message carries an "event" field; the last one is "result" with the
+    same body and status the synchronous route would have returned.
+    """
+    data = request.get_json()
+    urls = data.get("urls")
+
+    if not urls or not isinstance(urls, list):
+        return jsonify({"error": "Missing or invalid 'urls' array."}), 400
+
+    solicitation_number = data.get("solicitation_number")
+    refresh = bool(data.get("refresh"))
+    use_sse = request.args.get("format") == "sse" or "text/event-stream" in request.headers.get("Accept", "")
+    events = queue.Queue()
+
+    def run():
+        with app.app_context():
+            try:
+                payload, status = run_solicitation_analysis(
+                    urls, on_event=lambda event, data: events.put((event, data)),
+                    solicitation_number=solicitation_number, refresh=refresh)
+            except Exception as e:
+                print(f"[analyze-solicitations/stream] Pipeline error: {e}", flush=True)
+                payload, status = {"error": str(e)}, 500
+            events.put(("result", {"status": status, "body": payload}))
+
+    threading.Thread(target=run, name="analyze-stream", daemon=True).start()
+
+    def format_event(event, data):
+        if use_sse:
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        return json.dumps({"event": event, **data}) + "\n"
+
+    def generate():
+        while True:
+            try:
+                event, data = events.get(timeout=STREAM_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                # Keep proxies from closing an idle connection during long phases.
+                yield ": keepalive\n\n" if use_sse else json.dumps({"event": "heartbeat"}) + "\n"
+                continue
+            yield format_event(event, data)
+            if event == "result":
+                return
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream" if use_sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Stored summaries, keyed by solicitation number and document-set hash
+init_solicitation_summaries_db(db, f"{EXTRACTION_MODEL}:{EXTRACTION_PROMPT_HASH}:{SUMMARY_MODEL}:{SUMMARY_PROMPT_HASH}")
+app.register_blueprint(summaries_bp)
+from solicitation_summaries import SolicitationSummary
+
+# Asynchronous job mode for /analyze-solicitations
+init_analysis_jobs_db(db, run_solicitation_analysis, app.app_context)
+app.register_blueprint(analysis_jobs_bp)
+
+# Offline bulk queue, run by the same pipeline stages
+init_bulk_analysis_db(db, app.app_context, download_and_upload_files, analyze_document,
+                      create_final_summary, _processing_stats)
+app.register_blueprint(bulk_bp)
+
+
+def _require_admin_key():
+    """Return an error response unless the request carries ADMIN_API_KEY (when one is configured)."""
+    admin_key = os.getenv("ADMIN_API_KEY")
+    if admin_key and request.headers.get("X-Admin-Key") != admin_key:
+        return jsonify({"error": "Unauthorized"}), 401
+    return None
+
+
+@app.route("/api/admin/extraction-cache", methods=["GET"])
+def extraction_cache_stats():
+    """Get extraction cache size and configuration"""
+    denied = _require_admin_key()
+    if denied:
+        return denied
+    return jsonify({
+        "enabled": EXTRACTION_CACHE_ENABLED,
+        "model": EXTRACTION_MODEL,
+        "prompt_hash": EXTRACTION_PROMPT_HASH,
+        **extraction_cache.stats(),
+    })
+
+
+@app.route("/api/admin/extraction-cache/invalidate", methods=["POST"])
+def invalidate_extraction_cache():
+    """
+    Invalidate cached extractions.
+    Body: {"document_hash": "<sha256>"} to drop one document, or {} to drop everything.
+    """
+    denied = _require_admin_key()
+    if denied:
+        return denied
+    data = request.get_json(silent=True) or {}
+    document_hash = data.get("document_hash")
+    try:
+        removed = extraction_cache.clear(prefix=f"{document_hash}:" if document_hash else None)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    print(f"[extraction-cache] Invalidated {removed} entr{'y' if removed == 1 else 'ies'}"
+          f"{' for ' + document_hash[:12] if document_hash else ''}", flush=True)
+    return jsonify({"success": True, "removed": removed})
+
+
+@app.route("/api/admin/http-cache", methods=["GET"])
+def http_cache_stats():
+    """Get attachment download cache size"""
+    denied = _require_admin_key()
+    if denied:
+        return denied
+    return jsonify({"enabled": HTTP_CACHE_ENABLED, **http_cache.stats()})
+
+
+@app.route("/api/admin/llm-gateway", methods=["GET"])
+def llm_gateway_stats():
+    """Get per-call-site LLM latency, token, error and parse-repair counts, concurrency and rate limiter state"""
+    denied = _require_admin_key()
+    if denied:
+        return denied
+    return jsonify({
+        **llm_gateway.metrics(),
+        "rate_limiters": get_limiter_status(),
+        "model_router": model_router.status(),
+        "structured_outputs": get_schema_stats(),
+        "prompt_budgets": get_budget_stats(),
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+def llm_metrics_endpoint():
+    """LLM call counters and histograms per call site and model, in Prometheus text format"""
+    denied = _require_admin_key()
+    if denied:
+        return denied
+    return Response(llm_metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/api/admin/llm-calls", methods=["GET"])
+def llm_call_history():
+    """
+    Aggregate the rolling LLM call table.
+    Query params: hours (default 24), call_site
+    """
+    denied = _require_admin_key()
+    if denied:
+        return denied
+    try:
+        return jsonify({
+            "hours": request.args.get("hours", 24, type=float),
+            "call_sites": llm_metrics.query_calls(request.args.get("hours", 24, type=float),
+                                                  request.args.get("call_site")),
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/admin/http-pool", methods=["GET"])
+def http_pool_stats():
+    """Get outbound connection pool metrics per host"""
+    denied = _require_admin_key()
+    if denied:
+        return denied
+    return jsonify(get_pool_metrics())
+
+
+@app.route("/api/admin/conversion-pool", methods=["GET"])
+def conversion_pool_stats():
+    """Get conversion worker pool counters (completed, timeouts, memory kills, recycled workers)"""
+    denied = _require_admin_key()
+    if denied:
+        return denied
+    return jsonify(get_conversion_pool().status())
+
+
+CHAT_MODEL = "gpt-4o"
+# Upper bound on the chat prompt (summary + history); keeps per-turn cost and
+# latency flat however long the conversation gets.
+CHAT_PROMPT_TOKEN_BUDGET = int(os.getenv("CHAT_PROMPT_TOKEN_BUDGET", "8000"))
+
+CHAT_SYSTEM_PROMPT = """You are a helpful government contracting assistant. You have access to the following contract summary information:
+
+{summary}
+
+Use this context to answer questions about the contract. Be helpful, accurate, and concise. If you don't know something or it's not in the provided context, say so."""
 
 
 @app.route("/message-chat", methods=["POST"])
@@ -783,32 +1517,52 @@ def message_chat():
     
     if not user_message:
         return jsonify({"error": "Missing 'userMessage' field."}), 400
-    
-    # Build conversation context
-    system_message = f"""You are a helpful government contracting assistant. You have access to the following contract summary information:
 
-{json.dumps(summary, indent=2) if summary else "No summary available."}
-
-Use this context to answer questions about the contract. Be helpful, accurate, and concise. If you don't know something or it's not in the provided context, say so."""
+    # Clients may send a stored summary's id or solicitation number instead of the summary itself
+    if not summary and (data.get("summaryId") or data.get("solicitationNumber")):
+        if data.get("summaryId"):
+            record = SolicitationSummary.query.get(data.get("summaryId"))
+        else:
+            record = latest_summary(data.get("solicitationNumber"))
+        if not record:
+            return jsonify({"error": "Stored summary not found."}), 404
+        summary = json.loads(record.summary)
+    
+    # Fit the summary and history to the route's token budget: the summary is
+    # sent compact, and old turns are condensed before the summary is cut.
+    budget = PromptBudget("chat.message", CHAT_PROMPT_TOKEN_BUDGET, model=CHAT_MODEL)
+    budget.fixed("instructions", CHAT_SYSTEM_PROMPT)
+    if summary:
+        budget.json("summary", summary, priority=1, min_tokens=CHAT_PROMPT_TOKEN_BUDGET // 2,
+                    drop_first=("processing_stats", "field_provenance"))
+    else:
+        budget.fixed("summary", "No summary available.")
+    budget.turns("history", [
+        {"role": "assistant" if msg.get("role") == "agent" else "user",
+         "label": "Assistant" if msg.get("role") == "agent" else "User",
+         "content": msg.get("content", "")}
+        for msg in chat_history
+    ], priority=2, min_tokens=CHAT_PROMPT_TOKEN_BUDGET // 4)
+    fitted = budget.fit()
 
     # Build messages array for OpenAI
-    messages = [{"role": "system", "content": system_message}]
-    
-    # Add chat history
-    for msg in chat_history:
-        role = "assistant" if msg.get("role") == "agent" else "user"
-        messages.append({"role": role, "content": msg.get("content", "")})
-    
+    messages = [{"role": "system", "content": CHAT_SYSTEM_PROMPT.replace("{summary}", fitted["summary"])}]
+    digest, turns = fitted["history"]
+    if digest:
+        messages.append({"role": "system", "content": digest})
+    messages.extend({"role": turn["role"], "content": turn["content"]} for turn in turns)
+
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
+        response = llm_gateway.chat(
+            "chat.message",
+            model=CHAT_MODEL,
             messages=messages,
             max_tokens=1000,
             temperature=0.7
         )
         
         assistant_message = response.choices[0].message.content
-        return jsonify({"message": assistant_message})
+        return jsonify({"message": assistant_message, "prompt_budget": budget.report})
     
     except Exception as e:
         print(f"Error in message-chat: {e}")
@@ -823,6 +1577,13 @@ if __name__ == "__main__":
         
         # Initialize background jobs
         init_background_jobs(db, Supplier, Message, NegotiationSession, app.app_context)
+
+        # Re-queue analysis jobs interrupted by a restart
+        resume_analysis_jobs()
+
+    # Bulk queue runner; interrupted items resume from their checkpoints
+    if os.getenv("BULK_RUNNER_ENABLED", "true").lower() == "true":
+        start_bulk_runner()
     
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 9000)), debug=True, use_reloader=False)
 
@@ -0,0 +1,609 @@
+"""
+Bulk Analysis Module
+Offline queue for analyzing many solicitations (e.g. a nightly batch of new
+postings). Items run the same download -> extract -> summarize pipeline as
+/analyze-solicitations at a configurable throughput ceiling, every stage is
+checkpointed in the database so a crashed run resumes where it stopped, and
+results are stored for later retrieval.
+
+Usage:
+    python bulk_analysis.py submit batch.json [--name NAME]
+    python bulk_analysis.py run [--until-empty]
+    python bulk_analysis.py status BATCH_ID
+    python bulk_analysis.py result ITEM_ID
+
+batch.json is a list of {"solicitation_number": ..., "urls": [...]} objects.
+Set OPENAI_BASE_URL (or pass --base-url) to run against a local stub of the
+OpenAI API instead of the real service.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Blueprint, request, jsonify
+from dotenv import load_dotenv
+
+from rate_limiter import AdaptiveRateLimiter
+from model_router import track_degraded
+from solicitation_summaries import SUMMARY_STORE_ENABLED, find_stored_summary, save_summary
+
+load_dotenv()
+
+# Create Blueprint
+bulk_bp = Blueprint('bulk_analysis', __name__, url_prefix='/api/bulk')
+
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", "2"))
+# Throughput ceiling: solicitations started per hour across all workers.
+BULK_MAX_PER_HOUR = float(os.getenv("BULK_MAX_PER_HOUR", "120"))
+BULK_MAX_ATTEMPTS = int(os.getenv("BULK_MAX_ATTEMPTS", "3"))
+BULK_LEASE_SECS = int(os.getenv("BULK_LEASE_SECS", "900"))
+BULK_POLL_SECS = float(os.getenv("BULK_POLL_SECS", "10"))
+BULK_EXTRACTION_CONCURRENCY = int(os.getenv("BULK_EXTRACTION_CONCURRENCY", "4"))
+
+# Database reference and pipeline stages (set by init function)
+db = None
+BulkBatch = None
+BulkItem = None
+app_context = None
+stages = {}
+_runner = None
+
+
+def init_bulk_analysis_db(database, context, upload, extract, summarize, processing_stats):
+    """
+    Initialize the bulk queue models and pipeline stages.
+
+    Args:
+        database: The app's SQLAlchemy instance
+        context: app.app_context, used to give worker threads an app context
+        upload: download_and_upload_files(urls) -> (documents, upload_stats)
+        extract: analyze_document(document) -> extraction dict
+        summarize: create_final_summary(extractions) -> summary dict
+        processing_stats: _processing_stats(upload_stats, analyzed, in_summary)
+    """
+    global db, app_context, stages
+    db = database
+    app_context = context
+    stages = {
+        'upload': upload,
+        'extract': extract,
+        'summarize': summarize,
+        'processing_stats': processing_stats,
+    }
+
+    class BulkBatchModel(db.Model):
+        __tablename__ = 'bulk_batches'
+
+        id = db.Column(db.String(36), primary_key=True)
+        name = db.Column(db.String(200), nullable=True)
+        item_count = db.Column(db.Integer, default=0)
+        created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    class BulkItemModel(db.Model):
+        __tablename__ = 'bulk_items'
+
+        id = db.Column(db.String(36), primary_key=True)
+        batch_id = db.Column(db.String(36), db.ForeignKey('bulk_batches.id'), nullable=False, index=True)
+        position = db.Column(db.Integer, default=0)
+        solicitation_number = db.Column(db.String(100), nullable=True, index=True)
+        urls = db.Column(db.Text, nullable=False)  # JSON list
+        status = db.Column(db.String(20), default='queued', index=True)  # queued, running, completed, failed
+        stage = db.Column(db.String(20), default='upload')  # upload, extraction, summary, done
+        attempts = db.Column(db.Integer, default=0)
+        # Checkpoints
+        documents = db.Column(db.Text, nullable=True)  # JSON: {"documents": [...], "upload_stats": {...}}
+        extractions = db.Column(db.Text, nullable=True)  # JSON list, null where not yet extracted
+        result = db.Column(db.Text, nullable=True)  # JSON: same body as /analyze-solicitations
+        http_status = db.Column(db.Integer, nullable=True)
+        error = db.Column(db.Text, nullable=True)
+        lease_owner = db.Column(db.String(100), nullable=True)
+        lease_expires_at = db.Column(db.DateTime, nullable=True)
+        created_at = db.Column(db.DateTime, default=datetime.utcnow)
+        started_at = db.Column(db.DateTime, nullable=True)
+        finished_at = db.Column(db.DateTime, nullable=True)
+        updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    globals()['BulkBatch'] = BulkBatchModel
+    globals()['BulkItem'] = BulkItemModel
+    return BulkBatchModel, BulkItemModel
+
+
+def submit_batch(solicitations, name=None):
+    """Queue a list of {"solicitation_number", "urls"} objects. Returns the batch."""
+    batch = BulkBatch(id=str(uuid.uuid4()), name=name, item_count=len(solicitations))
+    db.session.add(batch)
+    for position, solicitation in enumerate(solicitations):
+        db.session.add(BulkItem(
+            id=str(uuid.uuid4()),
+            batch_id=batch.id,
+            position=position,
+            solicitation_number=solicitation.get('solicitation_number'),
+            urls=json.dumps(solicitation['urls']),
+        ))
+    db.session.commit()
+    return batch
+
+
+def _validate_solicitations(solicitations):
+    if not isinstance(solicitations, list) or not solicitations:
+        return "Missing or invalid 'solicitations' array."
+    for i, solicitation in enumerate(solicitations):
+        if not isinstance(solicitation, dict):
+            return f"solicitations[{i}] must be an object."
+        urls = solicitation.get('urls')
+        if not urls or not isinstance(urls, list):
+            return f"solicitations[{i}] is missing a 'urls' array."
+    return None
+
+
+class BulkRunner:
+    """
+    Claims queued items and runs them on a worker pool.
+
+    Items are claimed with a lease so several processes (the web server and
+    a CLI run) can share one queue. A running item's lease is renewed in the
+    background; one left by a crashed process expires after BULK_LEASE_SECS
+    and the item resumes from its last checkpoint.
+    Starts are paced to BULK_MAX_PER_HOUR.
+    """
+
+    def __init__(self, workers=BULK_WORKERS, max_per_hour=BULK_MAX_PER_HOUR):
+        self.workers = max(1, workers)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.pacer = AdaptiveRateLimiter(requests_per_minute=max_per_hour / 60.0, burst=1)
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bulk-analysis')
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='bulk-runner', daemon=True)
+        self._thread.start()
+        print(f"[bulk-analysis] Runner started ({self.workers} worker(s), {BULK_MAX_PER_HOUR:g}/hour)", flush=True)
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, until_empty=False):
+        """Claim and run items until stopped (or, with until_empty, until the queue drains)."""
+        while not self._stop.is_set():
+            self._slots.acquire()
+            with app_context():
+                item_id = self._claim_next()
+            if item_id is None:
+                self._slots.release()
+                if until_empty:
+                    # Wait for in-flight items; they may be re-queued for another attempt.
+                    for _ in range(self.workers):
+                        self._slots.acquire()
+                    for _ in range(self.workers):
+                        self._slots.release()
+                    with app_context():
+                        if not self._has_pending():
+                            break
+                    # Pending items are leased by another process (or just re-queued).
+                    self._stop.wait(1.0)
+                    continue
+                self._stop.wait(BULK_POLL_SECS)
+                continue
+            self._executor.submit(self._run_item, item_id)
+            self.pacer.acquire()
+        self._executor.shutdown(wait=True)
+
+    def _has_pending(self):
+        return BulkItem.query.filter(BulkItem.status.in_(['queued', 'running'])).count() > 0
+
+    def _claim_next(self):
+        """Atomically lease the oldest runnable item. Returns its id or None."""
+        now = datetime.utcnow()
+        candidates = (
+            BulkItem.query
+            .filter(
+                db.or_(
+                    BulkItem.status == 'queued',
+                    db.and_(BulkItem.status == 'running', BulkItem.lease_expires_at < now),
+                )
+            )
+            .order_by(BulkItem.created_at, BulkItem.position)
+            .limit(10)
+            .all()
+        )
+        for item in candidates:
+            claimed = (
+                BulkItem.query
+                .filter(
+                    BulkItem.id == item.id,
+                    db.or_(
+                        BulkItem.status == 'queued',
+                        db.and_(BulkItem.status == 'running', BulkItem.lease_expires_at < now),
+                    ),
+                )
+                .update({
+                    'status': 'running',
+                    'lease_owner': self.owner,
+                    'lease_expires_at': now + timedelta(seconds=BULK_LEASE_SECS),
+                    'updated_at': now,
+                }, synchronize_session=False)
+            )
+            db.session.commit()
+            if claimed:
+                return item.id
+        return None
+
+    def _run_item(self, item_id):
+        try:
+            with app_context():
+                run_item(item_id, self.owner)
+        except Exception as e:
+            print(f"[bulk-analysis] Item {item_id} crashed: {e}", flush=True)
+        finally:
+            self._slots.release()
+
+
+class LeaseLost(Exception):
+    """Another runner has taken over an item after this runner's lease expired."""
+
+    def __init__(self, item_id):
+        super().__init__(f"lease on item {item_id} was taken over by another runner")
+        self.item_id = item_id
+
+
+def _leased(item_id, owner):
+    return BulkItem.query.filter(BulkItem.id == item_id, BulkItem.lease_owner == owner)
+
+
+def _checkpoint(item, owner, **fields):
+    """
+    Persist stage progress and renew the item's lease. The write only goes
+    through while owner still holds the lease; otherwise LeaseLost is raised
+    so a stale runner stops instead of overwriting the new owner's progress.
+    """
+    now = datetime.utcnow()
+    fields.update(updated_at=now, lease_expires_at=now + timedelta(seconds=BULK_LEASE_SECS))
+    updated = _leased(item.id, owner).update(fields, synchronize_session=False)
+    db.session.commit()
+    if not updated:
+        raise LeaseLost(item.id)
+    # The commit expired item, so its attributes reload with the values just written.
+
+
+class _LeaseHeartbeat:
+    """
+    Renews an item's lease in the background while its stages run, so a
+    single long upload, extraction or summary call is not mistaken for a
+    crashed runner and the item claimed (and its model calls repeated) twice.
+    """
+
+    def __init__(self, item_id, owner, interval=None):
+        self.item_id = item_id
+        self.owner = owner
+        self.interval = interval if interval is not None else max(1.0, BULK_LEASE_SECS / 3)
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='bulk-lease', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def check(self):
+        """Raise LeaseLost once a renewal has found the item taken over."""
+        if self.lost.is_set():
+            raise LeaseLost(self.item_id)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with app_context():
+                    now = datetime.utcnow()
+                    renewed = _leased(self.item_id, self.owner).update({
+                        'lease_expires_at': now + timedelta(seconds=BULK_LEASE_SECS),
+                    }, synchronize_session=False)
+                    db.session.commit()
+            except Exception as e:
+                print(f"[bulk-analysis] Could not renew lease on item {self.item_id}: {e}", flush=True)
+                continue
+            if not renewed:
+                print(f"[bulk-analysis] Lost lease on item {self.item_id}", flush=True)
+                self.lost.set()
+                return
+
+
+def _finish(item, owner, payload, http_status):
+    _checkpoint(
+        item,
+        owner,
+        stage='done',
+        status='completed' if http_status == 200 else 'failed',
+        result=json.dumps(payload),
+        http_status=http_status,
+        error=payload.get('error') if http_status != 200 else None,
+        finished_at=datetime.utcnow(),
+        lease_owner=None,
+    )
+    print(f"[bulk-analysis] Item {item.id} ({item.solicitation_number or 'no number'}) {item.status}", flush=True)
+
+
+def run_item(item_id, owner):
+    """
+    Run (or resume) one item leased by owner through upload, extraction and
+    summary, checkpointing each stage.
+    """
+    item = BulkItem.query.get(item_id)
+    if not item or item.status in ('completed', 'failed'):
+        return
+    attempts = item.attempts or 0
+    if attempts >= BULK_MAX_ATTEMPTS:
+        # Every attempt so far ended without reaching the except block below:
+        # the process running it died (OOM, kill) and its lease expired.
+        error = f"Gave up after {attempts} attempt(s) that did not finish"
+        _checkpoint(item, owner, status='failed', stage='done', http_status=500,
+                    error=f"{error}; last error: {item.error}" if item.error else error,
+                    finished_at=datetime.utcnow(), lease_owner=None)
+        print(f"[bulk-analysis] Item {item_id} failed: {error}", flush=True)
+        return
+    _checkpoint(item, owner, attempts=attempts + 1, started_at=item.started_at or datetime.utcnow())
+
+    try:
+        with _LeaseHeartbeat(item_id, owner) as lease:
+            return _run_stages(item, owner, lease)
+
+    except LeaseLost as e:
+        db.session.rollback()
+        print(f"[bulk-analysis] Item {item_id} stopped: {e}", flush=True)
+
+    except Exception as e:
+        db.session.rollback()
+        item = BulkItem.query.get(item_id)
+        retry = item.attempts < BULK_MAX_ATTEMPTS
+        print(f"[bulk-analysis] Item {item_id} failed at {item.stage} (attempt {item.attempts}): {e}"
+              f"{'; re-queued' if retry else ''}", flush=True)
+        try:
+            if retry:
+                # Checkpoints are kept: the next attempt resumes at the failed stage.
+                _checkpoint(item, owner, status='queued', error=str(e), lease_owner=None)
+            else:
+                _checkpoint(item, owner, status='failed', stage='done', error=str(e), http_status=500,
+                            finished_at=datetime.utcnow(), lease_owner=None)
+        except LeaseLost as lost:
+            print(f"[bulk-analysis] Item {item_id} stopped: {lost}", flush=True)
+
+
+def _run_stages(item, owner, lease):
+    # Stage 1: download and upload
+    if item.documents is None:
+        lease.check()
+        documents, upload_stats = stages['upload'](json.loads(item.urls))
+        _checkpoint(item, owner, stage='extraction', documents=json.dumps({
+            'documents': documents,
+            'upload_stats': upload_stats,
+        }))
+    checkpoint = json.loads(item.documents)
+    documents, upload_stats = checkpoint['documents'], checkpoint['upload_stats']
+    if not documents:
+        return _finish(item, owner, {
+            'error': 'Failed to upload any files.',
+            'processing_stats': stages['processing_stats'](upload_stats, 0, 0),
+        }, 500)
+    if SUMMARY_STORE_ENABLED and item.extractions is None:
+        stored, record = find_stored_summary(documents)
+        if stored is not None:
+            stored['processing_stats'] = stages['processing_stats'](upload_stats, len(documents), len(documents))
+            stored['processing_stats'].update(summary_id=record.id, summary_from_store=True)
+            return _finish(item, owner, stored, 200)
+
+    # Stage 2: per-document extraction, checkpointed after each document
+    extractions = json.loads(item.extractions) if item.extractions else [None] * len(documents)
+    remaining = [i for i, e in enumerate(extractions) if e is None]
+    if remaining:
+        with ThreadPoolExecutor(max_workers=min(len(remaining), BULK_EXTRACTION_CONCURRENCY)) as executor:
+            futures = {executor.submit(stages['extract'], documents[i]): i for i in remaining}
+            try:
+                for future in as_completed(futures):
+                    lease.check()
+                    i = futures[future]
+                    doc_data = future.result()
+                    doc_data['document_index'] = i + 1
+                    extractions[i] = doc_data
+                    _checkpoint(item, owner, extractions=json.dumps(extractions))
+            except BaseException:
+                # Don't start extractions whose results can no longer be saved.
+                for future in futures:
+                    future.cancel()
+                raise
+    if item.stage != 'summary':
+        _checkpoint(item, owner, stage='summary')
+
+    # Stage 3: summary
+    successful = [e for e in extractions if 'error' not in e]
+    if not successful:
+        return _finish(item, owner, {
+            'error': 'All documents failed to analyze.',
+            'processing_stats': stages['processing_stats'](upload_stats, 0, 0),
+        }, 500)
+    lease.check()
+    with track_degraded() as degraded_answers:
+        final_summary = stages['summarize'](successful)
+    final_summary['processing_stats'] = stages['processing_stats'](upload_stats, len(successful), len(successful))
+    degraded = any(degraded_answers.values())
+    if degraded:
+        final_summary['processing_stats']['degraded'] = True
+    if (SUMMARY_STORE_ENABLED and len(successful) == len(extractions) and not degraded
+            and 'error' not in final_summary):
+        record = save_summary(final_summary, documents, item.solicitation_number)
+        if record:
+            final_summary['processing_stats']['summary_id'] = record.id
+    return _finish(item, owner, final_summary, 200)
+
+
+def start_bulk_runner():
+    """Start the background runner for this process (call once at startup)."""
+    global _runner
+    if _runner is None:
+        _runner = BulkRunner()
+        _runner.start()
+    return _runner
+
+
+def _item_to_dict(item, include_result=False):
+    extractions = json.loads(item.extractions) if item.extractions else []
+    data = {
+        'item_id': item.id,
+        'batch_id': item.batch_id,
+        'position': item.position,
+        'solicitation_number': item.solicitation_number,
+        'status': item.status,
+        'stage': item.stage,
+        'attempts': item.attempts,
+        'documents_extracted': len([e for e in extractions if e is not None]),
+        'documents_total': len(extractions) if extractions else None,
+        'error': item.error,
+        'created_at': item.created_at.isoformat() if item.created_at else None,
+        'started_at': item.started_at.isoformat() if item.started_at else None,
+        'finished_at': item.finished_at.isoformat() if item.finished_at else None,
+        'result_url': f"/api/bulk/items/{item.id}/result",
+    }
+    if include_result:
+        data['result'] = json.loads(item.result) if item.result else None
+    return data
+
+
+def _batch_to_dict(batch):
+    counts = dict(
+        db.session.query(BulkItem.status, db.func.count(BulkItem.id))
+        .filter(BulkItem.batch_id == batch.id)
+        .group_by(BulkItem.status)
+        .all()
+    )
+    return {
+        'batch_id': batch.id,
+        'name': batch.name,
+        'item_count': batch.item_count,
+        'counts': {status: counts.get(status, 0) for status in ('queued', 'running', 'completed', 'failed')},
+        'created_at': batch.created_at.isoformat() if batch.created_at else None,
+    }
+
+
+# API Routes
+@bulk_bp.route('/batches', methods=['POST'])
+def create_batch():
+    """
+    Queue solicitations for offline analysis.
+    Body: {"name": "...", "solicitations": [{"solicitation_number": "...", "urls": [...]}, ...]}
+    """
+    data = request.get_json(silent=True) or {}
+    solicitations = data.get('solicitations')
+    error = _validate_solicitations(solicitations)
+    if error:
+        return jsonify({'error': error}), 400
+
+    try:
+        batch = submit_batch(solicitations, name=data.get('name'))
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify({**_batch_to_dict(batch), 'status_url': f"/api/bulk/batches/{batch.id}"}), 202
+
+
+@bulk_bp.route('/batches/<batch_id>', methods=['GET'])
+def get_batch(batch_id):
+    """Get batch progress with per-status item counts"""
+    batch = BulkBatch.query.get(batch_id)
+    if not batch:
+        return jsonify({'error': 'Batch not found'}), 404
+    return jsonify(_batch_to_dict(batch))
+
+
+@bulk_bp.route('/batches/<batch_id>/items', methods=['GET'])
+def get_batch_items(batch_id):
+    """List a batch's items with their stage and status"""
+    batch = BulkBatch.query.get(batch_id)
+    if not batch:
+        return jsonify({'error': 'Batch not found'}), 404
+    items = BulkItem.query.filter_by(batch_id=batch_id).order_by(BulkItem.position).all()
+    return jsonify({'batch_id': batch_id, 'items': [_item_to_dict(item) for item in items]})
+
+
+@bulk_bp.route('/items/<item_id>/result', methods=['GET'])
+def get_item_result(item_id):
+    """
+    Get a finished item's stored result: the same body and status code
+    /analyze-solicitations would have returned. Returns 202 while queued or running.
+    """
+    item = BulkItem.query.get(item_id)
+    if not item:
+        return jsonify({'error': 'Item not found'}), 404
+    if item.status in ('queued', 'running'):
+        return jsonify(_item_to_dict(item)), 202
+    if not item.result:
+        return jsonify({'error': item.error or 'Item failed'}), item.http_status or 500
+    return jsonify(json.loads(item.result)), item.http_status or 200
+
+
+def main():
+    args = sys.argv[1:]
+    if '--base-url' in args:
+        i = args.index('--base-url')
+        os.environ['OPENAI_BASE_URL'] = args[i + 1]
+        del args[i:i + 2]
+    if not args or args[0] not in ('submit', 'run', 'status', 'result'):
+        print(__doc__)
+        sys.exit(1)
+
+    # Importing the app wires the database and pipeline stages into the
+    # bulk_analysis module it imports (this file runs as __main__).
+    import app as flask_app
+    import bulk_analysis as bulk
+
+    with flask_app.app.app_context():
+        flask_app.db.create_all()
+
+        if args[0] == 'submit':
+            if len(args) < 2:
+                print(__doc__)
+                sys.exit(1)
+            with open(args[1]) as f:
+                solicitations = json.load(f)
+            name = args[args.index('--name') + 1] if '--name' in args else os.path.basename(args[1])
+            error = bulk._validate_solicitations(solicitations)
+            if error:
+                print(f"ERROR: {error}")
+                sys.exit(1)
+            batch = bulk.submit_batch(solicitations, name=name)
+            print(f"Queued batch {batch.id} with {batch.item_count} solicitation(s)")
+
+        elif args[0] == 'status':
+            batch = bulk.BulkBatch.query.get(args[1]) if len(args) > 1 else None
+            if not batch:
+                print("ERROR: batch not found")
+                sys.exit(1)
+            print(json.dumps(bulk._batch_to_dict(batch), indent=2))
+            for item in bulk.BulkItem.query.filter_by(batch_id=batch.id).order_by(bulk.BulkItem.position).all():
+                print(f"  {item.id}  {item.status:<9} {item.stage:<10} {item.solicitation_number or ''}")
+
+        elif args[0] == 'result':
+            item = bulk.BulkItem.query.get(args[1]) if len(args) > 1 else None
+            if not item:
+                print("ERROR: item not found")
+                sys.exit(1)
+            print(item.result or json.dumps(bulk._item_to_dict(item), indent=2))
+
+    if args[0] == 'run':
+        started = time.time()
+        bulk.BulkRunner().run(until_empty='--until-empty' in args)
+        print(f"Queue drained in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Cache Store Module
+Small persistent key/value caches backed by SQLite files that live next to
+sam_gov_negotiations.db (the Flask instance folder)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Flask-SQLAlchemy resolves 'sqlite:///sam_gov_negotiations.db' relative to the
+# app's instance folder, so cache files default to the same directory.
+CACHE_DIR = os.getenv(
+    "CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance"),
+)
+
+
+class SqliteCache:
+    """
+    Thread-safe key/value cache stored in a SQLite table.
+
+    Values are JSON-serialized. Entries expire after ttl_seconds and the
+    least recently used entries are evicted once the table grows past
+    max_entries rows or max_bytes of recorded entry size.
+    """
+
+    def __init__(self, filename, table="cache", ttl_seconds=None, max_entries=None, max_bytes=None):
+        self.path = os.path.join(CACHE_DIR, filename)
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS {self.table} (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL,
+                    expires_at REAL
+                )"""
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{self.table}_last_used ON {self.table} (last_used_at)")
+            self._initialized = True
+        return conn
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row[1] is not None and row[1] <= now:
+                    conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    conn.commit()
+                    return None
+                conn.execute(f"UPDATE {self.table} SET last_used_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+                return json.loads(row[0])
+            finally:
+                conn.close()
+
+    def set(self, key, value, size=0, ttl_seconds=None):
+        """Store value under key, then evict by age and size."""
+        now = time.time()
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        expires_at = now + ttl if ttl else None
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    f"""INSERT OR REPLACE INTO {self.table}
+                        (key, value, size, created_at, last_used_at, expires_at)
+                        VALUES (?, ?, ?, ?, ?, ?)""",
+                    (key, json.dumps(value), size, now, now, expires_at),
+                )
+                self._evict(conn, now)
+                conn.commit()
+            finally:
+                conn.close()
+
+    def delete(self, key):
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                conn.commit()
+            finally:
+                conn.close()
+
+    def clear(self, prefix=None):
+        """Remove every entry (or every entry whose key starts with prefix). Returns the count removed."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                if prefix:
+                    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                    cur = conn.execute(
+                        f"DELETE FROM {self.table} WHERE key LIKE ? ESCAPE '\\'", (escaped + '%',)
+                    )
+                else:
+                    cur = conn.execute(f"DELETE FROM {self.table}")
+                conn.commit()
+                return cur.rowcount
+            finally:
+                conn.close()
+
+    def stats(self):
+        with self._lock:
+            conn = self._connect()
+            try:
+                count, total_size = conn.execute(
+                    f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+                ).fetchone()
+            finally:
+                conn.close()
+        return {
+            'entries': count,
+            'total_size': total_size,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'ttl_seconds': self.ttl_seconds,
+        }
+
+    def _evict(self, conn, now):
+        conn.execute(
+            f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        )
+        if self.max_entries:
+            conn.execute(
+                f"""DELETE FROM {self.table} WHERE key IN (
+                    SELECT key FROM {self.table} ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+        if self.max_bytes:
+            total = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+            if total > self.max_bytes:
+                rows = conn.execute(
+                    f"SELECT key, size FROM {self.table} ORDER BY last_used_at ASC"
+                ).fetchall()
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    total -= size
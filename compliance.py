@@ -4,9 +4,7 @@ Checks vendor compliance with government contract requirements
 """
 
 from flask import Blueprint, request, jsonify
-from openai import OpenAI
-import os
-import json
+from llm_gateway import get_gateway
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,8 +12,8 @@ load_dotenv()
 # Create Blueprint
 compliance_bp = Blueprint('compliance', __name__, url_prefix='/api/compliance')
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Shared OpenAI gateway (pooled client, concurrency caps, retries, metrics)
+llm_gateway = get_gateway()
 
 # Database reference (set by init function)
 db = None
@@ -312,7 +310,9 @@ def generate_compliance_summary_with_ai(compliance_results: dict, opportunity_da
         Return as JSON with keys: executive_summary, key_risks, recommended_actions
         """
         
-        response = client.chat.completions.create(
+        ai_summary = llm_gateway.chat_json(
+            "compliance.assessment",
+            "compliance_summary",
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "You are a government contracting compliance expert. Provide clear, actionable compliance assessments."},
@@ -320,16 +320,6 @@ def generate_compliance_summary_with_ai(compliance_results: dict, opportunity_da
             ],
             temperature=0.3
         )
-        
-        content = response.choices[0].message.content
-        
-        # Clean up markdown code blocks if present
-        if content.startswith('```'):
-            content = content.split('```')[1]
-            if content.startswith('json'):
-                content = content[4:]
-        
-        ai_summary = json.loads(content.strip())
         return ai_summary
         
     except Exception as e:
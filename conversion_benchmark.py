@@ -0,0 +1,126 @@
+"""
+Benchmark the text-native fast path against render-to-PDF for attachments.
+
+For each local file it reports the CPU time spent converting, the bytes that
+would be sent to OpenAI and an estimated input-token count for both paths.
+With --live each variant is also sent through the Responses API once and the
+reported usage.input_tokens is printed (needs OPENAI_API_KEY, costs tokens).
+
+Usage:
+    python conversion_benchmark.py path/to/file.docx path/to/sheet.xlsx ...
+    python conversion_benchmark.py --live path/to/file.csv
+"""
+
+import io
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+from document_conversion import (
+    DIRECT_UPLOAD_SUFFIXES, TEXT_NATIVE_TYPES, detect_file_type, sniff_file_type,
+    convert_to_pdf, extract_text,
+)
+
+load_dotenv()
+
+BENCHMARK_MODEL = os.getenv("BENCHMARK_MODEL", "gpt-4o-mini")
+
+
+def estimate_tokens(text):
+    """Token count with tiktoken when it is installed, otherwise ~4 characters per token."""
+    try:
+        import tiktoken
+        return len(tiktoken.get_encoding("o200k_base").encode(text))
+    except Exception:
+        return len(text) // 4
+
+
+def pdf_text_tokens(pdf_bytes):
+    """Rough token estimate for a PDF: the model sees its extracted text (plus page images)."""
+    try:
+        from pypdf import PdfReader
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        return estimate_tokens("\n".join(page.extract_text() or "" for page in reader.pages)), len(reader.pages)
+    except Exception:
+        return None, None
+
+
+def timed(func, *args):
+    started = time.process_time()
+    result = func(*args)
+    return result, time.process_time() - started
+
+
+def live_input_tokens(client, file_input):
+    response = client.responses.create(
+        model=BENCHMARK_MODEL,
+        input=[{"role": "user", "content": [file_input, {"type": "input_text", "text": "Reply with OK."}]}],
+        max_output_tokens=16,
+    )
+    return response.usage.input_tokens
+
+
+def benchmark_file(path, client=None):
+    with open(path, "rb") as f:
+        source = io.BytesIO(f.read())
+    file_type = detect_file_type(path, "")
+    if file_type == 'unknown':
+        file_type = sniff_file_type(source)
+    if file_type not in TEXT_NATIVE_TYPES:
+        print(f"{path}: {file_type} has no text-native path, skipping")
+        return
+
+    text, text_cpu = timed(extract_text, source, file_type)
+    if file_type in DIRECT_UPLOAD_SUFFIXES:
+        # docx/txt/md are uploaded as-is on the file path; time nothing.
+        pdf_bytes, pdf_cpu = source.getvalue(), 0.0
+        file_label = f"original .{file_type}"
+    else:
+        pdf_bytes, pdf_cpu = timed(convert_to_pdf, source, file_type)
+        file_label = "rendered PDF"
+
+    print(f"\n{path} ({file_type}, {len(source.getvalue())} bytes)")
+    if pdf_bytes:
+        tokens, pages = pdf_text_tokens(pdf_bytes) if file_label == "rendered PDF" else (None, None)
+        page_note = f", {pages} page(s)" if pages else ""
+        token_note = f", ~{tokens} text tokens (+ page images)" if tokens is not None else ""
+        print(f"  file path : {file_label}, {pdf_cpu * 1000:.1f} ms CPU, {len(pdf_bytes)} bytes uploaded{page_note}{token_note}")
+    else:
+        print("  file path : conversion failed")
+    if text:
+        print(f"  text path : {text_cpu * 1000:.1f} ms CPU, {len(text.encode('utf-8'))} bytes inline, ~{estimate_tokens(text)} tokens")
+    else:
+        print("  text path : extraction failed (would fall back to the file path)")
+
+    if client is not None:
+        if text:
+            print(f"  live text input_tokens: {live_input_tokens(client, {'type': 'input_text', 'text': text})}")
+        if pdf_bytes:
+            suffix = ".pdf" if file_label == "rendered PDF" else DIRECT_UPLOAD_SUFFIXES[file_type]
+            upload = client.files.create(file=(f"benchmark{suffix}", io.BytesIO(pdf_bytes)), purpose="user_data")
+            try:
+                print(f"  live file input_tokens: {live_input_tokens(client, {'type': 'input_file', 'file_id': upload.id})}")
+            finally:
+                client.files.delete(upload.id)
+
+
+def main():
+    args = sys.argv[1:]
+    live = "--live" in args
+    paths = [a for a in args if a != "--live"]
+    if not paths:
+        print(__doc__)
+        sys.exit(1)
+
+    client = None
+    if live:
+        from openai import OpenAI
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    for path in paths:
+        benchmark_file(path, client)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Conversion Pool Module
+Runs WeasyPrint PDF rendering in separate worker processes so a slow or
+pathological attachment cannot stall the Flask worker. Each conversion has a
+wall-clock timeout and a resident-memory cap, and workers are recycled after
+a fixed number of tasks
+"""
+
+import os
+import sys
+import time
+import queue
+import atexit
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+from multiprocessing.connection import Connection
+from dotenv import load_dotenv
+
+from document_conversion import convert_to_pdf
+
+load_dotenv()
+
+CONVERSION_WORKERS = int(os.getenv("CONVERSION_WORKERS", str(min(4, os.cpu_count() or 1))))
+CONVERSION_TIMEOUT_SECS = float(os.getenv("CONVERSION_TIMEOUT_SECS", "120"))
+CONVERSION_MAX_RSS_MB = int(os.getenv("CONVERSION_MAX_RSS_MB", "1024"))
+CONVERSION_MAX_TASKS_PER_WORKER = int(os.getenv("CONVERSION_MAX_TASKS_PER_WORKER", "50"))
+
+_RSS_POLL_SECS = 0.25
+_COPY_CHUNK_BYTES = 1024 * 1024
+
+
+class ConversionFailed(Exception):
+    """A conversion could not be completed in the worker pool."""
+
+
+class ConversionTimeout(ConversionFailed):
+    pass
+
+
+class ConversionMemoryExceeded(ConversionFailed):
+    pass
+
+
+def _rss_bytes(pid):
+    """Current resident set size of a process, or None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _peak_rss_bytes():
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KiB on Linux
+    except Exception:
+        return None
+
+
+def _worker_main(fd):
+    """Worker process loop: receive (path, file_type), reply with (status, pdf_bytes, peak_rss, warnings)."""
+    conn = Connection(fd)
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message is None:
+            break
+        path, file_type = message
+        warnings = []
+        try:
+            with open(path, 'rb') as source:
+                pdf_bytes = convert_to_pdf(source, file_type, warnings)
+            conn.send(('ok', pdf_bytes, _peak_rss_bytes(), warnings))
+        except Exception as e:
+            conn.send(('error', str(e), _peak_rss_bytes(), warnings))
+    conn.close()
+
+
+class _Worker:
+    """
+    One conversion process. Workers are plain subprocesses talking over a
+    socketpair rather than multiprocessing children: spawn would re-import
+    the Flask app's __main__ in every worker and fork is unsafe from a
+    multi-threaded server.
+    """
+
+    def __init__(self):
+        parent_sock, child_sock = socket.socketpair()
+        self.process = subprocess.Popen(
+            [sys.executable, "-c", "import sys, conversion_pool; conversion_pool._worker_main(int(sys.argv[1]))",
+             str(child_sock.fileno())],
+            pass_fds=(child_sock.fileno(),),
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        child_sock.close()
+        self.conn = Connection(parent_sock.detach())
+        self.tasks = 0
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except Exception:
+            pass
+        self.conn.close()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.kill()
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait(timeout=5)
+        self.conn.close()
+
+
+class ConversionPool:
+    """
+    Fixed-size pool of conversion processes.
+
+    Workers are spawned lazily. A task that runs past timeout_secs or whose
+    worker grows past max_rss_mb is killed and its worker replaced; workers
+    are also retired after max_tasks conversions or once their peak RSS
+    exceeds the cap, which bounds leaks in the rendering stack.
+    """
+
+    def __init__(self, workers=CONVERSION_WORKERS, timeout_secs=CONVERSION_TIMEOUT_SECS,
+                 max_rss_mb=CONVERSION_MAX_RSS_MB, max_tasks=CONVERSION_MAX_TASKS_PER_WORKER):
+        self.timeout_secs = timeout_secs
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024 if max_rss_mb else None
+        self.max_tasks = max_tasks
+        self._slots = queue.Queue()
+        for _ in range(max(1, workers)):
+            self._slots.put(None)
+        self._live = set()
+        self._lock = threading.Lock()
+        self._stats = {'workers': max(1, workers), 'completed': 0, 'failed': 0,
+                       'timeouts': 0, 'memory_kills': 0, 'recycled': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _release(self, worker):
+        with self._lock:
+            if worker is not None:
+                self._live.add(worker)
+        self._slots.put(worker)
+
+    def _discard(self, worker, kill=False):
+        with self._lock:
+            self._live.discard(worker)
+        if kill:
+            worker.kill()
+        else:
+            worker.stop()
+
+    def convert(self, source, file_type, warnings=None):
+        """
+        Render a seekable binary file object to PDF bytes in a worker process.
+
+        Returns the PDF bytes, or None if the converter could not handle the
+        file. Sampling notes from the converter are appended to warnings when
+        a list is given. Raises ConversionTimeout / ConversionMemoryExceeded when the task
+        was killed, ConversionFailed if the worker died.
+
+        The source is handed over as a temporary file, copied in fixed-size
+        chunks, so a spooled attachment is never read into memory whole.
+        """
+        source.seek(0)
+        with tempfile.NamedTemporaryFile(prefix="conversion-", delete=False) as spool:
+            shutil.copyfileobj(source, spool, _COPY_CHUNK_BYTES)
+        try:
+            return self._convert_file(spool.name, file_type, warnings)
+        finally:
+            try:
+                os.unlink(spool.name)
+            except OSError:
+                pass
+
+    def _convert_file(self, path, file_type, warnings):
+        worker = self._slots.get()
+        try:
+            if worker is None or not worker.alive():
+                if worker is not None:
+                    self._discard(worker, kill=True)
+                    worker = None
+                worker = _Worker()
+            try:
+                worker.conn.send((path, file_type))
+            except OSError:
+                self._count('failed')
+                self._discard(worker, kill=True)
+                worker = None
+                raise ConversionFailed(f"Conversion worker unavailable for {file_type}")
+
+            deadline = time.monotonic() + self.timeout_secs
+            while not worker.conn.poll(min(_RSS_POLL_SECS, max(0.0, deadline - time.monotonic()))):
+                if time.monotonic() >= deadline:
+                    self._count('timeouts')
+                    self._discard(worker, kill=True)
+                    worker = None
+                    raise ConversionTimeout(f"Conversion of {file_type} timed out after {self.timeout_secs:g}s")
+                rss = _rss_bytes(worker.process.pid)
+                if self.max_rss_bytes and rss and rss > self.max_rss_bytes:
+                    self._count('memory_kills')
+                    self._discard(worker, kill=True)
+                    worker = None
+                    raise ConversionMemoryExceeded(
+                        f"Conversion of {file_type} exceeded the {self.max_rss_bytes // (1024 * 1024)} MB memory limit"
+                    )
+
+            try:
+                status, payload, peak_rss, worker_warnings = worker.conn.recv()
+            except (EOFError, OSError):
+                self._count('failed')
+                self._discard(worker, kill=True)
+                worker = None
+                raise ConversionFailed(f"Conversion worker exited while converting {file_type}")
+
+            worker.tasks += 1
+            if warnings is not None:
+                warnings.extend(worker_warnings)
+            if worker.tasks >= self.max_tasks or (self.max_rss_bytes and peak_rss and peak_rss > self.max_rss_bytes):
+                self._count('recycled')
+                self._discard(worker)
+                worker = None
+
+            if status != 'ok' or payload is None:
+                self._count('failed')
+                if status != 'ok':
+                    print(f"Error converting {file_type} to PDF in worker: {payload}", flush=True)
+                return None
+            self._count('completed')
+            return payload
+        finally:
+            self._release(worker)
+
+    def status(self):
+        with self._lock:
+            return dict(self._stats, live_workers=len(self._live))
+
+    def shutdown(self):
+        with self._lock:
+            workers = list(self._live)
+            self._live.clear()
+        for worker in workers:
+            worker.stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_conversion_pool():
+    """Return the process-wide conversion pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConversionPool()
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def convert_to_pdf_isolated(source, file_type, warnings=None):
+    """convert_to_pdf run in the shared worker pool (see ConversionPool.convert)."""
+    return get_conversion_pool().convert(source, file_type, warnings)
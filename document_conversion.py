@@ -0,0 +1,455 @@
+"""
+Document Conversion Module
+File type detection and conversion of solicitation attachments, either to
+PDF (rendered through WeasyPrint) or to compact Markdown-style text that can
+be sent to the model as input_text
+"""
+
+import io
+import os
+import re
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DIRECT_UPLOAD_SUFFIXES = {
+    "pdf": ".pdf",
+    "docx": ".docx",
+    "txt": ".txt",
+    "md": ".md",
+}
+
+CONVERT_TO_PDF_TYPES = {"xlsx", "xls", "csv", "html"}
+
+# Formats that can be extracted locally into text instead of being rendered
+# to PDF. ATTACHMENT_TEXT_MODE=pdf restores the render-to-PDF behaviour;
+# in text mode PDF rendering is only the fallback when extraction fails.
+TEXT_NATIVE_TYPES = {"docx", "xlsx", "csv", "txt", "md"}
+ATTACHMENT_TEXT_MODE = os.getenv("ATTACHMENT_TEXT_MODE", "text").lower()
+TEXT_INPUT_MAX_CHARS = int(os.getenv("TEXT_INPUT_MAX_CHARS", "400000"))
+
+# Spreadsheets and CSVs are read row by row and sampled down to these caps per
+# sheet, with a marker where rows or columns were left out.
+SHEET_MAX_ROWS = int(os.getenv("SHEET_MAX_ROWS", "2000"))
+SHEET_MAX_COLS = int(os.getenv("SHEET_MAX_COLS", "40"))
+
+# PDFs longer than PDF_CHUNK_MIN_PAGES are split into PDF_CHUNK_PAGES-page
+# ranges that are uploaded and extracted separately.
+PDF_CHUNK_MIN_PAGES = int(os.getenv("PDF_CHUNK_MIN_PAGES", "80"))
+PDF_CHUNK_PAGES = int(os.getenv("PDF_CHUNK_PAGES", "40"))
+
+
+def detect_file_type(url, content_type):
+    """Detect file type from URL extension and Content-Type header."""
+    from urllib.parse import urlparse
+    ext = os.path.splitext(urlparse(url).path)[1].lower()
+    
+    type_map = {
+        '.pdf': 'pdf',
+        '.docx': 'docx',
+        '.doc': 'doc',
+        '.xlsx': 'xlsx',
+        '.xls': 'xls',
+        '.html': 'html',
+        '.htm': 'html',
+        '.txt': 'txt',
+        '.md': 'md',
+        '.csv': 'csv',
+    }
+    if ext in type_map:
+        return type_map[ext]
+    
+    ct = (content_type or '').lower()
+    if 'pdf' in ct:
+        return 'pdf'
+    if 'wordprocessingml' in ct:
+        return 'docx'
+    if 'msword' in ct:
+        return 'doc'
+    if 'spreadsheetml' in ct:
+        return 'xlsx'
+    if 'ms-excel' in ct:
+        return 'xls'
+    if 'text/markdown' in ct:
+        return 'md'
+    if 'text/csv' in ct:
+        return 'csv'
+    if 'html' in ct:
+        return 'html'
+    if 'text/plain' in ct:
+        return 'txt'
+    
+    return 'unknown'
+
+
+def magic_type(head):
+    """Classify the first downloaded bytes of a file as 'pdf', 'zip' or 'unknown'."""
+    if head[:5] == b'%PDF-':
+        return 'pdf'
+    if head[:2] == b'PK':
+        return 'zip'
+    return 'unknown'
+
+
+def sniff_file_type(file_obj):
+    """Best-effort file type sniffing for generic URLs/content-types. Leaves file_obj rewound."""
+    file_obj.seek(0)
+    magic = magic_type(file_obj.read(5))
+    file_obj.seek(0)
+    if magic == 'pdf':
+        return 'pdf'
+
+    # Office Open XML formats are ZIP containers.
+    if magic == 'zip':
+        try:
+            import zipfile
+            with zipfile.ZipFile(file_obj) as zf:
+                names = zf.namelist()
+                if any(name.startswith("word/") for name in names):
+                    return 'docx'
+                if any(name.startswith("xl/") for name in names):
+                    return 'xlsx'
+        except Exception:
+            pass
+        finally:
+            file_obj.seek(0)
+
+    return 'unknown'
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    return re.sub(r'\s+', ' ', str(value).strip())
+
+
+def _column_name(index):
+    """Spreadsheet-style column name for a 0-based index (0 -> A, 26 -> AA)."""
+    name = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        name = chr(65 + rem) + name
+    return name
+
+
+def _looks_like_header(cells):
+    """A header row is mostly text labels, not numbers."""
+    filled = [c for c in cells if c]
+    if not filled:
+        return False
+    labels = [c for c in filled if not re.fullmatch(r'[-+$€£]?[\d,.]+%?', c)]
+    return len(labels) * 2 >= len(filled) and len(set(filled)) == len(filled)
+
+
+def _iter_sheets(source, file_type):
+    """
+    Yield (sheet_name, rows, total_rows) for each sheet of a workbook, or a
+    single unnamed sheet for CSV. rows is a lazy iterator of value tuples;
+    total_rows is the sheet's declared row count when the file records one.
+    """
+    if file_type == 'csv':
+        import csv as csv_module
+        text = io.TextIOWrapper(source, encoding='utf-8', errors='replace', newline='')
+        try:
+            yield None, csv_module.reader(text), None
+        finally:
+            text.detach()
+        return
+
+    from openpyxl import load_workbook
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        for sheet_name in wb.sheetnames:
+            ws = wb[sheet_name]
+            yield sheet_name, ws.iter_rows(values_only=True, max_col=SHEET_MAX_COLS + 1), ws.max_row
+    finally:
+        wb.close()
+
+
+def _sample_sheet(rows, total_rows=None, max_rows=SHEET_MAX_ROWS, max_cols=SHEET_MAX_COLS):
+    """
+    Read a sheet's rows without holding more than max_rows of them.
+
+    Returns {"header", "rows", "header_detected", "omitted_rows", "more_columns"},
+    or None for an empty sheet. Empty rows are dropped and trailing empty
+    columns trimmed. When total_rows is known, reading stops at the cap and
+    omitted_rows is estimated from it; otherwise the rest is only counted.
+    """
+    kept = []
+    width = 0
+    more_columns = False
+    seen = 0
+    stopped_early = False
+    for row in rows:
+        cells = [_cell_text(v) for v in row]
+        if len(cells) > max_cols:
+            if any(cells[max_cols:]):
+                more_columns = True
+            cells = cells[:max_cols]
+        if not any(cells):
+            continue
+        if len(kept) <= max_rows:
+            # One spare row in case the first turns out to be the header.
+            kept.append(cells)
+            width = max(width, max(i + 1 for i, c in enumerate(cells) if c))
+        elif total_rows is not None:
+            stopped_early = True
+            break
+        seen += 1
+
+    if not kept:
+        return None
+    kept = [(row + [""] * width)[:width] for row in kept]
+    header_detected = _looks_like_header(kept[0]) and len(kept) > 1
+    if header_detected:
+        header = kept.pop(0)
+        header = [c or _column_name(i) for i, c in enumerate(header)]
+        seen -= 1
+    else:
+        header = [_column_name(i) for i in range(width)]
+    kept = kept[:max_rows]
+    data_rows = seen
+    if stopped_early:
+        data_rows = max(seen, total_rows - (1 if header_detected else 0))
+    omitted = data_rows - len(kept)
+    return {
+        "header": header,
+        "rows": kept,
+        "header_detected": header_detected,
+        "omitted_rows": omitted,
+        "more_columns": more_columns,
+    }
+
+
+def _sampling_warning(sheet_name, sample, max_cols=SHEET_MAX_COLS):
+    """Human-readable note for a sampled sheet, or None if it was rendered whole."""
+    parts = []
+    if sample["omitted_rows"]:
+        parts.append(f"first {len(sample['rows'])} data rows kept, {sample['omitted_rows']} omitted")
+    if sample["more_columns"]:
+        parts.append(f"columns after {_column_name(max_cols - 1)} omitted")
+    if not parts:
+        return None
+    label = f"Sheet '{sheet_name}'" if sheet_name else "CSV"
+    return f"{label} sampled: " + "; ".join(parts)
+
+
+def _escape_html(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _sheets_to_html(source, file_type, warnings):
+    table_open = "<table border='1' cellpadding='4' cellspacing='0' style='border-collapse:collapse;width:100%'>"
+    parts = []
+    for sheet_name, rows, total_rows in _iter_sheets(source, file_type):
+        sample = _sample_sheet(rows, total_rows)
+        if sample is None:
+            continue
+        if sheet_name:
+            parts.append(f"<h2>{_escape_html(sheet_name)}</h2>")
+        parts.append(table_open)
+        parts.append("<thead><tr>" + "".join(f"<th>{_escape_html(c)}</th>" for c in sample["header"]) + "</tr></thead>")
+        for row in sample["rows"]:
+            parts.append("<tr>" + "".join(f"<td>{_escape_html(c)}</td>" for c in row) + "</tr>")
+        parts.append("</table>")
+        warning = _sampling_warning(sheet_name, sample)
+        if warning:
+            parts.append(f"<p><em>[{_escape_html(warning)}]</em></p>")
+            warnings.append(warning)
+    return f"<html><body style='font-family:Arial,sans-serif;font-size:10pt'>{''.join(parts)}</body></html>"
+
+
+def convert_to_pdf(source, file_type, warnings=None):
+    """
+    Convert a non-PDF file (a seekable binary file object) to PDF bytes.
+    Returns PDF bytes or None. Notes about sampled sheets are appended to
+    warnings when a list is given.
+    """
+    if warnings is None:
+        warnings = []
+    try:
+        source.seek(0)
+        if file_type == 'docx':
+            from docx import Document
+            doc = Document(source)
+            paragraphs = []
+            for para in doc.paragraphs:
+                text = para.text.strip()
+                if text:
+                    escaped = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+                    paragraphs.append(f"<p>{escaped}</p>")
+            
+            for table in doc.tables:
+                paragraphs.append("<table border='1' cellpadding='4' cellspacing='0' style='border-collapse:collapse;width:100%'>")
+                for row in table.rows:
+                    paragraphs.append("<tr>")
+                    for cell in row.cells:
+                        cell_text = cell.text.strip().replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+                        paragraphs.append(f"<td>{cell_text}</td>")
+                    paragraphs.append("</tr>")
+                paragraphs.append("</table>")
+            
+            html = f"<html><body style='font-family:Arial,sans-serif;font-size:11pt;line-height:1.5'>{''.join(paragraphs)}</body></html>"
+        
+        elif file_type in ('xlsx', 'xls', 'csv'):
+            html = _sheets_to_html(source, file_type, warnings)
+        
+        elif file_type == 'html':
+            html = source.read().decode('utf-8', errors='replace')
+        
+        elif file_type == 'txt':
+            text = source.read().decode('utf-8', errors='replace')
+            escaped = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+            html = f"<html><body style='font-family:monospace;font-size:10pt;white-space:pre-wrap'>{escaped}</body></html>"
+        
+        else:
+            return None
+        
+        from weasyprint import HTML
+        pdf_bytes = HTML(string=html).write_pdf()
+        return pdf_bytes
+    
+    except Exception as e:
+        print(f"Error converting {file_type} to PDF: {e}")
+        return None
+
+
+def split_pdf(source, pages_per_chunk=PDF_CHUNK_PAGES, min_pages=PDF_CHUNK_MIN_PAGES):
+    """
+    Split a PDF (a seekable binary file object) into page ranges.
+
+    Returns a list of {"first_page", "last_page", "data"} (1-based, inclusive),
+    or None when the PDF has no more than min_pages pages or cannot be split
+    (e.g. it is encrypted), in which case it should be sent whole.
+    """
+    try:
+        from pypdf import PdfReader, PdfWriter
+        source.seek(0)
+        reader = PdfReader(source)
+        if reader.is_encrypted and not reader.decrypt(""):
+            return None
+        page_count = len(reader.pages)
+        if page_count <= min_pages:
+            return None
+        chunks = []
+        for first in range(0, page_count, pages_per_chunk):
+            last = min(first + pages_per_chunk, page_count)
+            writer = PdfWriter()
+            for page_number in range(first, last):
+                writer.add_page(reader.pages[page_number])
+            out = io.BytesIO()
+            writer.write(out)
+            chunks.append({"first_page": first + 1, "last_page": last, "data": out.getvalue()})
+        return chunks
+
+    except Exception as e:
+        print(f"Error splitting PDF: {e}")
+        return None
+    finally:
+        source.seek(0)
+
+
+def _md_row(cells):
+    return "| " + " | ".join(c.replace('|', '\\|') for c in cells) + " |"
+
+
+def _md_table(rows):
+    """Render rows (first row is the header) as a Markdown table, dropping empty rows and trailing empty columns."""
+    rows = [[_cell_text(c) for c in row] for row in rows]
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return ""
+    width = max(max((i + 1 for i, c in enumerate(row) if c), default=0) for row in rows)
+    rows = [(row + [""] * width)[:width] for row in rows]
+    lines = [_md_row(rows[0]), "|" + "---|" * width]
+    lines.extend(_md_row(row) for row in rows[1:])
+    return "\n".join(lines)
+
+
+def _compact_text(text):
+    """Drop trailing whitespace and collapse runs of blank lines."""
+    lines = [line.rstrip() for line in text.replace('\r\n', '\n').replace('\r', '\n').split('\n')]
+    return re.sub(r'\n{3,}', '\n\n', "\n".join(lines)).strip()
+
+
+def _docx_to_text(source):
+    from docx import Document
+    from docx.table import Table
+    doc = Document(source)
+    blocks = []
+    # Walk the body in document order so tables stay next to the text that introduces them.
+    for block in doc.iter_inner_content():
+        if isinstance(block, Table):
+            table = _md_table([[cell.text for cell in row.cells] for row in block.rows])
+            if table:
+                blocks.append(table)
+            continue
+        text = block.text.strip()
+        if not text:
+            continue
+        style = (block.style.name if block.style is not None else "") or ""
+        if style.startswith("Heading"):
+            level = style.replace("Heading", "").strip()
+            blocks.append("#" * (int(level) if level.isdigit() else 1) + " " + text)
+        elif style == "Title":
+            blocks.append("# " + text)
+        else:
+            blocks.append(text)
+    return "\n\n".join(blocks)
+
+
+def _sheets_to_text(source, file_type, warnings):
+    sections = []
+    for sheet_name, rows, total_rows in _iter_sheets(source, file_type):
+        sample = _sample_sheet(rows, total_rows)
+        if sample is None:
+            continue
+        width = len(sample["header"])
+        lines = [_md_row(sample["header"]), "|" + "---|" * width]
+        lines.extend(_md_row(row) for row in sample["rows"])
+        warning = _sampling_warning(sheet_name, sample)
+        if warning:
+            lines.append(f"\n[{warning}]")
+            warnings.append(warning)
+        table = "\n".join(lines)
+        sections.append(f"## Sheet: {sheet_name}\n\n{table}" if sheet_name else table)
+    return "\n\n".join(sections)
+
+
+def extract_text(source, file_type, warnings=None):
+    """
+    Extract a text-native format (a seekable binary file object) into compact
+    Markdown: headings and paragraphs for docx, one table per sheet for xlsx,
+    a table for csv and whitespace-trimmed text for txt/md.
+
+    Returns the text, or None if the format is unsupported, extraction
+    failed or produced nothing (callers fall back to PDF rendering). Notes
+    about sampled sheets and truncated text are appended to warnings when a
+    list is given.
+    """
+    if warnings is None:
+        warnings = []
+    try:
+        source.seek(0)
+        if file_type == 'docx':
+            text = _docx_to_text(source)
+        elif file_type in ('xlsx', 'csv'):
+            text = _sheets_to_text(source, file_type, warnings)
+        elif file_type in ('txt', 'md'):
+            text = source.read().decode('utf-8', errors='replace')
+        else:
+            return None
+        text = _compact_text(text)
+        if not text:
+            return None
+        if len(text) > TEXT_INPUT_MAX_CHARS:
+            warnings.append(f"Text truncated: first {TEXT_INPUT_MAX_CHARS} of {len(text)} characters kept")
+            text = text[:TEXT_INPUT_MAX_CHARS] + f"\n\n[... truncated after {TEXT_INPUT_MAX_CHARS} characters ...]"
+        return text
+
+    except Exception as e:
+        print(f"Error extracting text from {file_type}: {e}")
+        return None
+    finally:
+        source.seek(0)
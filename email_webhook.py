@@ -4,9 +4,7 @@ Receives and parses incoming supplier email replies via SendGrid Inbound Parse
 """
 
 from flask import Blueprint, request, jsonify
-from openai import OpenAI
-import os
-import json
+from llm_gateway import get_gateway
 import re
 from datetime import datetime
 from dotenv import load_dotenv
@@ -16,8 +14,8 @@ load_dotenv()
 # Create Blueprint
 webhook_bp = Blueprint('webhook', __name__, url_prefix='/webhook')
 
-# Initialize OpenAI client for email parsing
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Shared OpenAI gateway, used for email parsing
+llm_gateway = get_gateway()
 
 # Database reference (set by init function)
 db = None
@@ -73,7 +71,9 @@ def parse_email_for_quote(email_content: str, from_email: str, subject: str) ->
     """
     
     try:
-        response = client.chat.completions.create(
+        return llm_gateway.chat_json(
+            "email_parsing.reply",
+            "email_quote",
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "You are an expert at parsing business emails and extracting pricing information."},
@@ -82,16 +82,6 @@ def parse_email_for_quote(email_content: str, from_email: str, subject: str) ->
             temperature=0.2
         )
         
-        content = response.choices[0].message.content
-        
-        # Clean up markdown code blocks if present
-        if content.startswith('```'):
-            content = content.split('```')[1]
-            if content.startswith('json'):
-                content = content[4:]
-        
-        return json.loads(content.strip())
-        
     except Exception as e:
         return {
             'is_quote_response': True,
@@ -0,0 +1,174 @@
+"""
+HTTP Cache Module
+On-disk cache of downloaded attachment bodies. Bodies are stored once per
+content hash, responses are indexed by URL with their ETag/Last-Modified
+validators so repeat downloads can be revalidated with a conditional GET
+"""
+
+import os
+import time
+import shutil
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+from cache_store import CACHE_DIR
+
+load_dotenv()
+
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE_ENABLED", "true").lower() == "true"
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", os.path.join(CACHE_DIR, "http_cache"))
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+
+class HttpBodyCache:
+    """
+    Content-addressed body store with a URL index, evicted least recently
+    used first once the stored bodies exceed max_bytes.
+
+    A body shared by several URLs (re-posted attachments) is stored once.
+    """
+
+    def __init__(self, directory=HTTP_CACHE_DIR, max_bytes=HTTP_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.path = os.path.join(directory, "index.db")
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(self.directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    content_type TEXT,
+                    stored_at REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_sha256 ON responses (sha256)")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS bodies (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    last_used_at REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_bodies_last_used ON bodies (last_used_at)")
+            self._initialized = True
+        return conn
+
+    def _body_path(self, sha256):
+        return os.path.join(self.directory, sha256[:2], sha256)
+
+    def lookup(self, url):
+        """
+        Return (entry, body) for a cached URL, where entry holds the stored
+        validators and body is an open binary file, or (None, None).
+
+        The body is opened here so that a concurrent eviction cannot remove
+        it between revalidation and use. The caller must close it.
+        """
+        with self._lock:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT sha256, etag, last_modified, content_type FROM responses WHERE url = ?", (url,)
+                ).fetchone()
+                if row is None:
+                    return None, None
+                try:
+                    body = open(self._body_path(row[0]), "rb")
+                except OSError:
+                    # The body file is gone: forget it and every URL pointing at it.
+                    conn.execute("DELETE FROM responses WHERE sha256 = ?", (row[0],))
+                    conn.execute("DELETE FROM bodies WHERE sha256 = ?", (row[0],))
+                    conn.commit()
+                    return None, None
+                conn.execute("UPDATE bodies SET last_used_at = ? WHERE sha256 = ?", (time.time(), row[0]))
+                conn.commit()
+            finally:
+                conn.close()
+        entry = {"sha256": row[0], "etag": row[1], "last_modified": row[2], "content_type": row[3]}
+        return entry, body
+
+    def store(self, url, source, sha256, size, etag=None, last_modified=None, content_type=None):
+        """Save a downloaded body (a seekable binary file) and index it under url."""
+        body_path = self._body_path(sha256)
+        if not os.path.exists(body_path):
+            os.makedirs(os.path.dirname(body_path), exist_ok=True)
+            tmp_path = f"{body_path}.{threading.get_ident()}.tmp"
+            source.seek(0)
+            with open(tmp_path, "wb") as f:
+                shutil.copyfileobj(source, f, 1024 * 1024)
+            os.replace(tmp_path, body_path)
+            source.seek(0)
+
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO bodies (sha256, size, last_used_at) VALUES (?, ?, ?)",
+                    (sha256, size, now),
+                )
+                conn.execute(
+                    """INSERT OR REPLACE INTO responses
+                        (url, sha256, etag, last_modified, content_type, stored_at)
+                        VALUES (?, ?, ?, ?, ?, ?)""",
+                    (url, sha256, etag, last_modified, content_type, now),
+                )
+                removed = self._evict(conn)
+                conn.commit()
+            finally:
+                conn.close()
+        for path in removed:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def touch(self, url):
+        """Record a successful revalidation of url."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("UPDATE responses SET stored_at = ? WHERE url = ?", (time.time(), url))
+                conn.commit()
+            finally:
+                conn.close()
+
+    def _evict(self, conn):
+        """Drop least recently used bodies past max_bytes. Returns the file paths to delete."""
+        removed = []
+        if not self.max_bytes:
+            return removed
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()[0]
+        if total <= self.max_bytes:
+            return removed
+        for sha256, size in conn.execute("SELECT sha256, size FROM bodies ORDER BY last_used_at ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM bodies WHERE sha256 = ?", (sha256,))
+            conn.execute("DELETE FROM responses WHERE sha256 = ?", (sha256,))
+            removed.append(self._body_path(sha256))
+            total -= size
+        return removed
+
+    def stats(self):
+        with self._lock:
+            conn = self._connect()
+            try:
+                urls = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                bodies, total_size = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM bodies"
+                ).fetchone()
+            finally:
+                conn.close()
+        return {'urls': urls, 'bodies': bodies, 'total_size': total_size, 'max_bytes': self.max_bytes}
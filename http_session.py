@@ -0,0 +1,103 @@
+"""
+HTTP Session Module
+Shared keep-alive connection pools for outbound attachment downloads.
+Each thread gets its own requests.Session (sessions are not thread-safe),
+but every session mounts the same HTTPAdapter, so connections to a host are
+pooled and reused across threads
+"""
+
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP_CONNECT_RETRIES = int(os.getenv("HTTP_CONNECT_RETRIES", "3"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.5"))
+HTTP_RETRY_JITTER = float(os.getenv("HTTP_RETRY_JITTER", "0.5"))
+# Number of distinct hosts whose pools are kept, and connections kept per host.
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", "16"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", os.getenv("ATTACHMENT_PER_HOST_CONNECTIONS", "4")))
+
+HTTP_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+
+def _retry_policy():
+    """Retry only failures to connect: a request that reached the server is never replayed."""
+    options = dict(
+        total=None,
+        connect=HTTP_CONNECT_RETRIES,
+        read=0,
+        status=0,
+        other=0,
+        redirect=10,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        raise_on_status=False,
+    )
+    try:
+        return Retry(backoff_jitter=HTTP_RETRY_JITTER, **options)
+    except TypeError:
+        # urllib3 < 2 has no backoff_jitter.
+        return Retry(**options)
+
+
+_adapter = HTTPAdapter(
+    pool_connections=HTTP_POOL_HOSTS,
+    pool_maxsize=HTTP_POOL_MAXSIZE,
+    max_retries=_retry_policy(),
+)
+_local = threading.local()
+_metrics_lock = threading.Lock()
+_metrics = {'sessions_created': 0, 'requests': 0}
+
+
+def get_session():
+    """Return this thread's session, bound to the shared connection pools."""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.mount('http://', _adapter)
+        session.mount('https://', _adapter)
+        _local.session = session
+        with _metrics_lock:
+            _metrics['sessions_created'] += 1
+    return session
+
+
+def http_get(url, timeout=HTTP_TIMEOUT, **kwargs):
+    """requests.get through the pooled session, with the configured connect/read timeouts."""
+    with _metrics_lock:
+        _metrics['requests'] += 1
+    return get_session().get(url, timeout=timeout, **kwargs)
+
+
+def get_pool_metrics():
+    """Per-host pool usage: connections opened, requests served and idle connections."""
+    hosts = {}
+    pools = _adapter.poolmanager.pools
+    with pools.lock:
+        items = list(pools._container.items())
+    for key, pool in items:
+        hosts[f"{key.key_scheme}://{key.key_host}:{key.key_port}"] = {
+            'connections_opened': pool.num_connections,
+            'requests': pool.num_requests,
+            'idle_connections': pool.pool.qsize() if pool.pool is not None else 0,
+            'max_connections': pool.pool.maxsize if pool.pool is not None else HTTP_POOL_MAXSIZE,
+        }
+    with _metrics_lock:
+        totals = dict(_metrics)
+    opened = sum(h['connections_opened'] for h in hosts.values())
+    served = sum(h['requests'] for h in hosts.values())
+    return {
+        **totals,
+        'connections_opened': opened,
+        'connections_reused': max(0, served - opened),
+        'timeouts': {'connect': HTTP_CONNECT_TIMEOUT, 'read': HTTP_READ_TIMEOUT},
+        'connect_retries': HTTP_CONNECT_RETRIES,
+        'hosts': hosts,
+    }
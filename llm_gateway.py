@@ -0,0 +1,397 @@
+"""
+LLM Gateway Module
+Single OpenAI client shared by every module. Calls go through one bounded
+connection pool, a global and a per-feature concurrency cap, the adaptive
+per-model rate limiter, one retry/backoff policy and health-based model
+failover, and latency, tokens and errors are recorded per call site
+"""
+
+import os
+import time
+import random
+import threading
+from contextlib import contextmanager
+from openai import OpenAI
+from dotenv import load_dotenv
+
+from rate_limiter import limiter_for, retry_after_seconds
+import llm_metrics
+from schemas import StructuredOutputError, parse_reply, record, response_format, text_format
+from model_router import (
+    MODEL_ROUTER_ENABLED, CLOSED, CircuitOpenError, get_router, request_key, load_cached_answer, store_answer,
+)
+
+load_dotenv()
+
+# API root; point it at a local stub (see openai_stub.py) for load tests.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "16"))
+LLM_TIMEOUT_SECS = float(os.getenv("LLM_TIMEOUT_SECS", "600"))
+LLM_CONNECT_TIMEOUT_SECS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECS", "10"))
+# Calls in flight across the whole process, and per feature unless
+# LLM_FEATURE_CONCURRENCY overrides it ("extraction=8,quote=2").
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_DEFAULT_FEATURE_CONCURRENCY = int(os.getenv("LLM_DEFAULT_FEATURE_CONCURRENCY", "8"))
+LLM_FEATURE_CONCURRENCY = os.getenv("LLM_FEATURE_CONCURRENCY", "")
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "4"))
+LLM_BACKOFF_BASE_SECS = float(os.getenv("LLM_BACKOFF_BASE_SECS", "2"))
+LLM_BACKOFF_MAX_SECS = float(os.getenv("LLM_BACKOFF_MAX_SECS", "30"))
+# A reply that local repair cannot fix is sent alone (without the original
+# prompt) to this model to be corrected.
+SCHEMA_REPAIR_ENABLED = os.getenv("SCHEMA_REPAIR_ENABLED", "true").lower() == "true"
+SCHEMA_REPAIR_MODEL = os.getenv("SCHEMA_REPAIR_MODEL", "gpt-4o-mini")
+
+# Share of a latency budget the requested model gets before its fallback is tried.
+ROUTER_PRIMARY_BUDGET_SHARE = float(os.getenv("ROUTER_PRIMARY_BUDGET_SHARE", "0.6"))
+
+SCHEMA_REPAIR_PROMPT = """
+The JSON below was cut off or malformed, or does not match the required schema. Problems found: {problems}
+Return the corrected JSON object only. Keep every value that is already there; change only what is needed to make it valid and match the schema.
+
+JSON:
+"""
+
+
+class LatencyBudgetExceeded(Exception):
+    """A call could not be sent or retried within its call site's latency budget."""
+
+
+def _remaining(deadline):
+    """Seconds left until deadline (never negative), or None for no deadline."""
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+def _parse_limits(value):
+    limits = {}
+    for part in value.split(","):
+        if "=" in part:
+            name, limit = part.split("=", 1)
+            try:
+                limits[name.strip()] = max(1, int(limit))
+            except ValueError:
+                pass
+    return limits
+
+
+def _status_code(e):
+    return getattr(e, "status_code", None)
+
+
+def is_retryable(e):
+    """429s, 5xx responses, timeouts and connection failures are retried; anything else is not."""
+    status = _status_code(e)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(e).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def _error_kind(e):
+    status = _status_code(e)
+    if status == 429:
+        return "rate_limited"
+    if status is not None:
+        return "server_error" if status >= 500 else f"http_{status}"
+    if type(e).__name__ == "APITimeoutError":
+        return "timeout"
+    if type(e).__name__ == "APIConnectionError":
+        return "connection"
+    return type(e).__name__
+
+
+def _http_client():
+    """The SDK's HTTP client with bounded pool limits, or None to keep the SDK default."""
+    try:
+        import httpx
+    except ImportError:
+        return None
+    options = dict(
+        limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE),
+        timeout=httpx.Timeout(LLM_TIMEOUT_SECS, connect=LLM_CONNECT_TIMEOUT_SECS),
+    )
+    try:
+        from openai import DefaultHttpxClient
+        return DefaultHttpxClient(**options)
+    except ImportError:
+        # Older SDKs: a plain httpx client with the same pool limits.
+        return httpx.Client(follow_redirects=True, **options)
+
+
+class LLMGateway:
+    """
+    Owns the process's OpenAI client and every call made through it.
+
+    Call sites are named "feature.operation" (e.g. "quote.negotiation"):
+    concurrency is capped per feature and in total, and every call is
+    recorded in llm_metrics under its call site and model. The SDK's own
+    retries are disabled; call() retries 429s after the provider's
+    Retry-After (pausing every caller of that model) and
+    5xx/timeouts/connection errors with jittered exponential backoff, and
+    fails over between models through the model router.
+    """
+
+    def __init__(self, api_key=None, max_concurrency=LLM_MAX_CONCURRENCY,
+                 feature_concurrency=LLM_DEFAULT_FEATURE_CONCURRENCY, feature_limits=None,
+                 max_attempts=LLM_MAX_ATTEMPTS):
+        http_client = _http_client()
+        options = {"http_client": http_client} if http_client is not None else {"timeout": LLM_TIMEOUT_SECS}
+        self.client = OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"), base_url=OPENAI_BASE_URL,
+                             max_retries=0, **options)
+        if OPENAI_BASE_URL:
+            print(f"[llm-gateway] Using OpenAI API at {OPENAI_BASE_URL}", flush=True)
+        self.max_concurrency = max(1, max_concurrency)
+        self.feature_concurrency = max(1, feature_concurrency)
+        self.feature_limits = feature_limits if feature_limits is not None else _parse_limits(LLM_FEATURE_CONCURRENCY)
+        self.max_attempts = max(1, max_attempts)
+        self.router = get_router()
+        self._global = threading.BoundedSemaphore(self.max_concurrency)
+        self._features = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _feature_semaphore(self, feature):
+        with self._lock:
+            if feature not in self._features:
+                self._features[feature] = threading.BoundedSemaphore(
+                    self.feature_limits.get(feature, self.feature_concurrency))
+            return self._features[feature]
+
+    @contextmanager
+    def _slot(self, call_site, deadline=None):
+        """
+        Hold a feature slot and a global slot. Yields the seconds spent waiting
+        for them; raises LatencyBudgetExceeded if none frees up before deadline.
+        """
+        feature = call_site.split(".", 1)[0]
+        feature_semaphore = self._feature_semaphore(feature)
+        started = time.monotonic()
+        if not feature_semaphore.acquire(timeout=_remaining(deadline)):
+            raise LatencyBudgetExceeded(f"{call_site}: no {feature} slot free within the latency budget")
+        try:
+            if not self._global.acquire(timeout=_remaining(deadline)):
+                raise LatencyBudgetExceeded(f"{call_site}: no LLM slot free within the latency budget")
+            try:
+                with self._lock:
+                    self._in_flight[feature] = self._in_flight.get(feature, 0) + 1
+                try:
+                    yield time.monotonic() - started
+                finally:
+                    with self._lock:
+                        self._in_flight[feature] -= 1
+            finally:
+                self._global.release()
+        finally:
+            feature_semaphore.release()
+
+    def _backoff_wait(self, e, attempt):
+        if _status_code(e) == 429:
+            headers = getattr(getattr(e, "response", None), "headers", None)
+            wait = retry_after_seconds(headers)
+            return wait if wait is not None else min(2 ** attempt, LLM_BACKOFF_MAX_SECS)
+        wait = min(LLM_BACKOFF_BASE_SECS * 2 ** attempt, LLM_BACKOFF_MAX_SECS)
+        return wait * random.uniform(0.5, 1.0)
+
+    def call(self, call_site, endpoint, **kwargs):
+        """
+        Make one API request through the gateway and return the parsed response.
+
+        endpoint is "chat" (chat.completions.create) or "responses"
+        (responses.create); kwargs are passed through and must include model.
+
+        With the model router enabled, a model whose circuit is open is
+        skipped for its fallback, and a retryable failure of one model fails
+        over to the next. Call sites with a latency budget share it between
+        the models tried and, when none answers, serve the last good answer to
+        the same request. Raises the last error (or CircuitOpenError) when
+        nothing can answer, and non-retryable errors immediately.
+        """
+        model = kwargs.get("model")
+        if not MODEL_ROUTER_ENABLED:
+            return self._call_model(call_site, endpoint, kwargs)
+
+        budget = self.router.latency_budget(call_site)
+        deadline = time.monotonic() + budget if budget is not None else None
+        cache_key = request_key(endpoint, kwargs) if budget is not None else None
+        candidates = self.router.candidates(call_site, model)
+
+        last_error = None
+        for index, candidate in enumerate(candidates):
+            health = self.router.health(candidate)
+            if not health.allow():
+                continue
+            attempt_deadline = deadline
+            if deadline is not None and index < len(candidates) - 1:
+                # Leave part of the budget for the fallbacks.
+                attempt_deadline = time.monotonic() + _remaining(deadline) * ROUTER_PRIMARY_BUDGET_SHARE
+            try:
+                response = self._call_model(call_site, endpoint, dict(kwargs, model=candidate),
+                                            attempt_deadline, health)
+            except Exception as e:
+                if not (is_retryable(e) or isinstance(e, LatencyBudgetExceeded)):
+                    raise
+                last_error = e
+                continue
+            if candidate != model:
+                self.router.served_fallback()
+                print(f"[llm-gateway] {call_site}: answered by fallback model {candidate} instead of {model}", flush=True)
+            if cache_key:
+                store_answer(cache_key, response)
+            return response
+
+        cached = load_cached_answer(endpoint, cache_key) if cache_key else None
+        if cached is not None:
+            self.router.served_cached()
+            print(f"[llm-gateway] {call_site}: no model available, serving the cached answer", flush=True)
+            return cached
+        self.router.rejected()
+        if last_error is not None:
+            raise last_error
+        raise CircuitOpenError(call_site, candidates)
+
+    def _call_model(self, call_site, endpoint, kwargs, deadline=None, health=None):
+        """
+        One model's retry ladder. Retries stop early when the next wait would
+        pass the deadline or the model's circuit has opened; each request's
+        outcome is recorded in the model's health.
+        """
+        model = kwargs.get("model")
+        limiter = limiter_for(model)
+        create = (self.client.chat.completions if endpoint == "chat" else self.client.responses).with_raw_response.create
+
+        call_started = time.monotonic()
+        waited = 0.0
+        for attempt in range(self.max_attempts):
+            elapsed = None
+            try:
+                with self._slot(call_site, deadline) as slot_wait:
+                    limiter_wait = limiter.acquire(timeout=_remaining(deadline))
+                    if limiter_wait is None:
+                        raise LatencyBudgetExceeded(f"{call_site}: {model} is rate limited past the latency budget")
+                    waited += slot_wait + limiter_wait
+                    if deadline is not None:
+                        kwargs["timeout"] = max(1.0, _remaining(deadline))
+                    started = time.monotonic()
+                    raw_response = create(**kwargs)
+                    elapsed = time.monotonic() - started
+                limiter.update_from_headers(raw_response.headers)
+                response = raw_response.parse()
+            except Exception as e:
+                kind = _error_kind(e)
+                if health is not None:
+                    if is_retryable(e) and _status_code(e) != 429:
+                        health.record(None, ok=False)
+                    else:
+                        # Caller errors and throttling say nothing about the model's health.
+                        health.release_probe()
+                llm_metrics.record_error(call_site, model, kind)
+                wait = self._backoff_wait(e, attempt) if is_retryable(e) else None
+                if (wait is None or attempt >= self.max_attempts - 1
+                        or (deadline is not None and time.monotonic() + wait >= deadline)
+                        or (health is not None and health.state != CLOSED)):
+                    llm_metrics.record_call(call_site, model, call_latency=time.monotonic() - call_started,
+                                            queue_wait=waited, retries=attempt, error=kind)
+                    raise
+                if _status_code(e) == 429:
+                    # The whole model's quota is exhausted, not just this call's.
+                    limiter_for(model).pause(wait)
+                else:
+                    time.sleep(wait)
+                print(f"[llm-gateway] {call_site}: {kind}, retrying in {wait:.1f}s "
+                      f"(attempt {attempt + 1}/{self.max_attempts})", flush=True)
+                continue
+
+            if health is not None:
+                health.record(elapsed, ok=True)
+            prompt_tokens, completion_tokens = llm_metrics.usage_tokens(response)
+            llm_metrics.record_call(call_site, model, prompt_tokens, completion_tokens, request_latency=elapsed,
+                                    call_latency=time.monotonic() - call_started, queue_wait=waited,
+                                    retries=attempt)
+            return response
+
+    def chat(self, call_site, **kwargs):
+        """chat.completions.create through the gateway."""
+        return self.call(call_site, "chat", **kwargs)
+
+    def responses(self, call_site, **kwargs):
+        """responses.create through the gateway."""
+        return self.call(call_site, "responses", **kwargs)
+
+    def chat_json(self, call_site, schema, **kwargs):
+        """
+        chat.completions.create in structured-output mode for a registered
+        schema; returns the parsed, validated reply (see parse_reply).
+        Raises StructuredOutputError when the reply cannot be repaired.
+        """
+        response = self.chat(call_site, response_format=response_format(schema), **kwargs)
+        message = response.choices[0].message
+        return self._parse_json(call_site, schema, message.content or getattr(message, "refusal", None) or "")
+
+    def responses_json(self, call_site, schema, **kwargs):
+        """responses.create in structured-output mode; see chat_json."""
+        response = self.responses(call_site, text=text_format(schema), **kwargs)
+        return self._parse_json(call_site, schema, response.output_text or "")
+
+    def _parse_json(self, call_site, schema, text):
+        try:
+            return parse_reply(schema, text, call_site)
+        except StructuredOutputError as e:
+            # Prose (e.g. a refusal) has nothing to repair; only near-JSON is sent.
+            if not SCHEMA_REPAIR_ENABLED or "{" not in text:
+                record(call_site, "failures")
+                raise
+            problems = "; ".join(e.errors[:10]) or str(e)
+            print(f"[llm-gateway] {call_site}: unrepairable reply ({problems[:200]}); asking {SCHEMA_REPAIR_MODEL} to fix it", flush=True)
+            failure = e
+
+        try:
+            response = self.chat(
+                f"{call_site}.repair",
+                model=SCHEMA_REPAIR_MODEL,
+                response_format=response_format(schema),
+                messages=[{"role": "user", "content": SCHEMA_REPAIR_PROMPT.replace("{problems}", problems) + text}],
+                temperature=0,
+            )
+            value = parse_reply(schema, response.choices[0].message.content or "")
+        except Exception as e:
+            record(call_site, "failures")
+            raise StructuredOutputError(f"{failure} (repair failed: {e})", raw=text, errors=failure.errors)
+        record(call_site, "model_repairs")
+        return value
+
+    def metrics(self):
+        """Per-call-site statistics (see llm_metrics.snapshot), per-feature rollups and current concurrency."""
+        sites = llm_metrics.snapshot()
+        with self._lock:
+            in_flight = dict(self._in_flight)
+            features = set(self._features)
+        rollup = {}
+        for feature in features | {site["call_site"].split(".", 1)[0] for site in sites}:
+            rollup[feature] = {
+                "calls": 0, "succeeded": 0, "failed": 0, "retries": 0, "total_tokens": 0,
+                "in_flight": in_flight.get(feature, 0),
+                "concurrency_limit": self.feature_limits.get(feature, self.feature_concurrency),
+            }
+        for site in sites:
+            feature = rollup[site["call_site"].split(".", 1)[0]]
+            for key in ("calls", "succeeded", "failed", "retries", "total_tokens"):
+                feature[key] += site[key]
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": sum(in_flight.values()),
+            "pool": {"max_connections": LLM_MAX_CONNECTIONS, "max_keepalive": LLM_MAX_KEEPALIVE},
+            "features": rollup,
+            "call_sites": sites,
+        }
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """Return the process-wide gateway, creating it on first use."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
@@ -0,0 +1,358 @@
+"""
+LLM Metrics Module
+Instrumentation for every OpenAI call made through the gateway. Calls are
+tagged with their call site and model; counters and histograms are kept in
+memory for the metrics endpoint (Prometheus text format), and each call is
+also written to a rolling SQLite table for longer-range questions about
+cost and tail latency
+"""
+
+import os
+import time
+import queue
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+from cache_store import CACHE_DIR
+
+load_dotenv()
+
+LLM_METRICS_DB = os.getenv("LLM_METRICS_DB", os.path.join(CACHE_DIR, "llm_metrics.db"))
+LLM_METRICS_RETENTION_HOURS = float(os.getenv("LLM_METRICS_RETENTION_HOURS", "168"))
+LLM_METRICS_TABLE_ENABLED = os.getenv("LLM_METRICS_TABLE_ENABLED", "true").lower() == "true"
+
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+TOKEN_BUCKETS = (100, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000)
+
+_PRUNE_EVERY_SECS = 600
+_WRITE_BATCH = 200
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket it falls in."""
+        if not self.count:
+            return None
+        target = q * self.count
+        running = 0
+        for i, bound in enumerate(self.buckets):
+            running += self.counts[i]
+            if running >= target:
+                return bound
+        return float("inf")
+
+    def cumulative(self):
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            running += count
+            yield bound, running
+
+
+class _Series:
+    """Counters and histograms for one (call site, model) pair."""
+
+    def __init__(self):
+        self.calls = 0
+        self.failed = 0
+        self.retries = 0
+        self.errors = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.queue_wait = 0.0
+        self.request_latency = Histogram(LATENCY_BUCKETS)
+        self.call_latency = Histogram(LATENCY_BUCKETS)
+        self.prompt_token_sizes = Histogram(TOKEN_BUCKETS)
+        self.completion_token_sizes = Histogram(TOKEN_BUCKETS)
+
+
+_series = {}
+_lock = threading.Lock()
+_rows = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def usage_tokens(response):
+    """(prompt, completion) tokens of a response; the Responses API calls them input/output."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return 0, 0
+    prompt = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", 0) or 0
+    return prompt, completion
+
+
+def record_call(call_site, model, prompt_tokens=0, completion_tokens=0, request_latency=None,
+                call_latency=0.0, queue_wait=0.0, retries=0, error=None):
+    """
+    Record one finished gateway call.
+
+    request_latency is the successful API request alone; call_latency is what
+    the caller waited, including concurrency/rate-limit queueing and retries.
+    error is the kind of the final error for a failed call.
+    """
+    with _lock:
+        series = _series.get((call_site, model))
+        if series is None:
+            series = _series[(call_site, model)] = _Series()
+        series.calls += 1
+        series.retries += retries
+        series.queue_wait += queue_wait
+        series.call_latency.observe(call_latency)
+        if error:
+            series.failed += 1
+        else:
+            series.prompt_tokens += prompt_tokens
+            series.completion_tokens += completion_tokens
+            series.prompt_token_sizes.observe(prompt_tokens)
+            series.completion_token_sizes.observe(completion_tokens)
+            if request_latency is not None:
+                series.request_latency.observe(request_latency)
+
+    if LLM_METRICS_TABLE_ENABLED:
+        _rows.put((time.time(), call_site, model, prompt_tokens, completion_tokens,
+                   request_latency, call_latency, queue_wait, retries, error))
+        _ensure_writer()
+
+
+def record_error(call_site, model, kind):
+    """Count one failed attempt (retried or not) by error kind."""
+    with _lock:
+        series = _series.get((call_site, model))
+        if series is None:
+            series = _series[(call_site, model)] = _Series()
+        series.errors[kind] = series.errors.get(kind, 0) + 1
+
+
+# ============== Rolling SQLite table ==============
+
+def _connect():
+    os.makedirs(os.path.dirname(LLM_METRICS_DB), exist_ok=True)
+    conn = sqlite3.connect(LLM_METRICS_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS llm_calls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts REAL NOT NULL,
+            call_site TEXT NOT NULL,
+            model TEXT,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            request_latency REAL,
+            call_latency REAL NOT NULL,
+            queue_wait REAL NOT NULL DEFAULT 0,
+            retries INTEGER NOT NULL DEFAULT 0,
+            error TEXT
+        )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_calls_ts ON llm_calls (ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_calls_site_ts ON llm_calls (call_site, ts)")
+    return conn
+
+
+def _write_loop():
+    """Batch queued rows into llm_calls and drop rows past the retention window."""
+    conn = None
+    last_prune = 0.0
+    while True:
+        rows = [_rows.get()]
+        while len(rows) < _WRITE_BATCH:
+            try:
+                rows.append(_rows.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            if conn is None:
+                conn = _connect()
+            conn.executemany(
+                """INSERT INTO llm_calls (ts, call_site, model, prompt_tokens, completion_tokens,
+                    request_latency, call_latency, queue_wait, retries, error)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                rows,
+            )
+            if time.time() - last_prune > _PRUNE_EVERY_SECS:
+                conn.execute("DELETE FROM llm_calls WHERE ts < ?",
+                             (time.time() - LLM_METRICS_RETENTION_HOURS * 3600,))
+                last_prune = time.time()
+            conn.commit()
+        except Exception as e:
+            print(f"[llm-metrics] Could not write {len(rows)} call record(s): {e}", flush=True)
+            if conn is not None:
+                conn.close()
+            conn = None
+        finally:
+            for _ in rows:
+                _rows.task_done()
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_write_loop, name="llm-metrics-writer", daemon=True)
+                _writer.start()
+
+
+def flush(timeout=5.0):
+    """Wait (up to timeout seconds) until queued call records are written."""
+    deadline = time.monotonic() + timeout
+    while _rows.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def query_calls(hours=24, call_site=None):
+    """
+    Aggregate the rolling table over the last `hours`, per call site and
+    model: calls, errors, retries, tokens and p50/p95/max latency.
+    """
+    flush()
+    since = time.time() - hours * 3600
+    sql = ("SELECT call_site, model, prompt_tokens, completion_tokens, request_latency, call_latency, "
+           "retries, error FROM llm_calls WHERE ts >= ?")
+    params = [since]
+    if call_site:
+        sql += " AND call_site = ?"
+        params.append(call_site)
+    conn = _connect()
+    try:
+        rows = conn.execute(sql + " ORDER BY call_site, model", params).fetchall()
+    finally:
+        conn.close()
+
+    groups = {}
+    for site, model, prompt, completion, request_latency, call_latency, retries, error in rows:
+        group = groups.setdefault((site, model), {
+            "call_site": site, "model": model, "calls": 0, "errors": 0, "retries": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "_latencies": [],
+        })
+        group["calls"] += 1
+        group["retries"] += retries
+        group["prompt_tokens"] += prompt
+        group["completion_tokens"] += completion
+        if error:
+            group["errors"] += 1
+        group["_latencies"].append(call_latency)
+
+    results = []
+    for group in groups.values():
+        latencies = sorted(group.pop("_latencies"))
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3)
+
+        group.update(
+            total_tokens=group["prompt_tokens"] + group["completion_tokens"],
+            error_rate=round(group["errors"] / group["calls"], 4),
+            latency_p50=percentile(0.5),
+            latency_p95=percentile(0.95),
+            latency_max=round(latencies[-1], 3),
+        )
+        results.append(group)
+    results.sort(key=lambda g: g["total_tokens"], reverse=True)
+    return results
+
+
+# ============== Exposition ==============
+
+def snapshot():
+    """In-memory counters per call site and model, with histogram quantile estimates."""
+    with _lock:
+        items = list(_series.items())
+        result = []
+        for (call_site, model), s in items:
+            result.append({
+                "call_site": call_site,
+                "model": model,
+                "calls": s.calls,
+                "succeeded": s.calls - s.failed,
+                "failed": s.failed,
+                "retries": s.retries,
+                "errors": dict(s.errors),
+                "prompt_tokens": s.prompt_tokens,
+                "completion_tokens": s.completion_tokens,
+                "total_tokens": s.prompt_tokens + s.completion_tokens,
+                "queue_wait_total": round(s.queue_wait, 3),
+                "request_latency_p50": s.request_latency.quantile(0.5),
+                "request_latency_p95": s.request_latency.quantile(0.95),
+                "call_latency_p95": s.call_latency.quantile(0.95),
+                "call_latency_avg": round(s.call_latency.sum / s.call_latency.count, 3) if s.call_latency.count else None,
+            })
+    return result
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{_label_value(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else f"{bound:g}"
+
+
+def render_prometheus():
+    """All LLM counters and histograms in the Prometheus text exposition format."""
+    counters = [
+        ("llm_calls_total", "Gateway calls finished, by outcome.", []),
+        ("llm_retries_total", "Attempts retried after a retryable error.", []),
+        ("llm_errors_total", "Failed attempts, by error kind.", []),
+        ("llm_tokens_total", "Tokens billed, by direction.", []),
+        ("llm_queue_wait_seconds_total", "Time spent waiting for concurrency slots and rate limits.", []),
+    ]
+    histograms = [
+        ("llm_request_duration_seconds", "Latency of successful API requests.", []),
+        ("llm_call_duration_seconds", "Latency seen by the caller, including queueing and retries.", []),
+        ("llm_prompt_tokens", "Prompt tokens per successful call.", []),
+        ("llm_completion_tokens", "Completion tokens per successful call.", []),
+    ]
+    with _lock:
+        for (call_site, model), s in _series.items():
+            base = dict(call_site=call_site, model=model or "")
+            counters[0][2].append((_labels(**base, outcome="success"), s.calls - s.failed))
+            counters[0][2].append((_labels(**base, outcome="error"), s.failed))
+            counters[1][2].append((_labels(**base), s.retries))
+            for kind, count in s.errors.items():
+                counters[2][2].append((_labels(**base, kind=kind), count))
+            counters[3][2].append((_labels(**base, direction="prompt"), s.prompt_tokens))
+            counters[3][2].append((_labels(**base, direction="completion"), s.completion_tokens))
+            counters[4][2].append((_labels(**base), round(s.queue_wait, 6)))
+            for (name, _, samples), histogram in zip(histograms, (s.request_latency, s.call_latency,
+                                                                   s.prompt_token_sizes, s.completion_token_sizes)):
+                samples.append((base, list(histogram.cumulative()), histogram.sum, histogram.count))
+
+    lines = []
+    for name, help_text, samples in counters:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        lines.extend(f"{name}{labels} {value}" for labels, value in samples)
+    for name, help_text, samples in histograms:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for base, buckets, total, count in samples:
+            for bound, cumulative in buckets:
+                lines.append(f"{name}_bucket{_labels(**base, le=_format_bound(bound))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(**base)} {round(total, 6)}")
+            lines.append(f"{name}_count{_labels(**base)} {count}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,328 @@
+"""
+Model Router Module
+Health-aware model selection for the LLM gateway. Each model's rolling p95
+latency and error rate are tracked; a model that keeps failing has its
+circuit opened and calls fail over to a configured fallback model (or the
+last good answer to the same request) until a half-open probe succeeds.
+Interactive call sites get a latency budget that bounds retries and routes
+around a model that is currently too slow
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+from cache_store import SqliteCache
+
+load_dotenv()
+
+MODEL_ROUTER_ENABLED = os.getenv("MODEL_ROUTER_ENABLED", "true").lower() == "true"
+# "primary=fallback" pairs, tried in order when the primary is unavailable.
+MODEL_FALLBACKS = os.getenv("MODEL_FALLBACKS", "gpt-4o=gpt-4o-mini")
+# Seconds a call site may take end to end, by call site or feature
+# ("chat.message=20,summary.merge=120"). Only interactive call sites should
+# have one: a feature-wide budget also covers its bulk/offline callers, which
+# would fall back to a weaker model instead of waiting. Sites without one may
+# use the full retry ladder.
+ROUTE_LATENCY_BUDGETS = os.getenv("ROUTE_LATENCY_BUDGETS", "chat.message=20")
+
+ROUTER_WINDOW_SECS = float(os.getenv("ROUTER_WINDOW_SECS", "300"))
+ROUTER_WINDOW_MAX_SAMPLES = int(os.getenv("ROUTER_WINDOW_MAX_SAMPLES", "500"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "10"))
+ROUTER_ERROR_RATE_THRESHOLD = float(os.getenv("ROUTER_ERROR_RATE_THRESHOLD", "0.5"))
+# Consecutive failures that open the circuit before the window has enough samples.
+ROUTER_CONSECUTIVE_FAILURES = int(os.getenv("ROUTER_CONSECUTIVE_FAILURES", "5"))
+ROUTER_OPEN_SECS = float(os.getenv("ROUTER_OPEN_SECS", "30"))
+ROUTER_MAX_OPEN_SECS = float(os.getenv("ROUTER_MAX_OPEN_SECS", "300"))
+
+# Last good answer per request for budgeted call sites, served when every
+# model for the request is unavailable.
+FALLBACK_CACHE_ENABLED = os.getenv("FALLBACK_CACHE_ENABLED", "true").lower() == "true"
+fallback_cache = SqliteCache(
+    "llm_fallback_cache.db",
+    table="answers",
+    ttl_seconds=int(os.getenv("FALLBACK_CACHE_TTL_HOURS", "24")) * 3600,
+    max_entries=int(os.getenv("FALLBACK_CACHE_MAX_ENTRIES", "2000")),
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Degraded-answer counts for the run the current call belongs to (see track_degraded).
+_run_degraded = contextvars.ContextVar("run_degraded", default=None)
+
+
+class CircuitOpenError(Exception):
+    """No model for a call is available and there is no cached answer to serve."""
+
+    def __init__(self, call_site, models):
+        super().__init__(f"{call_site}: circuit open for {', '.join(models)} and no cached answer")
+        self.call_site = call_site
+        self.models = models
+
+
+def _parse_pairs(value, convert):
+    pairs = {}
+    for part in value.split(","):
+        if "=" in part:
+            name, item = part.split("=", 1)
+            try:
+                pairs[name.strip()] = convert(item.strip())
+            except ValueError:
+                pass
+    return pairs
+
+
+class ModelHealth:
+    """
+    Rolling latency/error window and circuit breaker for one model.
+
+    The circuit opens when the window's error rate reaches the threshold
+    (with enough samples) or after a run of consecutive failures. After
+    open_secs one caller is let through as a half-open probe: success closes
+    the circuit, failure reopens it for twice as long (up to max_open_secs).
+    """
+
+    def __init__(self, model, window_secs=ROUTER_WINDOW_SECS, min_samples=ROUTER_MIN_SAMPLES,
+                 error_rate_threshold=ROUTER_ERROR_RATE_THRESHOLD,
+                 consecutive_failures=ROUTER_CONSECUTIVE_FAILURES, open_secs=ROUTER_OPEN_SECS):
+        self.model = model
+        self.window_secs = window_secs
+        self.min_samples = min_samples
+        self.error_rate_threshold = error_rate_threshold
+        self.consecutive_failures = consecutive_failures
+        self.base_open_secs = open_secs
+        self.open_secs = open_secs
+        self.state = CLOSED
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.failure_streak = 0
+        self.times_opened = 0
+        self._samples = deque(maxlen=ROUTER_WINDOW_MAX_SAMPLES)  # (timestamp, latency or None, ok)
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        while self._samples and self._samples[0][0] < now - self.window_secs:
+            self._samples.popleft()
+
+    def _open(self, now, reason):
+        self.state = OPEN
+        self.opened_at = now
+        self.times_opened += 1
+        print(f"[model-router] {self.model}: circuit opened ({reason}) for {self.open_secs:.0f}s", flush=True)
+
+    def allow(self):
+        """Whether a call may go to this model now. Claims the probe when half-open."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_secs:
+                self.state = HALF_OPEN
+                self.probe_in_flight = False
+            if self.state == HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            return False
+
+    def record(self, latency, ok):
+        """
+        Record one request: its latency on success, or a provider-side failure
+        (5xx, timeout, connection error). 429s are not failures here; the rate
+        limiter handles throttling.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._samples.append((now, latency if ok else None, ok))
+            self._trim(now)
+            self.failure_streak = 0 if ok else self.failure_streak + 1
+
+            if self.state == HALF_OPEN:
+                self.probe_in_flight = False
+                if ok:
+                    self.state = CLOSED
+                    self.open_secs = self.base_open_secs
+                    # Start fresh so the errors that opened the circuit do not reopen it.
+                    self._samples.clear()
+                    self.failure_streak = 0
+                    print(f"[model-router] {self.model}: probe succeeded, circuit closed", flush=True)
+                else:
+                    self.open_secs = min(self.open_secs * 2, ROUTER_MAX_OPEN_SECS)
+                    self._open(now, "probe failed")
+                return
+            if self.state != CLOSED or ok:
+                return
+
+            errors = sum(1 for _, _, sample_ok in self._samples if not sample_ok)
+            if len(self._samples) >= self.min_samples and errors / len(self._samples) >= self.error_rate_threshold:
+                self._open(now, f"{errors}/{len(self._samples)} errors in {self.window_secs:.0f}s")
+            elif self.failure_streak >= self.consecutive_failures:
+                self._open(now, f"{self.failure_streak} consecutive failures")
+
+    def release_probe(self):
+        """Give up a claimed probe without a result (e.g. a caller error), so another caller may probe."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.probe_in_flight = False
+
+    def p95(self):
+        """Rolling p95 of successful request latency, or None with too few samples."""
+        with self._lock:
+            self._trim(time.monotonic())
+            latencies = sorted(latency for _, latency, ok in self._samples if ok)
+        if len(latencies) < self.min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+    def status(self):
+        p95 = self.p95()
+        with self._lock:
+            samples = len(self._samples)
+            errors = sum(1 for _, _, ok in self._samples if not ok)
+            return {
+                "model": self.model,
+                "state": self.state,
+                "samples": samples,
+                "error_rate": round(errors / samples, 3) if samples else 0.0,
+                "p95_latency": round(p95, 3) if p95 is not None else None,
+                "failure_streak": self.failure_streak,
+                "times_opened": self.times_opened,
+                "reopens_in": (round(max(0.0, self.opened_at + self.open_secs - time.monotonic()), 1)
+                               if self.state == OPEN else None),
+            }
+
+
+class ModelRouter:
+    """Chooses the models to try for a call and keeps per-model health."""
+
+    def __init__(self, fallbacks=None, latency_budgets=None):
+        self.fallbacks = fallbacks if fallbacks is not None else _parse_pairs(MODEL_FALLBACKS, str)
+        self.latency_budgets = (latency_budgets if latency_budgets is not None
+                                else _parse_pairs(ROUTE_LATENCY_BUDGETS, float))
+        self._health = {}
+        self._lock = threading.Lock()
+        self._counters = {"fallback_answers": 0, "cached_answers": 0, "rejected": 0, "slow_reroutes": 0}
+
+    def health(self, model):
+        with self._lock:
+            if model not in self._health:
+                self._health[model] = ModelHealth(model)
+            return self._health[model]
+
+    def _count(self, name):
+        run = _run_degraded.get()
+        with self._lock:
+            self._counters[name] += 1
+            if run is not None and name in run:
+                run[name] += 1
+
+    def latency_budget(self, call_site):
+        """Seconds allowed for a call site, matched by full name then feature; None for no budget."""
+        if call_site in self.latency_budgets:
+            return self.latency_budgets[call_site]
+        return self.latency_budgets.get(call_site.split(".", 1)[0])
+
+    def candidates(self, call_site, model):
+        """
+        Models to try for a call, in order: the requested model and then its
+        fallback chain. For a budgeted call site the fallback goes first while
+        the requested model's p95 alone would exceed the budget.
+        """
+        models = [model]
+        while self.fallbacks.get(models[-1]) and self.fallbacks[models[-1]] not in models:
+            models.append(self.fallbacks[models[-1]])
+        budget = self.latency_budget(call_site)
+        if budget is not None and len(models) > 1:
+            p95 = self.health(model).p95()
+            if p95 is not None and p95 > budget:
+                self._count("slow_reroutes")
+                models = models[1:] + models[:1]
+        return models
+
+    def served_fallback(self):
+        self._count("fallback_answers")
+
+    def served_cached(self):
+        self._count("cached_answers")
+
+    def rejected(self):
+        self._count("rejected")
+
+    def status(self):
+        with self._lock:
+            models = list(self._health.values())
+            counters = dict(self._counters)
+        return {
+            "enabled": MODEL_ROUTER_ENABLED,
+            "fallbacks": self.fallbacks,
+            "latency_budgets": self.latency_budgets,
+            "models": [health.status() for health in models],
+            **counters,
+        }
+
+
+@contextmanager
+def track_degraded():
+    """
+    Count the answers served by a fallback model or from the fallback cache
+    to calls made inside the block, and only those: concurrent runs keep
+    their own counts. Yields {"fallback_answers", "cached_answers"}.
+
+    Worker threads count toward the block when their work is submitted with
+    contextvars.copy_context().run, which carries the counts along.
+    """
+    run = {"fallback_answers": 0, "cached_answers": 0}
+    token = _run_degraded.set(run)
+    try:
+        yield run
+    finally:
+        _run_degraded.reset(token)
+
+
+def request_key(endpoint, kwargs):
+    """Cache key for a request's content, independent of the model it was sent to."""
+    content = {k: v for k, v in kwargs.items() if k not in ("model", "timeout")}
+    return hashlib.sha256(json.dumps([endpoint, content], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def load_cached_answer(endpoint, key):
+    """The stored response for a request key, rebuilt as the SDK's response type, or None."""
+    if not FALLBACK_CACHE_ENABLED:
+        return None
+    data = fallback_cache.get(key)
+    if data is None:
+        return None
+    if endpoint == "chat":
+        from openai.types.chat import ChatCompletion
+        return ChatCompletion.model_validate(data)
+    from openai.types.responses import Response
+    return Response.model_validate(data)
+
+
+def store_answer(key, response):
+    if not FALLBACK_CACHE_ENABLED:
+        return
+    try:
+        data = response.model_dump(mode="json")
+        fallback_cache.set(key, data, size=len(json.dumps(data)))
+    except Exception as e:
+        print(f"[model-router] Could not cache answer: {e}", flush=True)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Return the process-wide router, creating it on first use."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter()
+        return _router
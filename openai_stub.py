@@ -0,0 +1,400 @@
+"""
+OpenAI Stub Server
+Local stand-in for the OpenAI endpoints the app uses (/v1/responses,
+/v1/files and /v1/chat/completions), for load tests that must not depend on
+the live API. Requests are answered from recorded fixtures; a request with
+no fixture gets a synthesized reply that satisfies the requested JSON schema.
+Latency is drawn from a configurable distribution per endpoint, and 429s and
+500s can be injected at a given rate.
+
+Usage:
+    python openai_stub.py [--port 8090] [--fixtures DIR] [--record] [--seed N]
+
+Point the app (or bulk_analysis.py --base-url) at it with
+    OPENAI_BASE_URL=http://localhost:8090/v1
+
+--record forwards fixture misses to the real API (OPENAI_STUB_UPSTREAM, with
+OPENAI_API_KEY) and saves the replies as fixtures for later replay.
+
+Latency specs (STUB_LATENCY, or per endpoint STUB_LATENCY_RESPONSES,
+STUB_LATENCY_CHAT, STUB_LATENCY_FILES) are "fixed:SECS", "uniform:LO:HI",
+"normal:MEAN:SD" or "lognormal:MEDIAN:SIGMA". GET /stub/stats reports
+counters; POST /stub/config changes latency and error rates while running
+(e.g. {"error_rate_429": 0.2} to simulate a provider incident).
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from collections import deque
+from flask import Flask, request, jsonify
+from dotenv import load_dotenv
+
+from token_budget import count_tokens
+
+load_dotenv()
+
+STUB_FIXTURES_DIR = os.getenv("STUB_FIXTURES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_fixtures"))
+OPENAI_STUB_UPSTREAM = os.getenv("OPENAI_STUB_UPSTREAM", "https://api.openai.com/v1")
+# "synthesize" answers fixture misses with a schema-shaped default reply;
+# "error" fails them with a 400, to catch requests a fixture set does not cover.
+STUB_ON_MISS = os.getenv("STUB_ON_MISS", "synthesize")
+
+STUB_DEFAULTS = {
+    "latency": os.getenv("STUB_LATENCY", "lognormal:1.0:0.5"),
+    "latency_responses": os.getenv("STUB_LATENCY_RESPONSES", ""),
+    "latency_chat": os.getenv("STUB_LATENCY_CHAT", ""),
+    "latency_files": os.getenv("STUB_LATENCY_FILES", "fixed:0.1"),
+    # Added per output token, so long replies take longer like real generation.
+    "secs_per_output_token": float(os.getenv("STUB_SECS_PER_OUTPUT_TOKEN", "0")),
+    "error_rate_429": float(os.getenv("STUB_ERROR_RATE_429", "0")),
+    "error_rate_500": float(os.getenv("STUB_ERROR_RATE_500", "0")),
+    "retry_after_secs": float(os.getenv("STUB_RETRY_AFTER_SECS", "1")),
+    # Requests per minute before real 429s, like an account limit; 0 for none.
+    "requests_per_minute": int(os.getenv("STUB_REQUESTS_PER_MINUTE", "0")),
+}
+
+# Request fields that do not change the reply and are left out of fixture keys.
+_UNKEYED_FIELDS = ("user", "metadata", "store", "stream", "service_tier")
+# Parameters each latency distribution takes.
+_LATENCY_PARAMS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+
+
+def parse_latency(spec):
+    """Parse a latency spec into a sampler(rng) -> seconds. An empty spec returns None."""
+    if not spec:
+        return None
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(":") if v]
+    if kind in _LATENCY_PARAMS and len(values) != _LATENCY_PARAMS[kind]:
+        raise ValueError(f"{kind} latency takes {_LATENCY_PARAMS[kind]} parameter(s): {spec}")
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def _schema_default(schema, defs=None):
+    """The smallest value that satisfies a JSON schema: empty strings, zeros, empty lists, null when allowed."""
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return _schema_default(defs.get(schema["$ref"].rsplit("/", 1)[-1], {}), defs)
+    if "anyOf" in schema:
+        return _schema_default(schema["anyOf"][0], defs)
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type", "object" if "properties" in schema else "null")
+    if isinstance(kind, list):
+        if "null" in kind:
+            return None
+        kind = kind[0]
+    if kind == "object":
+        return {name: _schema_default(prop, defs) for name, prop in schema.get("properties", {}).items()}
+    return {"array": [], "string": "", "number": 0, "integer": 0, "boolean": False, "null": None}.get(kind)
+
+
+def _requested_schema(endpoint, body):
+    """The JSON schema a request asks the reply to follow, {} for plain JSON mode, or None for text."""
+    if endpoint == "chat":
+        fmt = body.get("response_format") or {}
+        if fmt.get("type") == "json_schema":
+            return fmt.get("json_schema", {}).get("schema", {})
+    else:
+        fmt = (body.get("text") or {}).get("format") or {}
+        if fmt.get("type") == "json_schema":
+            return fmt.get("schema", {})
+    return {} if fmt.get("type") == "json_object" else None
+
+
+def _prompt_text(endpoint, body):
+    if endpoint == "chat":
+        return json.dumps(body.get("messages", []))
+    return json.dumps(body.get("input", ""))
+
+
+class StubState:
+    """Configuration, fixture store and counters shared by the stub's request threads."""
+
+    def __init__(self, fixtures_dir=STUB_FIXTURES_DIR, record=False, seed=None, on_miss=STUB_ON_MISS):
+        self.fixtures_dir = fixtures_dir
+        self.record = record
+        self.on_miss = on_miss
+        self.config = dict(STUB_DEFAULTS)
+        self.rng = random.Random(seed)
+        self.files = {}  # stub file id -> {"bytes", "filename", "purpose", "created_at", "upstream_id"}
+        self.stats = {}
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def count(self, endpoint, name):
+        with self._lock:
+            counters = self.stats.setdefault(endpoint, {})
+            counters[name] = counters.get(name, 0) + 1
+
+    def latency(self, endpoint, output_tokens=0):
+        with self._lock:
+            sampler = parse_latency(self.config.get(f"latency_{endpoint}") or self.config["latency"])
+            secs = sampler(self.rng) if sampler else 0.0
+            return secs + output_tokens * self.config["secs_per_output_token"]
+
+    def injected_error(self):
+        """429, 500 or None for this request, from the injection rates and the per-minute limit."""
+        with self._lock:
+            now = time.monotonic()
+            limit = self.config["requests_per_minute"]
+            if limit:
+                while self._recent and self._recent[0] < now - 60:
+                    self._recent.popleft()
+                if len(self._recent) >= limit:
+                    return 429
+                self._recent.append(now)
+            roll = self.rng.random()
+            if roll < self.config["error_rate_429"]:
+                return 429
+            if roll < self.config["error_rate_429"] + self.config["error_rate_500"]:
+                return 500
+            return None
+
+    def rate_limit_headers(self):
+        with self._lock:
+            limit = self.config["requests_per_minute"]
+            if not limit:
+                return {}
+            return {
+                "x-ratelimit-limit-requests": str(limit),
+                "x-ratelimit-remaining-requests": str(max(0, limit - len(self._recent))),
+                "x-ratelimit-reset-requests": "60s",
+            }
+
+    def fixture_key(self, endpoint, body):
+        keyed = {k: v for k, v in body.items() if k not in _UNKEYED_FIELDS}
+        return hashlib.sha256(json.dumps([endpoint, keyed], sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _fixture_path(self, endpoint, key):
+        return os.path.join(self.fixtures_dir, endpoint, f"{key}.json")
+
+    def load_fixture(self, endpoint, key):
+        try:
+            with open(self._fixture_path(endpoint, key)) as f:
+                return json.load(f)["response"]
+        except FileNotFoundError:
+            return None
+
+    def save_fixture(self, endpoint, key, body, response):
+        path = self._fixture_path(endpoint, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"endpoint": endpoint, "request": body, "response": response}, f, indent=1)
+
+
+def _error(status, message, error_type, code=None, headers=None):
+    return jsonify({"error": {"message": message, "type": error_type, "param": None, "code": code}}), status, headers or {}
+
+
+def _upstream(method, path, **kwargs):
+    import requests
+    response = requests.request(method, f"{OPENAI_STUB_UPSTREAM}{path}", timeout=600,
+                                headers={"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}"}, **kwargs)
+    response.raise_for_status()
+    return response.json()
+
+
+def _with_upstream_file_ids(value, files):
+    """Swap stub file ids for the upstream ids they were recorded under."""
+    if isinstance(value, dict):
+        return {k: (files[v]["upstream_id"] if k == "file_id" and v in files and files[v].get("upstream_id")
+                    else _with_upstream_file_ids(v, files)) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_with_upstream_file_ids(v, files) for v in value]
+    return value
+
+
+def _synthesize(endpoint, body, text):
+    model = body.get("model", "gpt-4o-mini")
+    prompt_tokens = count_tokens(_prompt_text(endpoint, body), model)
+    output_tokens = count_tokens(text, model)
+    suffix = hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+    if endpoint == "chat":
+        return {
+            "id": f"chatcmpl-stub{suffix}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "logprobs": None,
+                         "message": {"role": "assistant", "content": text, "refusal": None}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": output_tokens,
+                      "total_tokens": prompt_tokens + output_tokens},
+        }
+    return {
+        "id": f"resp_stub{suffix}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "status": "completed",
+        "model": model,
+        "output": [{"type": "message", "id": f"msg_stub{suffix}", "status": "completed", "role": "assistant",
+                    "content": [{"type": "output_text", "text": text, "annotations": []}]}],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {"input_tokens": prompt_tokens, "output_tokens": output_tokens,
+                  "total_tokens": prompt_tokens + output_tokens,
+                  "input_tokens_details": {"cached_tokens": 0}, "output_tokens_details": {"reasoning_tokens": 0}},
+    }
+
+
+def _output_tokens(endpoint, response):
+    usage = response.get("usage") or {}
+    return usage.get("completion_tokens" if endpoint == "chat" else "output_tokens", 0)
+
+
+def create_stub_app(state=None):
+    """Build the stub's Flask app around a StubState."""
+    state = state or StubState()
+    stub = Flask(__name__)
+    stub.config["stub_state"] = state
+
+    def generate(endpoint, upstream_path):
+        body = request.get_json(force=True)
+        state.count(endpoint, "requests")
+        error = state.injected_error()
+        if error == 429:
+            state.count(endpoint, "injected_429")
+            with state._lock:
+                retry_after = state.config["retry_after_secs"]
+            return _error(429, "Rate limit reached (stub).", "requests", "rate_limit_exceeded",
+                          {"retry-after": str(retry_after)})
+        if error == 500:
+            state.count(endpoint, "injected_500")
+            return _error(500, "The server had an error while processing your request (stub).", "server_error")
+
+        key = state.fixture_key(endpoint, body)
+        response = state.load_fixture(endpoint, key)
+        if response is not None:
+            state.count(endpoint, "fixture_hits")
+        elif state.record:
+            with state._lock:
+                files = dict(state.files)
+            response = _upstream("POST", upstream_path, json=_with_upstream_file_ids(body, files))
+            state.save_fixture(endpoint, key, body, response)
+            state.count(endpoint, "recorded")
+        elif state.on_miss == "error":
+            state.count(endpoint, "misses")
+            return _error(400, f"No fixture for this request (key {key}).", "invalid_request_error", "stub_fixture_missing")
+        else:
+            schema = _requested_schema(endpoint, body)
+            # Plain JSON mode ({}) still promises an object.
+            text = "Stub reply." if schema is None else json.dumps(_schema_default(schema) if schema else {})
+            response = _synthesize(endpoint, body, text)
+            state.count(endpoint, "synthesized")
+
+        time.sleep(state.latency(endpoint, _output_tokens(endpoint, response)))
+        return jsonify(response), 200, state.rate_limit_headers()
+
+    @stub.route("/v1/chat/completions", methods=["POST"])
+    def chat_completions():
+        return generate("chat", "/chat/completions")
+
+    @stub.route("/v1/responses", methods=["POST"])
+    def responses():
+        return generate("responses", "/responses")
+
+    @stub.route("/v1/files", methods=["POST"])
+    def upload_file():
+        state.count("files", "requests")
+        upload = request.files.get("file")
+        if upload is None:
+            return _error(400, "Missing file.", "invalid_request_error")
+        content = upload.read()
+        purpose = request.form.get("purpose", "user_data")
+        # Ids derive from the content so replayed runs send the same fixture keys.
+        file_id = f"file-stub{hashlib.sha256(content).hexdigest()[:24]}"
+        entry = {"bytes": len(content), "filename": upload.filename, "purpose": purpose,
+                 "created_at": int(time.time()), "upstream_id": None}
+        with state._lock:
+            known = file_id in state.files
+        if state.record and not known:
+            # Outside the lock: the upload can take a while. A concurrent
+            # upload of the same content keeps whichever entry lands first.
+            entry["upstream_id"] = _upstream("POST", "/files", data={"purpose": purpose},
+                                             files={"file": (upload.filename, content)})["id"]
+            state.count("files", "recorded")
+        with state._lock:
+            entry = state.files.setdefault(file_id, entry)
+        time.sleep(state.latency("files"))
+        return jsonify(_file_object(file_id, entry))
+
+    @stub.route("/v1/files/<file_id>", methods=["GET", "DELETE"])
+    def file_detail(file_id):
+        with state._lock:
+            entry = state.files.pop(file_id, None) if request.method == "DELETE" else state.files.get(file_id)
+        if entry is None:
+            return _error(404, f"No such File object: {file_id}", "invalid_request_error")
+        if request.method == "DELETE":
+            return jsonify({"id": file_id, "object": "file", "deleted": True})
+        return jsonify(_file_object(file_id, entry))
+
+    @stub.route("/stub/stats", methods=["GET"])
+    def stub_stats():
+        with state._lock:
+            return jsonify({"config": dict(state.config), "record": state.record, "files": len(state.files),
+                            "endpoints": {endpoint: dict(counters) for endpoint, counters in state.stats.items()}})
+
+    @stub.route("/stub/config", methods=["GET", "POST"])
+    def stub_config():
+        if request.method == "POST":
+            updates = request.get_json(force=True) or {}
+            unknown = [name for name in updates if name not in STUB_DEFAULTS]
+            if unknown:
+                return jsonify({"error": f"Unknown settings: {', '.join(unknown)}"}), 400
+            # Validate every setting before applying any of them.
+            try:
+                for name, value in updates.items():
+                    if name.startswith("latency"):
+                        parse_latency(value)
+                    else:
+                        updates[name] = type(STUB_DEFAULTS[name])(value)
+            except (TypeError, ValueError) as e:
+                return jsonify({"error": str(e)}), 400
+            with state._lock:
+                state.config.update(updates)
+        with state._lock:
+            return jsonify(dict(state.config))
+
+    return stub
+
+
+def _file_object(file_id, entry):
+    return {"id": file_id, "object": "file", "bytes": entry["bytes"], "created_at": entry["created_at"],
+            "filename": entry["filename"], "purpose": entry["purpose"], "status": "processed"}
+
+
+def main():
+    args = sys.argv[1:]
+    if "-h" in args or "--help" in args:
+        print(__doc__)
+        sys.exit(0)
+
+    def option(name, default=None):
+        return args[args.index(name) + 1] if name in args else default
+
+    seed = option("--seed")
+    state = StubState(fixtures_dir=option("--fixtures", STUB_FIXTURES_DIR), record="--record" in args,
+                      seed=int(seed) if seed is not None else None)
+    port = int(option("--port", "8090"))
+    print(f"OpenAI stub on http://localhost:{port}/v1 ({'recording' if state.record else 'replaying'} "
+          f"fixtures in {state.fixtures_dir})", flush=True)
+    create_stub_app(state).run(host="0.0.0.0", port=port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
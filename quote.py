@@ -1,10 +1,14 @@
 from flask import Blueprint, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from openai import OpenAI
+from llm_gateway import get_gateway
+from cache_store import SqliteCache
+from schemas import StructuredOutputError
+from token_budget import PromptBudget
 import os
 import json
 import re
+import hashlib
 from dotenv import load_dotenv
 from email_service import send_rfq_email, send_negotiation_email, send_notification_email
 
@@ -13,8 +17,8 @@ load_dotenv()
 # Create Blueprint
 quote_bp = Blueprint('quote', __name__, url_prefix='/api')
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Shared OpenAI gateway (pooled client, concurrency caps, retries, metrics)
+llm_gateway = get_gateway()
 
 # We'll use the app's db instance
 db = None
@@ -76,14 +80,9 @@ def init_db(database):
     globals()['Message'] = Message
 
 # AI Functions
-def extract_requirements_from_opportunity(opportunity_data):
-    """Extract key requirements from SAM.gov opportunity using AI"""
-    
-    # Prepare the opportunity details
-    details = opportunity_data
-
-    
-    prompt = f"""
+REQUIREMENTS_MODEL = "gpt-4o-mini"
+REQUIREMENTS_SYSTEM_PROMPT = "You are an expert at analyzing government contracts and extracting requirements."
+REQUIREMENTS_PROMPT = """
     Analyze this government contract opportunity and extract the key requirements:
     
     {details}
@@ -108,26 +107,56 @@ def extract_requirements_from_opportunity(opportunity_data):
     
     Return ONLY the JSON object, no other text.
     """
-    
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are an expert at analyzing government contracts and extracting requirements."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.3
-    )
+REQUIREMENTS_PROMPT_VERSION = hashlib.sha256(
+    (REQUIREMENTS_MODEL + REQUIREMENTS_SYSTEM_PROMPT + REQUIREMENTS_PROMPT).encode("utf-8")).hexdigest()[:16]
+
+# get-ai-suppliers and negotiate extract requirements from the same
+# opportunity; parsed results are memoized by opportunity and prompt version.
+REQUIREMENTS_CACHE_ENABLED = os.getenv("REQUIREMENTS_CACHE_ENABLED", "true").lower() == "true"
+requirements_cache = SqliteCache(
+    "requirements_cache.db",
+    table="requirements",
+    ttl_seconds=int(os.getenv("REQUIREMENTS_CACHE_TTL_HOURS", "24")) * 3600,
+    max_entries=int(os.getenv("REQUIREMENTS_CACHE_MAX_ENTRIES", "5000")),
+)
+
+
+def _requirements_cache_key(opportunity_data):
+    """Hash of the opportunity with keys sorted, so field order does not matter."""
+    canonical = json.dumps(opportunity_data, sort_keys=True, separators=(",", ":"), default=str)
+    return f"{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}:{REQUIREMENTS_PROMPT_VERSION}"
+
+
+def extract_requirements_from_opportunity(opportunity_data):
+    """Extract key requirements from SAM.gov opportunity using AI (memoized per opportunity)"""
+    cache_key = _requirements_cache_key(opportunity_data) if REQUIREMENTS_CACHE_ENABLED else None
+    if cache_key:
+        try:
+            cached = requirements_cache.get(cache_key)
+        except Exception as e:
+            print(f"Requirements cache lookup failed: {e}", flush=True)
+            cached = None
+        if cached is not None:
+            print(f"Requirements cache hit for {cache_key[:12]}", flush=True)
+            return cached
+
+    # Prepare the opportunity details
+    prompt = REQUIREMENTS_PROMPT.format(details=opportunity_data)
     
     try:
-        content = response.choices[0].message.content
-        # Clean up markdown code blocks if present
-        if content.startswith('```'):
-            content = content.split('```')[1]
-            if content.startswith('json'):
-                content = content[4:]
-        return json.loads(content.strip())
-    except:
-        # Fallback if JSON parsing fails
+        requirements = llm_gateway.chat_json(
+            "quote.requirements",
+            "requirements",
+            model=REQUIREMENTS_MODEL,
+            messages=[
+                {"role": "system", "content": REQUIREMENTS_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.3
+        )
+    except StructuredOutputError as e:
+        # Fallback if the reply could not be repaired (not cached, so the next call retries)
+        print(f"Requirements reply unusable, using defaults: {e}", flush=True)
         return {
             "product_service": opportunity_data.get('title', 'Government Contract Services'),
             "quantity": "As specified in RFP",
@@ -145,6 +174,13 @@ def extract_requirements_from_opportunity(opportunity_data):
             ]
         }
 
+    if cache_key and isinstance(requirements, dict):
+        try:
+            requirements_cache.set(cache_key, requirements)
+        except Exception as e:
+            print(f"Requirements cache write failed: {e}", flush=True)
+    return requirements
+
 def generate_initial_request(opportunity,requirements, company_name, additional_requirements=""):
     """Generate initial quote request based on extracted requirements"""
     
@@ -173,7 +209,8 @@ def generate_initial_request(opportunity,requirements, company_name, additional_
     Sign as "Procurement Team"
     """
     
-    response = client.chat.completions.create(
+    response = llm_gateway.chat(
+        "quote.initial_request",
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You are a professional government procurement specialist."},
@@ -229,7 +266,8 @@ def generate_supplier_response(company_name, requirements, messages, round_num,
     Be professional and detailed. Keep under 250 words.
     """
     
-    response = client.chat.completions.create(
+    response = llm_gateway.chat(
+        "quote.supplier_simulation",
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You are an experienced government contractor sales representative."},
@@ -240,16 +278,24 @@ def generate_supplier_response(company_name, requirements, messages, round_num,
     
     return response.choices[0].message.content, suggested_price
 
+NEGOTIATION_MODEL = "gpt-4o-mini"
+# Upper bound on the negotiation prompt; long threads keep their newest rounds
+# verbatim and older ones condensed.
+NEGOTIATION_PROMPT_TOKEN_BUDGET = int(os.getenv("NEGOTIATION_PROMPT_TOKEN_BUDGET", "4000"))
+
+NEGOTIATION_SYSTEM_PROMPT = "You are an experienced government procurement negotiator. You write natural, professional emails that engage with what the other party actually said. You never sound robotic or repetitive."
+
+
 def generate_negotiation_response(messages, requirements, round_num):
     """Generate buyer's negotiation response that engages with the vendor's actual points"""
     
-    # Include full conversation history (truncate individual messages if very long)
-    history_parts = []
+    # Conversation history (individual messages truncated if very long); fitted
+    # to the route's token budget below, older rounds condensed first.
+    history = []
     for m in messages:
         content = m.content if len(m.content) <= 1500 else m.content[:1500] + "..."
         label = "BUYER" if m.sender == "buyer" else "VENDOR"
-        history_parts.append(f"[{label}]: {content}")
-    full_history = "\n\n".join(history_parts)
+        history.append({"label": label, "content": content})
     
     # Extract the vendor's latest message explicitly
     vendor_messages = [m for m in messages if m.sender == 'supplier']
@@ -257,7 +303,8 @@ def generate_negotiation_response(messages, requirements, round_num):
     
     is_final = round_num >= 2
     
-    prompt = f"""You are a government procurement specialist writing a follow-up email to a vendor
+    def build_prompt(full_history):
+        return f"""You are a government procurement specialist writing a follow-up email to a vendor
 about: {requirements.get('product_service', 'a government contract')}.
 
 FULL CONVERSATION SO FAR:
@@ -280,10 +327,22 @@ RULES:
 - Do NOT include subject lines, greetings like "Dear...", or sign-offs like "Best regards" — those are added separately
 """
     
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    budget = PromptBudget("quote.negotiation", NEGOTIATION_PROMPT_TOKEN_BUDGET, model=NEGOTIATION_MODEL)
+    budget.fixed("system", NEGOTIATION_SYSTEM_PROMPT)
+    budget.fixed("prompt", build_prompt(""))
+    budget.turns("history", history, priority=1)
+    digest, turns = budget.fit()["history"]
+    history_parts = [f"[{t['label']}]: {t['content']}" for t in turns]
+    if digest:
+        history_parts.insert(0, digest)
+    full_history = "\n\n".join(history_parts)
+    prompt = build_prompt(full_history)
+    
+    response = llm_gateway.chat(
+        "quote.negotiation",
+        model=NEGOTIATION_MODEL,
         messages=[
-            {"role": "system", "content": "You are an experienced government procurement negotiator. You write natural, professional emails that engage with what the other party actually said. You never sound robotic or repetitive."},
+            {"role": "system", "content": NEGOTIATION_SYSTEM_PROMPT},
             {"role": "user", "content": prompt}
         ],
         temperature=0.75
@@ -1185,7 +1244,9 @@ def generate_vendor_recommendations(vendor_data, requirements, target_price, opp
     """
     
     try:
-        response = client.chat.completions.create(
+        recommendations = llm_gateway.chat_json(
+            "quote.vendor_recommendations",
+            "vendor_recommendations",
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "You are an expert government procurement analyst. Provide objective vendor recommendations based on price, compliance, and value."},
@@ -1194,16 +1255,6 @@ def generate_vendor_recommendations(vendor_data, requirements, target_price, opp
             temperature=0.3
         )
         
-        content = response.choices[0].message.content
-        
-        # Clean up markdown code blocks if present
-        if content.startswith('```'):
-            content = content.split('```')[1]
-            if content.startswith('json'):
-                content = content[4:]
-        
-        recommendations = json.loads(content.strip())
-        
         # Add scores for each vendor
         vendor_scores = []
         for v in vendor_data:
@@ -0,0 +1,181 @@
+"""
+Rate Limiter Module
+Process-wide adaptive token buckets for OpenAI calls, tuned from the
+x-ratelimit-* and Retry-After headers the API returns
+"""
+
+import os
+import re
+import time
+import threading
+from email.utils import parsedate_to_datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500"))
+DEFAULT_BURST = float(os.getenv("OPENAI_RATE_LIMIT_BURST", "10"))
+# Pause new calls until the token window resets once fewer than this share of
+# the reported token limit (x-ratelimit-limit-tokens) remains, instead of
+# walking into a 429. OPENAI_LOW_TOKEN_WATERMARK sets an absolute token count
+# instead.
+LOW_TOKEN_FRACTION = float(os.getenv("OPENAI_LOW_TOKEN_FRACTION", "0.05"))
+LOW_TOKEN_WATERMARK = int(os.getenv("OPENAI_LOW_TOKEN_WATERMARK", "0")) or None
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+
+
+def parse_reset_duration(value):
+    """Parse OpenAI reset durations such as '20ms', '1s' or '6m0s' into seconds."""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(str(value).strip())
+    if not parts:
+        return None
+    scale = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+
+def retry_after_seconds(headers):
+    """Read the provider's requested wait from Retry-After style headers, if any."""
+    if not headers:
+        return None
+    retry_ms = headers.get('retry-after-ms')
+    if retry_ms:
+        try:
+            return float(retry_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get('retry-after')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    # Fall back to the window reset times a 429 carries.
+    resets = [
+        parse_reset_duration(headers.get('x-ratelimit-reset-requests')),
+        parse_reset_duration(headers.get('x-ratelimit-reset-tokens')),
+    ]
+    resets = [r for r in resets if r is not None]
+    return max(resets) if resets else None
+
+
+def low_token_watermark(token_limit):
+    """Remaining-token count below which callers pause, or None when the limit is unknown."""
+    if LOW_TOKEN_WATERMARK is not None:
+        return LOW_TOKEN_WATERMARK
+    if not token_limit:
+        return None
+    return float(token_limit) * LOW_TOKEN_FRACTION
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket shared by every thread calling one model.
+
+    The refill rate starts at requests_per_minute and is replaced by the
+    limit the API reports. Remaining-request counts cap the bucket, and
+    Retry-After (or a nearly exhausted token budget) pauses every caller
+    until the provider's window resets.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, burst=DEFAULT_BURST):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.paused_until = 0.0
+        self.last_refill = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        elapsed = now - self.last_refill
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.last_refill = now
+
+    def acquire(self, timeout=None):
+        """
+        Block until a request may be sent. Returns the seconds spent waiting,
+        or None if no request could be sent within timeout seconds.
+        """
+        started = time.monotonic()
+        deadline = started + timeout if timeout is not None else None
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return time.monotonic() - started
+                else:
+                    wait = (1 - self.tokens) / self.rate if self.rate > 0 else 1.0
+                if deadline is not None and now + wait > deadline:
+                    return None
+                self._cond.wait(wait)
+
+    def pause(self, seconds):
+        """Stop all callers for the given number of seconds (provider-requested backoff)."""
+        if not seconds or seconds <= 0:
+            return
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def update_from_headers(self, headers):
+        """Adapt the bucket to the x-ratelimit-* headers of a successful response."""
+        if not headers:
+            return
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            try:
+                limit = headers.get('x-ratelimit-limit-requests')
+                if limit:
+                    self.rate = float(limit) / 60.0
+                remaining = headers.get('x-ratelimit-remaining-requests')
+                if remaining is not None:
+                    self.tokens = min(self.tokens, float(remaining))
+                remaining_tokens = headers.get('x-ratelimit-remaining-tokens')
+                watermark = low_token_watermark(headers.get('x-ratelimit-limit-tokens'))
+                if remaining_tokens is not None and watermark and int(remaining_tokens) < watermark:
+                    reset = parse_reset_duration(headers.get('x-ratelimit-reset-tokens'))
+                    if reset:
+                        self.paused_until = max(self.paused_until, now + reset)
+            except (TypeError, ValueError):
+                pass
+            self._cond.notify_all()
+
+    def status(self):
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                'requests_per_minute': round(self.rate * 60, 2),
+                'available': round(self.tokens, 2),
+                'capacity': self.capacity,
+                'paused_for_seconds': round(max(0.0, self.paused_until - now), 2),
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(model):
+    """Return the process-wide limiter for a model, creating it on first use."""
+    with _limiters_lock:
+        if model not in _limiters:
+            _limiters[model] = AdaptiveRateLimiter()
+        return _limiters[model]
+
+
+def get_limiter_status():
+    with _limiters_lock:
+        items = list(_limiters.items())
+    return {model: limiter.status() for model, limiter in items}
@@ -0,0 +1,483 @@
+"""
+Schemas Module
+Registry of the JSON payloads the models are asked to produce. Each schema
+gives the structured-output request parameters for its calls and a
+validator; replies that still come back malformed or off-schema are
+repaired locally, fragment by fragment, instead of re-running the prompt.
+Parse and repair outcomes are counted per call site
+"""
+
+import re
+import json
+import threading
+
+# Fully specified schemas are sent in strict json_schema mode. Schemas with
+# open-ended parts (fields of any type, keys chosen by the prompt) are sent in
+# json_object mode and enforced by the local validator only.
+SCHEMAS = {}
+
+_NULLABLE_STRING = {"type": ["string", "null"]}
+_NULLABLE_NUMBER = {"type": ["number", "null"]}
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+
+class StructuredOutputError(Exception):
+    """A model reply that could not be parsed or repaired into its schema."""
+
+    def __init__(self, message, raw=None, errors=None):
+        super().__init__(message)
+        self.raw = raw
+        self.errors = errors or []
+
+
+def _object(properties):
+    """Strict-mode object: every property required, nothing else allowed."""
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+def register_schema(name, schema, strict=True):
+    """Add a schema to the registry. Returns the schema."""
+    SCHEMAS[name] = {"schema": schema, "strict": strict}
+    return schema
+
+
+def template_schema(template):
+    """
+    Schema for a prompt's JSON template ({section: {field: default}}): every
+    section and field is present, [] defaults are arrays and other fields may
+    hold any value.
+    """
+    return {
+        "type": "object",
+        "properties": {
+            section: {
+                "type": "object",
+                "properties": {
+                    field: {"type": "array"} if isinstance(default, list) else {}
+                    for field, default in fields.items()
+                },
+                "required": list(fields),
+                "additionalProperties": False,
+            }
+            for section, fields in template.items()
+        },
+        "required": list(template),
+        "additionalProperties": True,
+    }
+
+
+register_schema("requirements", _object({
+    "product_service": {"type": "string"},
+    "quantity": {"type": "string"},
+    "delivery_location": {"type": "string"},
+    "key_requirements": _STRING_LIST,
+    "certifications_needed": _STRING_LIST,
+    "timeline": {"type": "string"},
+    "industry_category": {"type": "string"},
+    "suggested_suppliers": {
+        "type": "array",
+        "items": _object({"name": {"type": "string"}, "email": {"type": "string"}}),
+    },
+}))
+
+register_schema("email_quote", _object({
+    "is_quote_response": {"type": "boolean"},
+    "total_price": _NULLABLE_NUMBER,
+    "unit_price": _NULLABLE_NUMBER,
+    "delivery_timeline": _NULLABLE_STRING,
+    "payment_terms": _NULLABLE_STRING,
+    "key_points": _STRING_LIST,
+    "is_negotiation": {"type": "boolean"},
+    "sentiment": {"type": "string", "enum": ["positive", "neutral", "negative"]},
+    "requires_followup": {"type": "boolean"},
+    "summary": {"type": "string"},
+}))
+
+register_schema("vendor_recommendations", _object({
+    "best_vendor": _NULLABLE_STRING,
+    "ranking": _STRING_LIST,
+    "price_analysis": {"type": "string"},
+    "risk_factors": _STRING_LIST,
+    "recommendation_reasoning": {"type": "string"},
+    "savings_potential": {"type": "string"},
+}))
+
+register_schema("compliance_summary", _object({
+    "executive_summary": {"type": "string"},
+    "key_risks": _STRING_LIST,
+    "recommended_actions": _STRING_LIST,
+}))
+
+# Structured outputs need an object at the top level, so the scores array is wrapped.
+register_schema("opportunity_scores", _object({
+    "scores": {
+        "type": "array",
+        "items": _object({
+            "id": {"type": "string"},
+            "score": {"type": "integer"},
+            "reason": {"type": "string"},
+        }),
+    },
+}))
+
+# Conflict resolution replies are keyed by the conflicting field names.
+register_schema("field_resolutions", {"type": "object"}, strict=False)
+
+
+def response_format(name):
+    """response_format argument for chat.completions.create."""
+    entry = SCHEMAS[name]
+    if not entry["strict"]:
+        return {"type": "json_object"}
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": entry["schema"], "strict": True}}
+
+
+def text_format(name):
+    """text argument for responses.create."""
+    entry = SCHEMAS[name]
+    if not entry["strict"]:
+        return {"format": {"type": "json_object"}}
+    return {"format": {"type": "json_schema", "name": name, "schema": entry["schema"], "strict": True}}
+
+
+# ============== Validation ==============
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+def _is_type(value, json_type):
+    if json_type == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if json_type == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, _JSON_TYPES[json_type])
+
+
+def _types(schema):
+    json_type = schema.get("type")
+    if json_type is None:
+        return []
+    return json_type if isinstance(json_type, list) else [json_type]
+
+
+def validate(schema, value, path="$"):
+    """Check value against the JSON Schema subset used here. Returns a list of error strings."""
+    if "anyOf" in schema:
+        if any(not validate(option, value, path) for option in schema["anyOf"]):
+            return []
+        return [f"{path}: matches none of the allowed forms"]
+    types = _types(schema)
+    if types and not any(_is_type(value, t) for t in types):
+        return [f"{path}: expected {' or '.join(types)}, got {type(value).__name__}"]
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path}: {value!r} is not one of {schema['enum']}"]
+    errors = []
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}.{key}: missing")
+        for key, item in value.items():
+            if key in properties:
+                errors.extend(validate(properties[key], item, f"{path}.{key}"))
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}.{key}: unexpected field")
+    elif isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            errors.extend(validate(schema["items"], item, f"{path}[{i}]"))
+    return errors
+
+
+# ============== Repair ==============
+
+_UNSET = object()
+
+
+def _default(schema):
+    """Value a missing or unrepairable field falls back to, or _UNSET if none is valid."""
+    types = _types(schema)
+    if not types or "null" in types:
+        return None
+    if "array" in types:
+        return []
+    if "object" in types and schema.get("properties") is not None:
+        return {key: _default(sub) for key, sub in schema["properties"].items()}
+    return _UNSET
+
+
+def _number(value):
+    if isinstance(value, str):
+        text = re.sub(r"[,$\s]", "", value)
+        try:
+            return float(text)
+        except ValueError:
+            return _UNSET
+    return _UNSET
+
+
+def _coerce_scalar(json_type, value):
+    """Convert value to json_type when the intent is unambiguous, else _UNSET."""
+    if json_type == "string" and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if json_type == "string" and isinstance(value, list) and all(isinstance(v, str) for v in value):
+        return "; ".join(value)
+    if json_type in ("number", "integer"):
+        number = _number(value) if isinstance(value, str) else (value if _is_type(value, "number") else _UNSET)
+        if number is _UNSET:
+            return _UNSET
+        if json_type == "integer":
+            return int(round(number))
+        return int(number) if float(number).is_integer() and isinstance(value, str) else number
+    if json_type == "boolean" and isinstance(value, str):
+        return {"true": True, "yes": True, "false": False, "no": False}.get(value.strip().lower(), _UNSET)
+    if json_type == "array" and value is not None:
+        return [value]
+    if json_type == "array" and value is None:
+        return []
+    return _UNSET
+
+
+def repair(schema, value, path="$", repaired=None):
+    """
+    Bring value into line with schema, touching only the parts that do not
+    validate: wrong scalar types are converted where the intent is clear
+    ("1,200" -> 1200, "yes" -> true, "x" -> ["x"]), enums are matched
+    case-insensitively, missing fields get their default and unexpected
+    fields are dropped. Repaired paths are appended to repaired.
+
+    Returns the repaired value, or raises StructuredOutputError for a part
+    that has no sensible repair.
+    """
+    repaired = repaired if repaired is not None else []
+    if not validate(schema, value, path):
+        return value
+
+    if "anyOf" in schema:
+        for option in schema["anyOf"]:
+            try:
+                return repair(option, value, path, repaired)
+            except StructuredOutputError:
+                continue
+        raise StructuredOutputError(f"{path}: matches none of the allowed forms")
+
+    types = _types(schema)
+    if types and not any(_is_type(value, t) for t in types):
+        for json_type in types:
+            converted = _coerce_scalar(json_type, value)
+            if converted is not _UNSET and not validate(schema, converted, path):
+                repaired.append(path)
+                return converted
+            if converted is not _UNSET and json_type in ("array", "object"):
+                repaired.append(path)
+                return repair(schema, converted, path, repaired)
+        fallback = _default(schema)
+        if fallback is _UNSET:
+            raise StructuredOutputError(f"{path}: expected {' or '.join(types)}, got {type(value).__name__}")
+        repaired.append(path)
+        return fallback
+
+    if "enum" in schema and value not in schema["enum"]:
+        matches = [option for option in schema["enum"]
+                   if isinstance(value, str) and isinstance(option, str) and option.lower() == value.strip().lower()]
+        if matches:
+            repaired.append(path)
+            return matches[0]
+        fallback = _default(schema)
+        if fallback is _UNSET:
+            raise StructuredOutputError(f"{path}: {value!r} is not one of {schema['enum']}")
+        repaired.append(path)
+        return fallback
+
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        result = {}
+        for key, item in value.items():
+            if key in properties:
+                result[key] = repair(properties[key], item, f"{path}.{key}", repaired)
+            elif schema.get("additionalProperties") is False:
+                repaired.append(f"{path}.{key}")
+            else:
+                result[key] = item
+        for key in schema.get("required", []):
+            if key not in result:
+                fallback = _default(properties.get(key, {}))
+                if fallback is _UNSET:
+                    raise StructuredOutputError(f"{path}.{key}: missing")
+                repaired.append(f"{path}.{key}")
+                result[key] = fallback
+        return result
+
+    if isinstance(value, list) and "items" in schema:
+        result = []
+        for i, item in enumerate(value):
+            try:
+                result.append(repair(schema["items"], item, f"{path}[{i}]", repaired))
+            except StructuredOutputError:
+                # One unusable element is dropped rather than failing the list.
+                repaired.append(f"{path}[{i}]")
+        return result
+
+    return value
+
+
+def _scan(text):
+    """
+    Walk text as JSON. Returns (end, stack, in_string): the index just past
+    the first complete top-level value (or None), and the closers still
+    open and whether a string is open when the text runs out.
+    """
+    stack = []
+    in_string = escaped = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+            if not stack:
+                return i + 1, stack, False
+    return None, stack, in_string
+
+
+def _strip_to_json(text):
+    """Drop Markdown fences and any prose around the outermost JSON value."""
+    text = text.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)(?:```|$)", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1).strip()
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return text
+    text = text[min(starts):]
+    end, _, _ = _scan(text)
+    return text[:end] if end else text
+
+
+def _close_truncated(text):
+    """Close the strings, arrays and objects left open by a reply cut off mid-way."""
+    end, stack, in_string = _scan(text)
+    if end:
+        return text
+    if in_string:
+        text += '"'
+    text = text.rstrip()
+    if text.endswith(":"):
+        text += " null"
+    text = text.rstrip(",")
+    return text + "".join(reversed(stack))
+
+
+def _repair_text(text):
+    """Textual fixes for near-JSON: trailing commas, Python literals, truncation."""
+    text = re.sub(r",\s*([}\]])", r"\1", text)
+    for literal, replacement in (("None", "null"), ("True", "true"), ("False", "false")):
+        text = re.sub(rf"([:\[,]\s*){literal}\b", rf"\g<1>{replacement}", text)
+    text = _close_truncated(text)
+    return re.sub(r",\s*([}\]])", r"\1", text)
+
+
+# ============== Parsing and stats ==============
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+_OUTCOMES = ("replies", "clean", "local_repairs", "text_repairs", "field_repairs",
+             "unparseable", "model_repairs", "failures")
+
+
+def record(call_site, outcome):
+    """Count a parse outcome for a call site (one of _OUTCOMES)."""
+    with _stats_lock:
+        stats = _stats.setdefault(call_site, dict.fromkeys(_OUTCOMES, 0))
+        stats[outcome] += 1
+
+
+def parse_reply(name, text, call_site=None):
+    """
+    Parse a model reply into schema name.
+
+    Valid replies are returned as is. Otherwise the text is repaired locally
+    (fences, trailing commas, truncation), then the parts of the value that
+    fail validation (see repair). Raises StructuredOutputError, carrying the
+    raw reply, when neither is enough. Outcomes are counted under call_site
+    when one is given.
+    """
+    schema = SCHEMAS[name]["schema"]
+    count = record if call_site else (lambda site, outcome: None)
+    count(call_site, "replies")
+    try:
+        value, text_repaired, repaired_paths = _parse(schema, text)
+    except StructuredOutputError:
+        count(call_site, "unparseable")
+        raise
+
+    if text_repaired:
+        count(call_site, "text_repairs")
+    if repaired_paths:
+        count(call_site, "field_repairs")
+        print(f"[schemas] {call_site or name}: repaired {len(repaired_paths)} field(s) locally: "
+              f"{', '.join(repaired_paths[:5])}{'...' if len(repaired_paths) > 5 else ''}", flush=True)
+    count(call_site, "local_repairs" if text_repaired or repaired_paths else "clean")
+    return value
+
+
+def _parse(schema, text):
+    if not text or not text.strip():
+        raise StructuredOutputError("Empty reply from model", raw=text)
+    try:
+        value = json.loads(text)
+        text_repaired = False
+    except json.JSONDecodeError:
+        candidate = _strip_to_json(text)
+        try:
+            value = json.loads(candidate)
+        except json.JSONDecodeError:
+            try:
+                value = json.loads(_repair_text(candidate))
+            except json.JSONDecodeError as e:
+                raise StructuredOutputError(f"Invalid JSON from model: {e}", raw=text)
+        text_repaired = True
+
+    repaired_paths = []
+    errors = validate(schema, value)
+    if errors:
+        try:
+            value = repair(schema, value, repaired=repaired_paths)
+        except StructuredOutputError as e:
+            raise StructuredOutputError(str(e), raw=text, errors=errors)
+    return value, text_repaired, repaired_paths
+
+
+def get_schema_stats():
+    """
+    Per-call-site parse outcomes. parse_failure_rate is the share of replies
+    that were not clean JSON matching the schema, repair_rate the share
+    rescued by local or model repair, failure_rate the share lost.
+    """
+    with _stats_lock:
+        sites = {site: dict(stats) for site, stats in _stats.items()}
+    for stats in sites.values():
+        replies = stats["replies"]
+        stats["parse_failure_rate"] = round((replies - stats["clean"]) / replies, 4) if replies else None
+        stats["repair_rate"] = round((stats["local_repairs"] + stats["model_repairs"]) / replies, 4) if replies else None
+        stats["failure_rate"] = round(stats["failures"] / replies, 4) if replies else None
+    return sites
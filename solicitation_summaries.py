@@ -0,0 +1,242 @@
+"""
+Solicitation Summaries Module
+Persistent store of final solicitation summaries, keyed by solicitation
+number and by a hash of the analyzed document set. A repeat analysis of the
+same documents is answered from the store without any model calls, and the
+frontend can fetch a stored summary instead of re-running the analysis
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+from flask import Blueprint, request, jsonify
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Create Blueprint
+summaries_bp = Blueprint('solicitation_summaries', __name__, url_prefix='/api/solicitation-summaries')
+
+# Completed summaries are stored by document-set hash and reused on repeat analyses.
+SUMMARY_STORE_ENABLED = os.getenv("SUMMARY_STORE_ENABLED", "true").lower() == "true"
+
+# Database reference and pipeline fingerprint (set by init function)
+db = None
+SolicitationSummary = None
+pipeline_version = ""
+
+# solicitation_metadata fields copied into indexed columns
+METADATA_COLUMNS = ('solicitation_number', 'agency_name', 'naics_code', 'psc_code',
+                    'set_aside_type', 'response_deadline_date')
+
+
+def init_solicitation_summaries_db(database, version=""):
+    """
+    Initialize the summary store.
+
+    Args:
+        database: The app's SQLAlchemy instance
+        version: Fingerprint of the models and prompts that produce a summary;
+            it is part of the document-set hash, so changing a prompt or model
+            makes earlier summaries miss instead of being served stale
+    """
+    global db, pipeline_version
+    db = database
+    pipeline_version = version
+
+    class SolicitationSummaryModel(db.Model):
+        __tablename__ = 'solicitation_summaries'
+
+        id = db.Column(db.Integer, primary_key=True)
+        document_set_hash = db.Column(db.String(64), nullable=False, unique=True, index=True)
+        solicitation_number = db.Column(db.String(100), nullable=True, index=True)
+        agency_name = db.Column(db.String(300), nullable=True, index=True)
+        naics_code = db.Column(db.String(20), nullable=True, index=True)
+        psc_code = db.Column(db.String(20), nullable=True, index=True)
+        set_aside_type = db.Column(db.String(200), nullable=True, index=True)
+        response_deadline_date = db.Column(db.String(50), nullable=True, index=True)
+        document_count = db.Column(db.Integer, default=0)
+        document_hashes = db.Column(db.Text, nullable=True)  # JSON list of document sha256s
+        urls = db.Column(db.Text, nullable=True)  # JSON list
+        summary = db.Column(db.Text, nullable=False)  # JSON
+        hit_count = db.Column(db.Integer, default=0)
+        created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+        updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+        last_hit_at = db.Column(db.DateTime, nullable=True)
+
+        def to_dict(self, include_summary=False):
+            data = {
+                'id': self.id,
+                'document_set_hash': self.document_set_hash,
+                'solicitation_number': self.solicitation_number,
+                'agency_name': self.agency_name,
+                'naics_code': self.naics_code,
+                'psc_code': self.psc_code,
+                'set_aside_type': self.set_aside_type,
+                'response_deadline_date': self.response_deadline_date,
+                'document_count': self.document_count,
+                'urls': json.loads(self.urls) if self.urls else [],
+                'hit_count': self.hit_count or 0,
+                'created_at': self.created_at.isoformat() if self.created_at else None,
+                'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            }
+            if include_summary:
+                data['summary'] = json.loads(self.summary)
+            return data
+
+    globals()['SolicitationSummary'] = SolicitationSummaryModel
+    return SolicitationSummaryModel
+
+
+def document_set_hash(documents):
+    """
+    Hash of the content of an analyzed document set: the sorted, de-duplicated
+    document sha256s plus the pipeline version. Attachment order, URLs and
+    re-posted copies do not change it; any changed byte does.
+    """
+    hashes = sorted({d['sha256'] for d in documents if d.get('sha256')})
+    if not hashes:
+        return None
+    return hashlib.sha256("\n".join(hashes + [pipeline_version]).encode('utf-8')).hexdigest()
+
+
+def _metadata_value(value, length):
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    text = str(value).strip()
+    if not text or text.lower() in ('null', 'none', 'n/a', 'not found', 'not specified'):
+        return None
+    return text[:length]
+
+
+def find_stored_summary(documents):
+    """
+    Return (summary, record) for a stored summary of exactly this document
+    set, or (None, None). Counts the hit on the record.
+    """
+    set_hash = document_set_hash(documents)
+    if not set_hash:
+        return None, None
+    record = SolicitationSummary.query.filter_by(document_set_hash=set_hash).first()
+    if not record:
+        return None, None
+    record.hit_count = (record.hit_count or 0) + 1
+    record.last_hit_at = datetime.utcnow()
+    db.session.commit()
+    return json.loads(record.summary), record
+
+
+def save_summary(summary, documents, solicitation_number=None):
+    """
+    Store a completed summary under its document-set hash, replacing any
+    earlier summary of the same set. The solicitation number falls back to
+    the one extracted into solicitation_metadata. Returns the record, or None
+    when there is nothing to key it by.
+    """
+    set_hash = document_set_hash(documents)
+    if not set_hash:
+        return None
+    summary = {k: v for k, v in summary.items() if k != 'processing_stats'}
+    metadata = summary.get('solicitation_metadata')
+    metadata = metadata if isinstance(metadata, dict) else {}
+    columns = {name: _metadata_value(metadata.get(name), getattr(SolicitationSummary, name).type.length)
+               for name in METADATA_COLUMNS}
+    if solicitation_number:
+        columns['solicitation_number'] = str(solicitation_number).strip()[:100]
+
+    try:
+        record = SolicitationSummary.query.filter_by(document_set_hash=set_hash).first()
+        if not record:
+            record = SolicitationSummary(document_set_hash=set_hash)
+            db.session.add(record)
+        for name, value in columns.items():
+            setattr(record, name, value)
+        record.document_count = len(documents)
+        record.document_hashes = json.dumps([d.get('sha256') for d in documents])
+        record.urls = json.dumps([d.get('url') for d in documents])
+        record.summary = json.dumps(summary)
+        db.session.commit()
+    except Exception as e:
+        # Another worker may have stored the same set first.
+        db.session.rollback()
+        print(f"[solicitation-summaries] Could not store summary {set_hash[:12]}: {e}", flush=True)
+        return SolicitationSummary.query.filter_by(document_set_hash=set_hash).first()
+
+    print(f"[solicitation-summaries] Stored summary {record.id} "
+          f"({record.solicitation_number or 'no number'}, {len(documents)} document(s))", flush=True)
+    return record
+
+
+def latest_summary(solicitation_number):
+    """The most recently stored summary for a solicitation number, or None."""
+    return (SolicitationSummary.query
+            .filter_by(solicitation_number=solicitation_number)
+            .order_by(SolicitationSummary.updated_at.desc(), SolicitationSummary.id.desc())
+            .first())
+
+
+# ============== API Routes ==============
+
+@summaries_bp.route('', methods=['GET'])
+def list_summaries():
+    """
+    List stored summaries (metadata only), newest first.
+    Query params: solicitation_number, agency_name, naics_code, psc_code,
+    set_aside_type, deadline_from, deadline_to, limit, offset
+    """
+    try:
+        query = SolicitationSummary.query
+        for name in ('solicitation_number', 'naics_code', 'psc_code'):
+            if request.args.get(name):
+                query = query.filter(getattr(SolicitationSummary, name) == request.args[name])
+        for name in ('agency_name', 'set_aside_type'):
+            if request.args.get(name):
+                query = query.filter(getattr(SolicitationSummary, name).ilike(f"%{request.args[name]}%"))
+        if request.args.get('deadline_from'):
+            query = query.filter(SolicitationSummary.response_deadline_date >= request.args['deadline_from'])
+        if request.args.get('deadline_to'):
+            query = query.filter(SolicitationSummary.response_deadline_date <= request.args['deadline_to'])
+
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        offset = request.args.get('offset', 0, type=int)
+        total = query.count()
+        records = (query.order_by(SolicitationSummary.updated_at.desc())
+                   .offset(offset).limit(limit).all())
+        return jsonify({
+            'success': True,
+            'summaries': [r.to_dict() for r in records],
+            'total': total,
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@summaries_bp.route('/id/<int:summary_id>', methods=['GET'])
+def get_summary(summary_id):
+    """Get a stored summary by id"""
+    record = SolicitationSummary.query.get(summary_id)
+    if not record:
+        return jsonify({'error': 'Summary not found'}), 404
+    return jsonify({'success': True, **record.to_dict(include_summary=True)})
+
+
+@summaries_bp.route('/<solicitation_number>', methods=['GET'])
+def get_summary_by_number(solicitation_number):
+    """
+    Get the latest stored summary for a solicitation number, plus the ids of
+    earlier summaries (e.g. from before an amendment changed the documents).
+    """
+    record = latest_summary(solicitation_number)
+    if not record:
+        return jsonify({'error': 'No summary stored for this solicitation number'}), 404
+    versions = (SolicitationSummary.query
+                .filter_by(solicitation_number=solicitation_number)
+                .order_by(SolicitationSummary.updated_at.desc())
+                .all())
+    return jsonify({
+        'success': True,
+        **record.to_dict(include_summary=True),
+        'versions': [{'id': v.id, 'document_count': v.document_count,
+                      'updated_at': v.updated_at.isoformat() if v.updated_at else None} for v in versions],
+    })
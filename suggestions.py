@@ -1,15 +1,14 @@
-import os
 import json
 from datetime import datetime
 from flask import Blueprint, request, jsonify
-from openai import OpenAI
+from llm_gateway import get_gateway
 from dotenv import load_dotenv
 
 load_dotenv()
 
 suggestions_bp = Blueprint('suggestions', __name__, url_prefix='/api')
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+llm_gateway = get_gateway()
 
 COMPANY_PROFILE = {
     "company_name": "Apex Federal Solutions LLC",
@@ -132,12 +131,12 @@ For each opportunity, provide:
 1. A fit score from 0-100 based on NAICS alignment, set-aside match, capability relevance, geographic fit, and past performance relevance
 2. A concise 1-sentence explanation of why it matches or doesn't
 
-Respond with ONLY a JSON array (no markdown, no code fences) where each element has:
+Respond with ONLY a JSON object (no markdown, no code fences) whose "scores" array has one element per opportunity with:
 - "id": the opportunity id
 - "score": integer 0-100
 - "reason": string explanation
 
-Example: [{{"id":"abc123","score":85,"reason":"Strong NAICS match with 541512 and set-aside aligns with 8(a) qualification."}}]"""
+Example: {{"scores":[{{"id":"abc123","score":85,"reason":"Strong NAICS match with 541512 and set-aside aligns with 8(a) qualification."}}]}}"""
 
 
 @suggestions_bp.route('/ai-suggestions', methods=['POST'])
@@ -164,22 +163,15 @@ def ai_suggestions():
 
         prompt = _build_single_prompt(candidates)
 
-        response = client.chat.completions.create(
+        ai_scores = llm_gateway.chat_json(
+            "suggestions.scoring",
+            "opportunity_scores",
             model="gpt-4o-mini",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3,
             max_tokens=8000,
-        )
-
-        raw = response.choices[0].message.content.strip()
-        if raw.startswith("```"):
-            raw = raw.split("\n", 1)[1] if "\n" in raw else raw[3:]
-            if raw.endswith("```"):
-                raw = raw[:-3]
-            raw = raw.strip()
-
-        ai_scores = json.loads(raw)
-        opp_map = {o.get("id"): o for o in opportunities}
+        )["scores"]
+        opp_map = {str(o.get("id")): o for o in opportunities}
 
         suggestions = []
         for scored in ai_scores:
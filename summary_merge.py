@@ -0,0 +1,181 @@
+"""
+Summary Merge Module
+Deterministic merge of per-document extractions over the EXTRACTION_PROMPT
+schema. Fields every document agrees on and list fields are resolved
+locally; only conflicting values are left for the model to reconcile
+"""
+
+import re
+import json
+
+_NULL_STRINGS = {"", "null", "none found", "n/a", "not found", "not specified", "not provided"}
+
+
+def schema_from_prompt(prompt):
+    """
+    Parse the JSON template embedded in an extraction prompt into
+    {section: {field: default}}, where a default of [] marks a list field.
+    """
+    start = prompt.index("{")
+    depth = 0
+    for end in range(start, len(prompt)):
+        if prompt[end] == "{":
+            depth += 1
+        elif prompt[end] == "}":
+            depth -= 1
+            if depth == 0:
+                return json.loads(prompt[start:end + 1])
+    raise ValueError("No JSON schema found in prompt")
+
+
+def _is_null(value):
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return value.strip().lower() in _NULL_STRINGS
+    if isinstance(value, (list, dict)):
+        return len(value) == 0
+    return False
+
+
+def _normalize(value):
+    """Comparison key under which trivially different spellings of a value are equal."""
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, str):
+        text = re.sub(r"\s+", " ", value.strip().lower()).rstrip(".")
+        return {"true": "yes", "false": "no"}.get(text, text)
+    if isinstance(value, dict):
+        return json.dumps({k: _normalize(v) for k, v in value.items() if not _is_null(v)}, sort_keys=True)
+    if isinstance(value, list):
+        return json.dumps([_normalize(v) for v in value])
+    return str(value)
+
+
+def _doc_index(document, position):
+    index = document.get("document_index")
+    return index if isinstance(index, int) else position + 1
+
+
+def merge_extractions(extractions, schema):
+    """
+    Merge per-document extraction dicts field by field.
+
+    - Nulls (and null-like strings) are dropped.
+    - List fields are concatenated in document order and de-duplicated.
+    - A scalar field whose non-null values all agree (after normalizing case,
+      whitespace and yes/true spellings) takes the first document's value.
+    - Any other scalar field is a conflict, left null in the merged result.
+
+    Returns (merged, conflicts, provenance, unstructured):
+        merged: dict following the schema exactly
+        conflicts: {section: {field: [{"document_index", "value"}, ...]}}
+        provenance: {"section.field": {"resolved", "documents", ...}}
+        unstructured: documents with no structured sections (e.g. raw_text
+            fallbacks), which only the model can merge
+    """
+    structured = []
+    unstructured = []
+    for position, document in enumerate(extractions):
+        if isinstance(document, dict) and any(isinstance(document.get(section), dict) for section in schema):
+            structured.append((_doc_index(document, position), document))
+        else:
+            unstructured.append(document)
+
+    merged = {}
+    conflicts = {}
+    provenance = {}
+    for section, fields in schema.items():
+        merged[section] = {}
+        for field, default in fields.items():
+            path = f"{section}.{field}"
+            candidates = []
+            for index, document in structured:
+                values = document.get(section)
+                if not isinstance(values, dict):
+                    continue
+                value = values.get(field)
+                if not _is_null(value):
+                    candidates.append((index, value))
+
+            if isinstance(default, list):
+                items, item_documents, seen = [], [], {}
+                for index, value in candidates:
+                    for item in (value if isinstance(value, list) else [value]):
+                        if _is_null(item):
+                            continue
+                        key = _normalize(item)
+                        if key in seen:
+                            if index not in item_documents[seen[key]]:
+                                item_documents[seen[key]].append(index)
+                            continue
+                        seen[key] = len(items)
+                        items.append(item)
+                        item_documents.append([index])
+                merged[section][field] = items
+                provenance[path] = {
+                    "resolved": "local",
+                    "documents": [index for index, _ in candidates],
+                    "item_documents": item_documents,
+                }
+                continue
+
+            distinct = {}
+            for index, value in candidates:
+                distinct.setdefault(_normalize(value), []).append((index, value))
+            if len(distinct) <= 1:
+                merged[section][field] = candidates[0][1] if candidates else None
+                provenance[path] = {"resolved": "local", "documents": [index for index, _ in candidates]}
+            else:
+                merged[section][field] = None
+                conflicts.setdefault(section, {})[field] = [
+                    {"document_index": index, "value": value} for index, value in candidates
+                ]
+                provenance[path] = {
+                    "resolved": "model",
+                    "documents": [index for index, _ in candidates],
+                    "candidates": [
+                        {"value": group[0][1], "documents": [index for index, _ in group]}
+                        for group in distinct.values()
+                    ],
+                }
+
+    return merged, conflicts, provenance, unstructured
+
+
+def apply_resolutions(merged, conflicts, provenance, resolutions):
+    """
+    Write model-resolved values into merged. A field the model left out (or a
+    section whose call failed) falls back to its first document's value.
+    """
+    for section, fields in conflicts.items():
+        resolved = resolutions.get(section)
+        for field, candidates in fields.items():
+            path = f"{section}.{field}"
+            if isinstance(resolved, dict) and field in resolved and not _is_null(resolved[field]):
+                merged[section][field] = resolved[field]
+            else:
+                merged[section][field] = candidates[0]["value"]
+                provenance[path]["resolved"] = "first_value_fallback"
+    return merged
+
+
+def resolve_conflicts_locally(merged, conflicts, join_min_length=80):
+    """
+    Settle conflicts without the model, for extractions of parts of one
+    document: long free-text values are joined in order, anything else takes
+    the first value.
+    """
+    for section, fields in conflicts.items():
+        for field, candidates in fields.items():
+            values = [candidate["value"] for candidate in candidates]
+            if all(isinstance(v, str) for v in values) and any(len(v) >= join_min_length for v in values):
+                distinct = {}
+                for value in values:
+                    distinct.setdefault(_normalize(value), value.strip())
+                merged[section][field] = "\n\n".join(distinct.values())
+            else:
+                merged[section][field] = values[0]
+    return merged
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Modules live at the repository root; the app reads its key and cache
+# location from the environment at import time.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="govai-test-cache-"))
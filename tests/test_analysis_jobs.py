@@ -0,0 +1,35 @@
+import json
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+import analysis_jobs
+
+
+def test_job_passes_solicitation_number_and_refresh_to_the_pipeline(monkeypatch):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    database = SQLAlchemy(app)
+    calls = []
+
+    def pipeline(urls, on_event=None, solicitation_number=None, refresh=False):
+        calls.append((urls, solicitation_number, refresh))
+        return {"summary": "ok"}, 200
+
+    with app.app_context():
+        analysis_jobs.init_analysis_jobs_db(database, pipeline, app.app_context)
+        database.create_all()
+        # Run the job inline once the row is committed.
+        monkeypatch.setattr(analysis_jobs.executor, "submit", lambda fn, *args: None)
+        job = analysis_jobs.submit_analysis_job(["https://example.com/a.pdf"], solicitation_number="W911-25-R-0001",
+                                                refresh=True)
+        analysis_jobs._run_job(job.id)
+
+        database.session.expire_all()
+        job = database.session.get(analysis_jobs.AnalysisJob, job.id)
+        assert calls == [(["https://example.com/a.pdf"], "W911-25-R-0001", True)]
+        assert job.status == "completed"
+        assert json.loads(job.result) == {"summary": "ok"}
+        body = analysis_jobs._job_to_dict(job)
+        assert body["solicitation_number"] == "W911-25-R-0001"
+        assert body["refresh"] is True
@@ -0,0 +1,106 @@
+import io
+import time
+import hashlib
+
+import pytest
+
+import app
+
+
+def _fake_download(contents, delays):
+    def download(url):
+        time.sleep(delays.get(url, 0))
+        body = contents[url]
+        return io.BytesIO(body), hashlib.sha256(body).hexdigest(), "pdf", "miss"
+    return download
+
+
+@pytest.fixture
+def processed(monkeypatch):
+    calls = []
+
+    def prepare(url, source, source_hash, file_type):
+        calls.append(url)
+        return {"file_input": {"type": "input_file", "file_id": f"file-{source_hash[:8]}"}, "sha256": source_hash}
+
+    monkeypatch.setattr(app, "_prepare_attachment", prepare)
+    return calls
+
+
+def test_lowest_url_owns_content_even_when_it_finishes_last(monkeypatch, processed):
+    urls = ["https://x/small.pdf", "https://x/small_copy.pdf", "https://x/other.pdf", "https://x/small.pdf#x"]
+    contents = {urls[0]: b"same", urls[1]: b"same", urls[2]: b"other"}
+    monkeypatch.setattr(app, "_download_attachment", _fake_download(contents, {urls[0]: 0.2}))
+
+    documents, stats = app.download_and_upload_files(urls)
+
+    assert [d["url"] for d in documents] == [urls[0], urls[2]]
+    assert processed.count(urls[0]) + processed.count(urls[1]) == 1
+    assert stats["uploaded"] == 2
+    assert stats["duplicates"] == [
+        {"url": urls[1], "duplicate_of_url": urls[0], "duplicate_of_document_index": 1, "match": "content"},
+        {"url": urls[3], "duplicate_of_url": urls[0], "duplicate_of_document_index": 1, "match": "url"},
+    ]
+    assert stats["download_cache"] == {"hits": 0, "misses": 3}
+
+
+def test_canonical_copy_is_stable_across_download_orders(monkeypatch, processed):
+    urls = ["https://x/a.pdf", "https://x/b.pdf", "https://x/c.pdf"]
+    contents = {url: b"same" for url in urls}
+    reports = []
+    for slow in urls:
+        monkeypatch.setattr(app, "_download_attachment", _fake_download(contents, {slow: 0.1}))
+        documents, stats = app.download_and_upload_files(urls)
+        reports.append(([d["url"] for d in documents], stats["duplicates"]))
+    assert all(report == reports[0] for report in reports)
+    assert reports[0][0] == [urls[0]]
+    assert [d["url"] for d in reports[0][1]] == urls[1:]
+
+
+def test_duplicate_of_skipped_attachment_is_reported_skipped(monkeypatch):
+    urls = ["https://x/a.pdf", "https://x/b.pdf"]
+    contents = {url: b"same" for url in urls}
+    monkeypatch.setattr(app, "_download_attachment", _fake_download(contents, {urls[0]: 0.1}))
+    monkeypatch.setattr(app, "_prepare_attachment", lambda *args: {"skip_reason": "Unsupported file type"})
+
+    documents, stats = app.download_and_upload_files(urls)
+
+    assert documents == []
+    assert stats["skipped"] == 2
+    assert stats["skipped_details"][0] == {"url": urls[0], "reason": "Unsupported file type"}
+    assert "Duplicate of skipped attachment" in stats["skipped_details"][1]["reason"]
+
+
+def test_repeated_urls_are_downloaded_once(monkeypatch, processed):
+    urls = ["https://x/a.pdf", " https://x/a.pdf#page=2 ", "https://x/a.pdf?v=2"]
+    downloads = []
+    download = _fake_download({"https://x/a.pdf": b"a", "https://x/a.pdf?v=2": b"v2"}, {})
+
+    def counting_download(url):
+        downloads.append(url)
+        return download(url)
+
+    monkeypatch.setattr(app, "_download_attachment", counting_download)
+
+    documents, stats = app.download_and_upload_files(urls)
+
+    assert sorted(downloads) == ["https://x/a.pdf", "https://x/a.pdf?v=2"]
+    assert [d["url"] for d in documents] == [urls[0], urls[2]]
+    assert stats["duplicates"] == [
+        {"url": urls[1], "duplicate_of_url": urls[0], "duplicate_of_document_index": 1, "match": "url"},
+    ]
+
+
+def test_skip_events_match_skipped_details(monkeypatch):
+    urls = ["https://x/a.bin", "https://x/b.bin", "https://x/c.bin"]
+    contents = {urls[0]: b"same", urls[1]: b"same", urls[2]: b"other"}
+    # The higher index finishes first and does the (failing) processing.
+    monkeypatch.setattr(app, "_download_attachment", _fake_download(contents, {urls[0]: 0.1, urls[2]: 0.05}))
+    monkeypatch.setattr(app, "_prepare_attachment", lambda *args: {"skip_reason": "Unsupported file type"})
+    events = []
+
+    documents, stats = app.download_and_upload_files(urls, on_event=lambda event, data: events.append(data))
+
+    assert events == [{"url": d["url"], "reason": d["reason"]} for d in stats["skipped_details"]]
+    assert [e["url"] for e in events] == urls
+    assert events[0]["reason"] == "Unsupported file type"
@@ -0,0 +1,221 @@
+import json
+import time
+import hashlib
+import sqlite3
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+import bulk_analysis
+import solicitation_summaries
+from model_router import get_router
+
+
+@pytest.fixture
+def bulk(tmp_path, monkeypatch):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'bulk.db'}"
+    database = SQLAlchemy(app)
+    stubs = SimpleNamespace(app=app, db_path=str(tmp_path / "bulk.db"), uploads=[], extracts=[], summaries=[],
+                            fail_on=set())
+
+    def upload(urls):
+        stubs.uploads.append(urls)
+        documents = [{"url": url, "sha256": hashlib.sha256(url.encode()).hexdigest()} for url in urls]
+        return documents, {"uploaded": len(urls)}
+
+    def extract(document):
+        stubs.extracts.append(document["url"])
+        if document["url"] in stubs.fail_on:
+            raise RuntimeError(f"extraction failed for {document['url']}")
+        return {"overview": {"source": document["url"]}}
+
+    def summarize(extractions):
+        stubs.summaries.append([e["document_index"] for e in extractions])
+        return {"overview": {"documents": [e["document_index"] for e in extractions]}}
+
+    def processing_stats(upload_stats, analyzed, in_summary):
+        return {"documents_uploaded": upload_stats["uploaded"], "documents_analyzed": analyzed,
+                "documents_in_summary": in_summary}
+
+    # One extraction at a time so a failure partway through is deterministic.
+    monkeypatch.setattr(bulk_analysis, "BULK_EXTRACTION_CONCURRENCY", 1)
+    with app.app_context():
+        solicitation_summaries.init_solicitation_summaries_db(database)
+        bulk_analysis.init_bulk_analysis_db(database, app.app_context, upload, extract, summarize, processing_stats)
+        database.create_all()
+    app.register_blueprint(bulk_analysis.bulk_bp)
+    stubs.client = app.test_client()
+    return stubs
+
+
+def _submit(bulk, *url_lists):
+    with bulk.app.app_context():
+        batch = bulk_analysis.submit_batch(
+            [{"solicitation_number": f"SOL-{i}", "urls": urls} for i, urls in enumerate(url_lists)])
+        return batch.id, [item.id for item in bulk_analysis.BulkItem.query.filter_by(batch_id=batch.id)
+                          .order_by(bulk_analysis.BulkItem.position)]
+
+
+def _claim_and_run(bulk, runner):
+    with bulk.app.app_context():
+        item_id = runner._claim_next()
+    assert item_id is not None
+    with bulk.app.app_context():
+        bulk_analysis.run_item(item_id, runner.owner)
+    return item_id
+
+
+def _item(bulk, item_id):
+    with bulk.app.app_context():
+        item = bulk_analysis.db.session.get(bulk_analysis.BulkItem, item_id)
+        return bulk_analysis._item_to_dict(item, include_result=True)
+
+
+def _execute(bulk, sql, *params):
+    # A separate connection, as another process sharing the queue would have.
+    with sqlite3.connect(bulk.db_path) as connection:
+        connection.execute(sql, params)
+
+
+def test_submit_run_and_fetch_result(bulk):
+    response = bulk.client.post("/api/bulk/batches", json={
+        "name": "nightly",
+        "solicitations": [{"solicitation_number": "W911-1", "urls": ["https://x/a.pdf", "https://x/b.pdf"]}],
+    })
+    assert response.status_code == 202
+    batch = response.get_json()
+    assert batch["counts"] == {"queued": 1, "running": 0, "completed": 0, "failed": 0}
+
+    bulk_analysis.BulkRunner(workers=1, max_per_hour=360000).run(until_empty=True)
+
+    assert bulk.client.get(batch["status_url"]).get_json()["counts"]["completed"] == 1
+    items = bulk.client.get(f"{batch['status_url']}/items").get_json()["items"]
+    assert items[0]["status"] == "completed" and items[0]["documents_extracted"] == 2
+    response = bulk.client.get(items[0]["result_url"])
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result["overview"] == {"documents": [1, 2]}
+    assert result["processing_stats"]["documents_in_summary"] == 2
+    assert "summary_id" in result["processing_stats"]
+
+
+def test_resume_skips_checkpointed_extractions(bulk):
+    _, (item_id,) = _submit(bulk, ["https://x/a.pdf", "https://x/b.pdf"])
+    runner = bulk_analysis.BulkRunner(workers=1)
+    bulk.fail_on = {"https://x/b.pdf"}
+
+    _claim_and_run(bulk, runner)
+    item = _item(bulk, item_id)
+    assert item["status"] == "queued" and item["stage"] == "extraction"
+    assert item["attempts"] == 1 and item["documents_extracted"] == 1
+    assert "extraction failed" in item["error"]
+
+    bulk.fail_on = set()
+    _claim_and_run(bulk, runner)
+    item = _item(bulk, item_id)
+    assert item["status"] == "completed" and item["attempts"] == 2
+    assert len(bulk.uploads) == 1
+    assert bulk.extracts == ["https://x/a.pdf", "https://x/b.pdf", "https://x/b.pdf"]
+    assert bulk.summaries == [[1, 2]]
+
+
+def test_degraded_summary_is_returned_but_not_stored(bulk, monkeypatch):
+    _, (item_id,) = _submit(bulk, ["https://x/a.pdf"])
+    summarize = bulk_analysis.stages["summarize"]
+
+    def summarize_with_fallback(extractions):
+        get_router().served_fallback()
+        return summarize(extractions)
+
+    monkeypatch.setitem(bulk_analysis.stages, "summarize", summarize_with_fallback)
+    _claim_and_run(bulk, bulk_analysis.BulkRunner(workers=1))
+
+    stats = _item(bulk, item_id)["result"]["processing_stats"]
+    assert stats["degraded"] is True
+    assert "summary_id" not in stats
+
+
+def test_item_fails_after_max_attempts(bulk, monkeypatch):
+    monkeypatch.setattr(bulk_analysis, "BULK_MAX_ATTEMPTS", 2)
+    _, (item_id,) = _submit(bulk, ["https://x/a.pdf"])
+    bulk.fail_on = {"https://x/a.pdf"}
+    runner = bulk_analysis.BulkRunner(workers=1)
+
+    _claim_and_run(bulk, runner)
+    _claim_and_run(bulk, runner)
+
+    item = _item(bulk, item_id)
+    assert item["status"] == "failed" and item["attempts"] == 2
+    with bulk.app.app_context():
+        assert runner._claim_next() is None
+    assert bulk.client.get(item["result_url"]).status_code == 500
+
+
+def test_crashed_item_is_not_retried_forever(bulk, monkeypatch):
+    monkeypatch.setattr(bulk_analysis, "BULK_MAX_ATTEMPTS", 2)
+    _, (item_id,) = _submit(bulk, ["https://x/a.pdf"])
+    # Two attempts whose process died mid-run: still "running", lease expired.
+    _execute(bulk, "UPDATE bulk_items SET status = 'running', attempts = 2, lease_owner = 'dead', "
+                   "lease_expires_at = ? WHERE id = ?", datetime.utcnow() - timedelta(minutes=1), item_id)
+
+    _claim_and_run(bulk, bulk_analysis.BulkRunner(workers=1))
+
+    item = _item(bulk, item_id)
+    assert item["status"] == "failed" and item["attempts"] == 2
+    assert "did not finish" in item["error"]
+    assert bulk.uploads == []
+
+
+def test_stale_runner_stops_without_overwriting_the_new_owner(bulk, monkeypatch):
+    _, (item_id,) = _submit(bulk, ["https://x/a.pdf", "https://x/b.pdf"])
+    runner = bulk_analysis.BulkRunner(workers=1)
+
+    def extract_while_reclaimed(document):
+        # The lease expired during this call and another runner claimed the item.
+        _execute(bulk, "UPDATE bulk_items SET lease_owner = 'other' WHERE id = ?", item_id)
+        return {"overview": {}}
+
+    monkeypatch.setitem(bulk_analysis.stages, "extract", extract_while_reclaimed)
+    _claim_and_run(bulk, runner)
+
+    with bulk.app.app_context():
+        item = bulk_analysis.db.session.get(bulk_analysis.BulkItem, item_id)
+        assert item.lease_owner == "other"
+        assert item.status == "running" and item.extractions is None
+    assert bulk.summaries == []
+
+
+def test_heartbeat_renews_the_lease_until_it_is_taken_over(bulk):
+    _, (item_id,) = _submit(bulk, ["https://x/a.pdf"])
+    runner = bulk_analysis.BulkRunner(workers=1)
+    with bulk.app.app_context():
+        runner._claim_next()
+        claimed_until = bulk_analysis.db.session.get(bulk_analysis.BulkItem, item_id).lease_expires_at
+
+    with bulk_analysis._LeaseHeartbeat(item_id, runner.owner, interval=0.05) as lease:
+        time.sleep(0.2)
+        with bulk.app.app_context():
+            assert bulk_analysis.db.session.get(bulk_analysis.BulkItem, item_id).lease_expires_at > claimed_until
+        lease.check()
+        _execute(bulk, "UPDATE bulk_items SET lease_owner = 'other' WHERE id = ?", item_id)
+        time.sleep(0.2)
+        with pytest.raises(bulk_analysis.LeaseLost):
+            lease.check()
+
+
+def test_routes_validate_and_report_missing_ids(bulk):
+    assert bulk.client.post("/api/bulk/batches", json={}).status_code == 400
+    assert bulk.client.post("/api/bulk/batches", json={"solicitations": [{"urls": "x"}]}).status_code == 400
+    assert bulk.client.post("/api/bulk/batches", json={"solicitations": ["x"]}).status_code == 400
+    assert bulk.client.get("/api/bulk/batches/missing").status_code == 404
+    assert bulk.client.get("/api/bulk/batches/missing/items").status_code == 404
+    assert bulk.client.get("/api/bulk/items/missing/result").status_code == 404
+
+    _, (item_id,) = _submit(bulk, ["https://x/a.pdf"])
+    response = bulk.client.get(f"/api/bulk/items/{item_id}/result")
+    assert response.status_code == 202
+    assert json.loads(response.data)["status"] == "queued"
@@ -0,0 +1,56 @@
+import os
+import time
+
+from cache_store import SqliteCache
+
+
+def _cache(tmp_path, **options):
+    cache = SqliteCache("cache.db", **options)
+    cache.path = os.path.join(str(tmp_path), "missing", "dir", "cache.db")
+    return cache
+
+
+def test_creates_missing_directory_on_first_use(tmp_path):
+    cache = _cache(tmp_path)
+    cache.set("k", {"a": 1})
+    assert cache.get("k") == {"a": 1}
+    assert os.path.exists(cache.path)
+
+
+def test_expired_entries_are_not_returned(tmp_path):
+    cache = _cache(tmp_path, ttl_seconds=60)
+    cache.set("old", 1, ttl_seconds=0.01)
+    cache.set("new", 2)
+    time.sleep(0.05)
+    assert cache.get("old") is None
+    assert cache.get("new") == 2
+
+
+def test_evicts_least_recently_used_past_max_entries(tmp_path):
+    cache = _cache(tmp_path, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_evicts_by_recorded_size(tmp_path):
+    cache = _cache(tmp_path, max_bytes=100)
+    cache.set("a", 1, size=60)
+    cache.set("b", 2, size=60)
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.stats()["total_size"] == 60
+
+
+def test_clear_by_prefix_treats_wildcards_literally(tmp_path):
+    cache = _cache(tmp_path)
+    cache.set("upload:1", 1)
+    cache.set("upload_2", 2)
+    cache.set("chunks:1", 3)
+    assert cache.clear("upload:") == 1
+    assert cache.get("upload_2") == 2
+    assert cache.get("chunks:1") == 3
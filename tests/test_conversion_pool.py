@@ -0,0 +1,51 @@
+import io
+import os
+import glob
+import tempfile
+
+import pytest
+
+from conversion_pool import ConversionPool
+
+
+def _spools():
+    return set(glob.glob(os.path.join(tempfile.gettempdir(), "conversion-*")))
+
+
+def test_worker_reads_source_from_a_temp_file_that_is_removed_afterwards():
+    pool = ConversionPool(workers=1, timeout_secs=60)
+    before = _spools()
+    try:
+        # An unsupported type makes the worker's converter return None
+        # without needing the rendering libraries.
+        assert pool.convert(io.BytesIO(b"x" * (3 * 1024 * 1024)), "unknown") is None
+        assert pool.convert(io.BytesIO(b"y"), "unknown") is None
+        status = pool.status()
+    finally:
+        pool.shutdown()
+    assert _spools() == before
+    assert status["failed"] == 2
+    assert status["live_workers"] == 1
+
+
+def test_dead_worker_is_not_returned_to_the_pool_when_its_replacement_fails(monkeypatch):
+    pool = ConversionPool(workers=1, timeout_secs=60)
+    try:
+        assert pool.convert(io.BytesIO(b"x"), "unknown") is None
+        (dead,) = pool._live
+        dead.kill()
+
+        def broken_worker():
+            raise OSError("cannot start worker")
+
+        monkeypatch.setattr("conversion_pool._Worker", broken_worker)
+        with pytest.raises(OSError):
+            pool.convert(io.BytesIO(b"x"), "unknown")
+        assert pool.status()["live_workers"] == 0
+        assert pool._slots.queue[0] is None
+
+        monkeypatch.undo()
+        assert pool.convert(io.BytesIO(b"x"), "unknown") is None
+        assert pool.status()["live_workers"] == 1
+    finally:
+        pool.shutdown()
@@ -0,0 +1,113 @@
+import io
+import os
+import hashlib
+from contextlib import contextmanager
+
+import app
+from http_cache import HttpBodyCache
+
+
+def _store(cache, url, body, **validators):
+    sha256 = hashlib.sha256(body).hexdigest()
+    cache.store(url, io.BytesIO(body), sha256, len(body), etag=validators.get("etag", '"v1"'),
+                last_modified=validators.get("last_modified"), content_type="application/pdf")
+    return sha256
+
+
+def _read(cache, url):
+    entry, body = cache.lookup(url)
+    if entry is None:
+        return None
+    with body:
+        return entry, body.read()
+
+
+def test_store_and_lookup(tmp_path):
+    cache = HttpBodyCache(str(tmp_path), max_bytes=0)
+    assert cache.lookup("https://x/a.pdf") == (None, None)
+    sha256 = _store(cache, "https://x/a.pdf", b"%PDF-a", etag='"abc"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+
+    entry, body = _read(cache, "https://x/a.pdf")
+    assert body == b"%PDF-a"
+    assert entry == {"sha256": sha256, "etag": '"abc"', "last_modified": "Mon, 01 Jan 2024 00:00:00 GMT",
+                     "content_type": "application/pdf"}
+
+
+def test_urls_with_the_same_content_share_one_body(tmp_path):
+    cache = HttpBodyCache(str(tmp_path), max_bytes=0)
+    sha256 = _store(cache, "https://x/a.pdf", b"same")
+    _store(cache, "https://mirror/a.pdf", b"same")
+
+    assert _read(cache, "https://mirror/a.pdf")[1] == b"same"
+    assert cache.stats() == {"urls": 2, "bodies": 1, "total_size": 4, "max_bytes": 0}
+    assert os.listdir(tmp_path / sha256[:2]) == [sha256]
+
+
+def test_least_recently_used_bodies_are_evicted_by_size(tmp_path, monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr("http_cache.time.time", lambda: next(clock))
+    cache = HttpBodyCache(str(tmp_path), max_bytes=10)
+    _store(cache, "https://x/a", b"aaaa")
+    old = _store(cache, "https://x/b", b"bbbb")
+    _read(cache, "https://x/a")
+    _store(cache, "https://x/c", b"cccc")
+
+    assert _read(cache, "https://x/b") is None
+    assert _read(cache, "https://x/a")[1] == b"aaaa"
+    assert _read(cache, "https://x/c")[1] == b"cccc"
+    assert not os.path.exists(tmp_path / old[:2] / old)
+    assert cache.stats()["total_size"] == 8
+
+
+def test_missing_body_file_drops_its_index_rows(tmp_path):
+    cache = HttpBodyCache(str(tmp_path), max_bytes=0)
+    sha256 = _store(cache, "https://x/a.pdf", b"gone")
+    _store(cache, "https://mirror/a.pdf", b"gone")
+    os.remove(tmp_path / sha256[:2] / sha256)
+
+    assert cache.lookup("https://x/a.pdf") == (None, None)
+    assert cache.stats() == {"urls": 0, "bodies": 0, "total_size": 0, "max_bytes": 0}
+
+
+class _Response:
+    def __init__(self, status_code, chunks=(), headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._chunks = chunks
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        return iter(self._chunks)
+
+
+def _serve(monkeypatch, response, seen_headers=None):
+    @contextmanager
+    def http_get(url, stream=True, headers=None):
+        if seen_headers is not None:
+            seen_headers.append(headers)
+        yield response
+
+    monkeypatch.setattr(app, "http_get", http_get)
+
+
+def test_unusable_download_reports_bypass_when_cache_is_disabled(monkeypatch):
+    monkeypatch.setattr(app, "HTTP_CACHE_ENABLED", False)
+    _serve(monkeypatch, _Response(200, [b"<html>not a document</html>"]))
+    assert app._download_attachment("https://x/file") == (None, None, "unknown", "bypass")
+
+
+def test_not_modified_response_is_served_from_the_cache(tmp_path, monkeypatch):
+    cache = HttpBodyCache(str(tmp_path), max_bytes=0)
+    monkeypatch.setattr(app, "http_cache", cache)
+    monkeypatch.setattr(app, "HTTP_CACHE_ENABLED", True)
+    sha256 = _store(cache, "https://x/a.pdf", b"%PDF-1.4 cached", etag='"v1"')
+    seen_headers = []
+    _serve(monkeypatch, _Response(304), seen_headers)
+
+    body, digest, file_type, status = app._download_attachment("https://x/a.pdf")
+    with body:
+        assert body.read() == b"%PDF-1.4 cached"
+    assert (digest, file_type, status) == (sha256, "pdf", "hit")
+    assert seen_headers == [{"If-None-Match": '"v1"'}]
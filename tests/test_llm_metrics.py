@@ -0,0 +1,97 @@
+import re
+import time
+
+import pytest
+
+import llm_metrics
+from llm_metrics import Histogram
+
+
+@pytest.fixture
+def series(monkeypatch):
+    monkeypatch.setattr(llm_metrics, "_series", {})
+    monkeypatch.setattr(llm_metrics, "LLM_METRICS_TABLE_ENABLED", False)
+    return llm_metrics._series
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram((1, 5, 10))
+    assert histogram.quantile(0.5) is None
+    for value in (0.5, 1, 3, 4, 9, 50):
+        histogram.observe(value)
+    assert histogram.counts == [2, 2, 1, 1]
+    assert list(histogram.cumulative()) == [(1, 2), (5, 4), (10, 5), (float("inf"), 6)]
+    assert histogram.sum == 67.5 and histogram.count == 6
+    assert histogram.quantile(0.3) == 1
+    assert histogram.quantile(0.5) == 5
+    assert histogram.quantile(0.8) == 10
+    assert histogram.quantile(1.0) == float("inf")
+
+
+def test_record_call_counts_successes_and_failures(series):
+    llm_metrics.record_call("extraction.document", "gpt-4o", prompt_tokens=1200, completion_tokens=300,
+                            request_latency=2.0, call_latency=3.0, queue_wait=0.5, retries=1)
+    llm_metrics.record_call("extraction.document", "gpt-4o", call_latency=40.0, retries=3, error="timeout")
+    llm_metrics.record_error("extraction.document", "gpt-4o", "timeout")
+
+    (row,) = llm_metrics.snapshot()
+    assert row["calls"] == 2 and row["succeeded"] == 1 and row["failed"] == 1
+    assert row["retries"] == 4 and row["errors"] == {"timeout": 1}
+    assert row["total_tokens"] == 1500
+    assert row["request_latency_p95"] == 2
+    assert row["call_latency_p95"] == 60
+    assert row["call_latency_avg"] == 21.5
+
+
+def test_query_calls_filters_by_window_and_call_site(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_metrics, "LLM_METRICS_DB", str(tmp_path / "metrics.db"))
+    now = time.time()
+    rows = [
+        (now - 60, "chat.message", "gpt-4o", 100, 20, 1.0, 1.0, 0.0, 0, None),
+        (now - 30, "chat.message", "gpt-4o", 100, 20, 2.0, 3.0, 0.0, 1, None),
+        (now - 10, "chat.message", "gpt-4o", 0, 0, None, 9.0, 0.0, 2, "timeout"),
+        (now - 10, "summary.merge", "gpt-4o", 5000, 800, 20.0, 20.0, 0.0, 0, None),
+        (now - 7200, "chat.message", "gpt-4o", 100, 20, 1.0, 1.0, 0.0, 0, None),
+    ]
+    conn = llm_metrics._connect()
+    conn.executemany("""INSERT INTO llm_calls (ts, call_site, model, prompt_tokens, completion_tokens,
+        request_latency, call_latency, queue_wait, retries, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+    conn.commit()
+    conn.close()
+
+    everything = llm_metrics.query_calls(hours=1)
+    assert [g["call_site"] for g in everything] == ["summary.merge", "chat.message"]
+
+    (chat,) = llm_metrics.query_calls(hours=1, call_site="chat.message")
+    assert chat == {
+        "call_site": "chat.message", "model": "gpt-4o", "calls": 3, "errors": 1, "retries": 3,
+        "prompt_tokens": 200, "completion_tokens": 40, "total_tokens": 240, "error_rate": 0.3333,
+        "latency_p50": 3.0, "latency_p95": 9.0, "latency_max": 9.0,
+    }
+    assert llm_metrics.query_calls(hours=3, call_site="chat.message")[0]["calls"] == 4
+
+
+_SAMPLE = re.compile(r'^[a-z_]+(\{([a-z_]+="([^"\\]|\\.)*",?)*\})? -?[0-9.e+]+$')
+
+
+def test_prometheus_output_is_valid_exposition_text(series):
+    llm_metrics.record_call('quote."negotiation"', None, prompt_tokens=700, completion_tokens=50,
+                            request_latency=0.3, call_latency=0.4)
+    llm_metrics.record_error('quote."negotiation"', None, "rate_limit")
+    text = llm_metrics.render_prometheus()
+
+    assert text.endswith("\n")
+    lines = text.splitlines()
+    for line in lines:
+        assert line.startswith("# HELP ") or line.startswith("# TYPE ") or _SAMPLE.match(line), line
+    labels = 'call_site="quote.\\"negotiation\\"",model=""'
+    assert f'llm_calls_total{{{labels},outcome="success"}} 1' in lines
+    assert f'llm_calls_total{{{labels},outcome="error"}} 0' in lines
+    assert f'llm_errors_total{{{labels},kind="rate_limit"}} 1' in lines
+    assert f'llm_tokens_total{{{labels},direction="prompt"}} 700' in lines
+    assert "# TYPE llm_request_duration_seconds histogram" in lines
+    assert f'llm_request_duration_seconds_bucket{{{labels},le="0.25"}} 0' in lines
+    assert f'llm_request_duration_seconds_bucket{{{labels},le="0.5"}} 1' in lines
+    assert f'llm_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1' in lines
+    assert f'llm_request_duration_seconds_count{{{labels}}} 1' in lines
+    assert f'llm_prompt_tokens_bucket{{{labels},le="1000"}} 1' in lines
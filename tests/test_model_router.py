@@ -0,0 +1,157 @@
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import llm_gateway
+from model_router import CLOSED, HALF_OPEN, OPEN, ModelHealth, ModelRouter, track_degraded
+
+
+def _health(**options):
+    defaults = dict(window_secs=60, min_samples=4, error_rate_threshold=0.5, consecutive_failures=3, open_secs=0.05)
+    return ModelHealth("m", **dict(defaults, **options))
+
+
+def test_consecutive_failures_open_the_circuit():
+    health = _health(min_samples=100)
+    for _ in range(2):
+        health.record(None, ok=False)
+    assert health.state == CLOSED and health.allow()
+    health.record(None, ok=False)
+    assert health.state == OPEN
+    assert not health.allow()
+
+
+def test_error_rate_opens_the_circuit_once_there_are_enough_samples():
+    health = _health(consecutive_failures=100)
+    health.record(1.0, ok=True)
+    health.record(None, ok=False)
+    health.record(1.0, ok=True)
+    assert health.state == CLOSED
+    health.record(None, ok=False)
+    assert health.state == OPEN
+
+
+def test_half_open_lets_one_probe_through_and_success_closes():
+    health = _health()
+    for _ in range(3):
+        health.record(None, ok=False)
+    time.sleep(0.06)
+    assert health.allow()
+    assert health.state == HALF_OPEN
+    assert not health.allow()
+    health.record(0.5, ok=True)
+    assert health.state == CLOSED
+    assert health.status()["samples"] == 0
+    assert health.allow()
+
+
+def test_failed_probe_reopens_for_longer():
+    health = _health()
+    for _ in range(3):
+        health.record(None, ok=False)
+    time.sleep(0.06)
+    assert health.allow()
+    health.record(None, ok=False)
+    assert health.state == OPEN
+    assert health.open_secs == pytest.approx(0.1)
+    assert health.times_opened == 2
+
+
+def test_released_probe_can_be_claimed_again():
+    health = _health()
+    for _ in range(3):
+        health.record(None, ok=False)
+    time.sleep(0.06)
+    assert health.allow()
+    health.release_probe()
+    assert health.allow()
+
+
+def test_p95_needs_min_samples_and_ignores_failures():
+    health = _health(consecutive_failures=100, error_rate_threshold=1.1)
+    for latency in (1, 2, 3):
+        health.record(latency, ok=True)
+    assert health.p95() is None
+    health.record(None, ok=False)
+    for latency in range(4, 21):
+        health.record(latency, ok=True)
+    assert health.p95() == 20
+
+
+def test_candidates_follow_the_fallback_chain_without_cycles():
+    router = ModelRouter(fallbacks={"a": "b", "b": "c", "c": "a"}, latency_budgets={})
+    assert router.candidates("quote.x", "a") == ["a", "b", "c"]
+    assert router.candidates("quote.x", "z") == ["z"]
+
+
+def test_budgets_match_call_site_before_feature():
+    router = ModelRouter(fallbacks={}, latency_budgets={"chat.message": 20, "summary": 90})
+    assert router.latency_budget("chat.message") == 20
+    assert router.latency_budget("chat.other") is None
+    assert router.latency_budget("summary.merge") == 90
+
+
+def test_default_budget_covers_only_interactive_chat():
+    router = ModelRouter(fallbacks={})
+    assert router.latency_budget("chat.message") is not None
+    assert router.latency_budget("summary.merge") is None
+
+
+def test_slow_primary_is_tried_after_its_fallback_on_budgeted_sites():
+    router = ModelRouter(fallbacks={"big": "small"}, latency_budgets={"chat.message": 5})
+    health = router.health("big")
+    for _ in range(10):
+        health.record(30.0, ok=True)
+    assert router.candidates("chat.message", "big") == ["small", "big"]
+    assert router.candidates("quote.negotiation", "big") == ["big", "small"]
+
+
+def test_degraded_answers_are_counted_per_run():
+    router = ModelRouter(fallbacks={}, latency_budgets={})
+    with track_degraded() as run:
+        router.served_fallback()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(contextvars.copy_context().run, router.served_cached).result()
+        # A concurrent run in another thread keeps its own count.
+        other = threading.Thread(target=router.served_fallback)
+        other.start()
+        other.join()
+    router.served_cached()
+    assert run == {"fallback_answers": 1, "cached_answers": 1}
+    assert router.status()["fallback_answers"] == 2 and router.status()["cached_answers"] == 2
+
+
+class _Throttled(Exception):
+    status_code = 429
+    response = None
+
+
+def test_gateway_does_not_count_rate_limits_as_model_failures(monkeypatch):
+    gateway = llm_gateway.LLMGateway(max_attempts=1)
+    gateway.router = ModelRouter(fallbacks={}, latency_budgets={})
+
+    def create(**kwargs):
+        raise _Throttled("rate limited")
+
+    monkeypatch.setattr(gateway.client.chat.completions.with_raw_response, "create", create)
+    monkeypatch.setattr(llm_gateway, "limiter_for", lambda model: _NoLimit())
+    for _ in range(10):
+        with pytest.raises(_Throttled):
+            gateway.chat("quote.test", model="throttled-model", messages=[])
+    status = gateway.router.health("throttled-model").status()
+    assert status["state"] == CLOSED
+    assert status["samples"] == 0
+
+
+class _NoLimit:
+    def acquire(self, timeout=None):
+        return 0.0
+
+    def pause(self, seconds):
+        pass
+
+    def update_from_headers(self, headers):
+        pass
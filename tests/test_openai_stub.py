@@ -0,0 +1,137 @@
+import io
+import json
+
+import pytest
+
+from openai_stub import StubState, _schema_default, create_stub_app, parse_latency
+from schemas import SCHEMAS, response_format, validate
+
+
+@pytest.fixture
+def state(tmp_path):
+    state = StubState(fixtures_dir=str(tmp_path), seed=0)
+    state.config.update(latency="fixed:0", latency_files="fixed:0")
+    return state
+
+
+@pytest.fixture
+def client(state):
+    return create_stub_app(state).test_client()
+
+
+def _chat(content="Hello", **fields):
+    return dict({"model": "gpt-4o-mini", "messages": [{"role": "user", "content": content}]}, **fields)
+
+
+def test_fixture_key_ignores_unkeyed_fields_and_key_order(state):
+    key = state.fixture_key("chat", _chat())
+    assert state.fixture_key("chat", _chat(user="u1", metadata={"run": 2}, stream=False, store=True)) == key
+    assert state.fixture_key("chat", dict(reversed(list(_chat().items())))) == key
+    assert state.fixture_key("chat", _chat(model="gpt-4o")) != key
+    assert state.fixture_key("responses", _chat()) != key
+
+
+def test_saved_fixture_is_replayed(state, client):
+    recorded = {"id": "chatcmpl-recorded", "object": "chat.completion", "choices": [],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 0, "total_tokens": 3}}
+    state.save_fixture("chat", state.fixture_key("chat", _chat()), _chat(), recorded)
+
+    response = client.post("/v1/chat/completions", json=_chat(user="someone-else"))
+    assert response.status_code == 200
+    assert response.get_json() == recorded
+    miss = client.post("/v1/chat/completions", json=_chat("Something else"))
+    assert miss.get_json()["choices"][0]["message"]["content"] == "Stub reply."
+    assert state.stats["chat"] == {"requests": 2, "fixture_hits": 1, "synthesized": 1}
+
+
+def test_missing_fixture_can_be_an_error(tmp_path):
+    client = create_stub_app(StubState(fixtures_dir=str(tmp_path), seed=0, on_miss="error")).test_client()
+    response = client.post("/v1/responses", json={"model": "gpt-4o", "input": "hi"})
+    assert response.status_code == 400
+    assert response.get_json()["error"]["code"] == "stub_fixture_missing"
+
+
+@pytest.mark.parametrize("name", [name for name, entry in SCHEMAS.items() if entry["strict"]])
+def test_schema_default_satisfies_strict_schemas(name):
+    schema = SCHEMAS[name]["schema"]
+    assert validate(schema, _schema_default(schema)) == []
+
+
+def test_schema_default_handles_refs_any_of_and_null():
+    schema = {
+        "$defs": {"line": {"type": "object", "properties": {"qty": {"type": "integer"}, "tags": {"type": "array"}}}},
+        "type": "object",
+        "properties": {
+            "note": {"anyOf": [{"type": "null"}, {"type": "string"}]},
+            "price": {"type": ["number", "null"]},
+            "line": {"$ref": "#/$defs/line"},
+            "status": {"type": "string", "enum": ["open", "closed"]},
+        },
+    }
+    assert _schema_default(schema) == {"note": None, "price": None, "line": {"qty": 0, "tags": []},
+                                       "status": "open"}
+
+
+def test_synthesized_reply_follows_the_requested_schema(client):
+    response = client.post("/v1/chat/completions", json=_chat(response_format=response_format("email_quote")))
+    content = json.loads(response.get_json()["choices"][0]["message"]["content"])
+    assert validate(SCHEMAS["email_quote"]["schema"], content) == []
+
+    body = {"model": "gpt-4o", "input": "hi", "text": {"format": {"type": "json_object"}}}
+    reply = client.post("/v1/responses", json=body).get_json()
+    assert reply["output"][0]["content"][0]["text"] == "{}"
+
+
+def test_injected_errors(state, client):
+    state.config.update(error_rate_429=1.0, retry_after_secs=2.5)
+    response = client.post("/v1/chat/completions", json=_chat())
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "2.5"
+    assert response.get_json()["error"]["code"] == "rate_limit_exceeded"
+
+    state.config.update(error_rate_429=0.0, error_rate_500=1.0)
+    assert client.post("/v1/responses", json={"model": "gpt-4o", "input": "hi"}).status_code == 500
+    assert state.stats["chat"]["injected_429"] == 1 and state.stats["responses"]["injected_500"] == 1
+
+
+def test_requests_per_minute_limit(state, client):
+    state.config["requests_per_minute"] = 2
+    first = client.post("/v1/chat/completions", json=_chat())
+    assert first.headers["x-ratelimit-limit-requests"] == "2"
+    assert first.headers["x-ratelimit-remaining-requests"] == "1"
+    assert client.post("/v1/chat/completions", json=_chat()).status_code == 200
+    assert client.post("/v1/chat/completions", json=_chat()).status_code == 429
+
+
+def test_config_is_validated_before_anything_is_applied(state, client):
+    assert client.post("/stub/config", json={"error_rate_9000": 1}).status_code == 400
+    assert client.post("/stub/config", json={"latency_chat": "uniform:1"}).status_code == 400
+    assert client.post("/stub/config", json={"latency": "poisson:1"}).status_code == 400
+    response = client.post("/stub/config", json={"error_rate_500": 0.5, "requests_per_minute": "lots"})
+    assert response.status_code == 400
+    assert state.config["error_rate_500"] == 0.0
+
+    response = client.post("/stub/config", json={"requests_per_minute": "30", "latency_chat": "uniform:0:0.01"})
+    assert response.status_code == 200
+    assert response.get_json()["requests_per_minute"] == 30
+    assert client.get("/stub/stats").get_json()["config"]["latency_chat"] == "uniform:0:0.01"
+
+
+def test_parse_latency():
+    assert parse_latency("") is None
+    assert parse_latency("fixed:0.25")(None) == 0.25
+    with pytest.raises(ValueError):
+        parse_latency("normal:1")
+
+
+def test_file_upload_lookup_and_delete(client):
+    response = client.post("/v1/files", data={"purpose": "user_data", "file": (io.BytesIO(b"%PDF-1.4"), "a.pdf")})
+    file_id = response.get_json()["id"]
+    assert file_id.startswith("file-stub")
+    again = client.post("/v1/files", data={"purpose": "user_data", "file": (io.BytesIO(b"%PDF-1.4"), "b.pdf")})
+    assert again.get_json() == response.get_json()
+
+    assert client.get(f"/v1/files/{file_id}").get_json()["bytes"] == 8
+    assert client.delete(f"/v1/files/{file_id}").get_json()["deleted"] is True
+    assert client.get(f"/v1/files/{file_id}").status_code == 404
+    assert client.post("/v1/files", data={"purpose": "user_data"}).status_code == 400
@@ -0,0 +1,90 @@
+import time
+from email.utils import formatdate
+
+import pytest
+
+from rate_limiter import AdaptiveRateLimiter, low_token_watermark, parse_reset_duration, retry_after_seconds
+
+
+def test_parse_reset_duration():
+    assert parse_reset_duration("20ms") == pytest.approx(0.02)
+    assert parse_reset_duration("1s") == 1
+    assert parse_reset_duration("6m0s") == 360
+    assert parse_reset_duration("1h2m3.5s") == pytest.approx(3723.5)
+    assert parse_reset_duration("") is None
+    assert parse_reset_duration("soon") is None
+
+
+def test_retry_after_prefers_milliseconds_then_seconds_then_resets():
+    assert retry_after_seconds({"retry-after-ms": "1500", "retry-after": "9"}) == 1.5
+    assert retry_after_seconds({"retry-after": "9"}) == 9
+    assert retry_after_seconds({"x-ratelimit-reset-requests": "2s", "x-ratelimit-reset-tokens": "500ms"}) == 2
+    assert retry_after_seconds({}) is None
+
+
+def test_retry_after_http_date():
+    wait = retry_after_seconds({"retry-after": formatdate(time.time() + 30, usegmt=True)})
+    assert 25 <= wait <= 31
+
+
+def test_burst_is_served_immediately_then_callers_wait():
+    limiter = AdaptiveRateLimiter(requests_per_minute=60, burst=3)
+    for _ in range(3):
+        assert limiter.acquire(timeout=0) == pytest.approx(0, abs=0.01)
+    assert limiter.acquire(timeout=0.1) is None
+
+
+def test_refill_rate_follows_the_reported_limit():
+    limiter = AdaptiveRateLimiter(requests_per_minute=60, burst=1)
+    assert limiter.acquire(timeout=0) is not None
+    limiter.update_from_headers({"x-ratelimit-limit-requests": "6000"})
+    assert limiter.status()["requests_per_minute"] == 6000
+    waited = limiter.acquire(timeout=1)
+    assert waited is not None and waited < 0.1
+
+
+def test_remaining_requests_cap_the_bucket():
+    limiter = AdaptiveRateLimiter(requests_per_minute=60, burst=10)
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "0"})
+    assert limiter.acquire(timeout=0.1) is None
+
+
+def test_pause_blocks_every_caller_until_it_ends():
+    limiter = AdaptiveRateLimiter(requests_per_minute=6000, burst=10)
+    limiter.pause(0.2)
+    assert limiter.acquire(timeout=0.05) is None
+    waited = limiter.acquire(timeout=1)
+    assert waited is not None and waited >= 0.1
+
+
+def test_low_token_budget_pauses_until_the_window_resets():
+    limiter = AdaptiveRateLimiter(requests_per_minute=6000, burst=10)
+    limiter.update_from_headers({"x-ratelimit-limit-tokens": "30000", "x-ratelimit-remaining-tokens": "1000",
+                                 "x-ratelimit-reset-tokens": "30s"})
+    assert limiter.status()["paused_for_seconds"] > 29
+    assert limiter.acquire(timeout=0.05) is None
+
+
+def test_token_watermark_scales_with_the_token_limit():
+    limiter = AdaptiveRateLimiter(requests_per_minute=6000, burst=10)
+    # A small tier with most of its window left must not pause.
+    limiter.update_from_headers({"x-ratelimit-limit-tokens": "20000", "x-ratelimit-remaining-tokens": "15000",
+                                 "x-ratelimit-reset-tokens": "30s"})
+    assert limiter.status()["paused_for_seconds"] == 0
+    # Nor without a limit to measure against.
+    limiter.update_from_headers({"x-ratelimit-remaining-tokens": "10", "x-ratelimit-reset-tokens": "30s"})
+    assert limiter.status()["paused_for_seconds"] == 0
+    assert low_token_watermark("2000000") == 100000
+    assert low_token_watermark(None) is None
+
+
+def test_absolute_token_watermark_overrides_the_fraction(monkeypatch):
+    monkeypatch.setattr("rate_limiter.LOW_TOKEN_WATERMARK", 500)
+    assert low_token_watermark("2000000") == 500
+    assert low_token_watermark(None) == 500
+
+
+def test_malformed_headers_are_ignored():
+    limiter = AdaptiveRateLimiter(requests_per_minute=60, burst=2)
+    limiter.update_from_headers({"x-ratelimit-limit-requests": "lots"})
+    assert limiter.status()["requests_per_minute"] == 60
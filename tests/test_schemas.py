@@ -0,0 +1,82 @@
+import pytest
+
+from schemas import (SCHEMAS, StructuredOutputError, _repair_text, _strip_to_json, get_schema_stats, parse_reply,
+                     repair, validate)
+
+
+def _email_quote(**fields):
+    reply = {
+        "is_quote_response": True,
+        "total_price": 1200.0,
+        "unit_price": None,
+        "delivery_timeline": "2 weeks",
+        "payment_terms": None,
+        "key_points": ["free shipping"],
+        "is_negotiation": False,
+        "sentiment": "positive",
+        "requires_followup": False,
+        "summary": "Quote received.",
+    }
+    reply.update(fields)
+    return reply
+
+
+def test_validate_reports_missing_unexpected_and_mistyped_fields():
+    schema = SCHEMAS["compliance_summary"]["schema"]
+    errors = validate(schema, {"executive_summary": 3, "key_risks": [], "extra": 1})
+    assert "$.recommended_actions: missing" in errors
+    assert "$.extra: unexpected field" in errors
+    assert "$.executive_summary: expected string, got int" in errors
+
+
+def test_repair_converts_scalars_and_fills_defaults():
+    schema = SCHEMAS["email_quote"]["schema"]
+    value = _email_quote(total_price="$1,200", is_negotiation="yes", key_points="free shipping",
+                         sentiment="Positive", extra="dropped")
+    del value["payment_terms"]
+    repaired = []
+    result = repair(schema, value, repaired=repaired)
+    assert result == _email_quote(total_price=1200, is_negotiation=True)
+    assert not validate(schema, result)
+    assert set(repaired) == {"$.total_price", "$.is_negotiation", "$.key_points", "$.sentiment", "$.extra",
+                             "$.payment_terms"}
+
+
+def test_repair_drops_unusable_list_items():
+    schema = SCHEMAS["opportunity_scores"]["schema"]
+    value = {"scores": [{"id": "a", "score": "87", "reason": "fit"}, {"id": "b", "score": "high", "reason": "?"}]}
+    assert repair(schema, value) == {"scores": [{"id": "a", "score": 87, "reason": "fit"}]}
+
+
+def test_repair_raises_when_a_required_field_has_no_default():
+    schema = SCHEMAS["compliance_summary"]["schema"]
+    with pytest.raises(StructuredOutputError):
+        repair(schema, {"key_risks": [], "recommended_actions": []})
+
+
+def test_strip_to_json_removes_fences_and_prose():
+    assert _strip_to_json('Here you go:\n```json\n{"a": [1, 2]}\n```\nThanks') == '{"a": [1, 2]}'
+    assert _strip_to_json('Result: {"a": "}"} trailing') == '{"a": "}"}'
+
+
+def test_repair_text_fixes_trailing_commas_literals_and_truncation():
+    assert _repair_text('{"a": [1, 2,], "b": None,}') == '{"a": [1, 2], "b": null}'
+    assert _repair_text('{"a": {"b": "cut off') == '{"a": {"b": "cut off"}}'
+    assert _repair_text('{"a": 1, "b":') == '{"a": 1, "b": null}'
+
+
+def test_parse_reply_counts_outcomes():
+    parse_reply("compliance_summary", '{"executive_summary": "ok", "key_risks": [], "recommended_actions": []}',
+                call_site="test.clean")
+    value = parse_reply("compliance_summary", '```json\n{"executive_summary": "ok", "key_risks": "late",}',
+                        call_site="test.repaired")
+    assert value == {"executive_summary": "ok", "key_risks": ["late"], "recommended_actions": []}
+    with pytest.raises(StructuredOutputError) as error:
+        parse_reply("compliance_summary", "no json here", call_site="test.failed")
+    assert error.value.raw == "no json here"
+
+    stats = get_schema_stats()
+    assert stats["test.clean"]["clean"] == 1
+    assert stats["test.repaired"]["text_repairs"] == 1 and stats["test.repaired"]["field_repairs"] == 1
+    assert stats["test.repaired"]["parse_failure_rate"] == 1.0
+    assert stats["test.failed"]["unparseable"] == 1
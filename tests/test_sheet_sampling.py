@@ -0,0 +1,99 @@
+import io
+
+from openpyxl import Workbook
+
+from document_conversion import SHEET_MAX_ROWS, _column_name, _sample_sheet, extract_text
+
+
+def _csv(lines):
+    return io.BytesIO("\n".join(lines).encode("utf-8"))
+
+
+def test_column_names():
+    assert [_column_name(i) for i in (0, 25, 26, 701, 702)] == ["A", "Z", "AA", "ZZ", "AAA"]
+
+
+def test_sample_detects_header_and_trims_empty_rows_and_columns():
+    rows = [("Item", "Qty", None), (None, None, None), ("Bolts", 10, None), ("Nuts", 20, "")]
+    sample = _sample_sheet(iter(rows), max_rows=10, max_cols=10)
+    assert sample == {
+        "header": ["Item", "Qty"],
+        "rows": [["Bolts", "10"], ["Nuts", "20"]],
+        "header_detected": True,
+        "omitted_rows": 0,
+        "more_columns": False,
+    }
+
+
+def test_numeric_first_row_is_data_not_header():
+    sample = _sample_sheet(iter([(1, 2), (3, 4)]), max_rows=10, max_cols=10)
+    assert sample["header"] == ["A", "B"]
+    assert sample["rows"] == [["1", "2"], ["3", "4"]]
+
+
+def test_sample_caps_rows_and_counts_the_rest_when_total_is_unknown():
+    rows = [("Item", "Qty")] + [(f"item{i}", i) for i in range(100)]
+    sample = _sample_sheet(iter(rows), max_rows=5, max_cols=10)
+    assert len(sample["rows"]) == 5
+    assert sample["rows"][0] == ["item0", "0"]
+    assert sample["omitted_rows"] == 95
+
+
+def test_sample_stops_reading_when_total_is_known():
+    consumed = []
+
+    def rows():
+        yield ("Item", "Qty")
+        for i in range(1000):
+            consumed.append(i)
+            yield (f"item{i}", i)
+
+    sample = _sample_sheet(rows(), total_rows=1001, max_rows=5, max_cols=10)
+    assert len(sample["rows"]) == 5
+    assert sample["omitted_rows"] == 995
+    assert len(consumed) < 10
+
+
+def test_sample_flags_dropped_columns():
+    sample = _sample_sheet(iter([("a", "b", "c", "d")]), max_rows=5, max_cols=2)
+    assert sample["rows"] == [["a", "b"]]
+    assert sample["more_columns"]
+    assert _sample_sheet(iter([(None, ""), ()]), max_rows=5, max_cols=2) is None
+
+
+def test_csv_text_warns_about_sampling():
+    extra = 7
+    lines = ["Item,Qty"] + [f"item{i},{i}" for i in range(SHEET_MAX_ROWS + extra)]
+    warnings = []
+    text = extract_text(_csv(lines), "csv", warnings)
+    assert text.splitlines()[:3] == ["| Item | Qty |", "|---|---|", "| item0 | 0 |"]
+    assert f"item{SHEET_MAX_ROWS - 1}" in text and f"item{SHEET_MAX_ROWS}" not in text
+    assert warnings == [f"CSV sampled: first {SHEET_MAX_ROWS} data rows kept, {extra} omitted"]
+
+
+def test_xlsx_text_has_one_table_per_sheet():
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Pricing"
+    sheet.append(["CLIN", "Price"])
+    sheet.append(["0001", 12.5])
+    workbook.create_sheet("Empty")
+    notes = workbook.create_sheet("Notes")
+    notes.append(["Deliver | by March"])
+    source = io.BytesIO()
+    workbook.save(source)
+
+    warnings = []
+    text = extract_text(source, "xlsx", warnings)
+    assert "## Sheet: Pricing\n\n| CLIN | Price |\n|---|---|\n| 0001 | 12.5 |" in text
+    assert "## Sheet: Empty" not in text
+    assert "Deliver \\| by March" in text
+    assert warnings == []
+
+
+def test_long_text_is_truncated_with_a_warning(monkeypatch):
+    monkeypatch.setattr("document_conversion.TEXT_INPUT_MAX_CHARS", 10)
+    warnings = []
+    text = extract_text(io.BytesIO(b"0123456789abcdef"), "txt", warnings)
+    assert text.startswith("0123456789\n\n[... truncated after 10 characters ...]")
+    assert warnings == ["Text truncated: first 10 of 16 characters kept"]
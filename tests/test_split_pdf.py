@@ -0,0 +1,35 @@
+import io
+
+from pypdf import PdfReader, PdfWriter
+
+from document_conversion import split_pdf
+
+
+def _pdf(pages, password=None):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    if password:
+        writer.encrypt(password)
+    out = io.BytesIO()
+    writer.write(out)
+    out.seek(0)
+    return out
+
+
+def test_short_pdfs_are_sent_whole():
+    assert split_pdf(_pdf(5), pages_per_chunk=2, min_pages=5) is None
+
+
+def test_long_pdfs_are_split_into_page_ranges():
+    source = _pdf(7)
+    source.seek(3)
+    chunks = split_pdf(source, pages_per_chunk=3, min_pages=5)
+    assert [(c["first_page"], c["last_page"]) for c in chunks] == [(1, 3), (4, 6), (7, 7)]
+    assert [len(PdfReader(io.BytesIO(c["data"])).pages) for c in chunks] == [3, 3, 1]
+    assert source.tell() == 0
+
+
+def test_unsplittable_pdfs_are_sent_whole():
+    assert split_pdf(_pdf(10, password="secret"), pages_per_chunk=3, min_pages=5) is None
+    assert split_pdf(io.BytesIO(b"%PDF-1.4 not really"), pages_per_chunk=3, min_pages=5) is None
@@ -0,0 +1,88 @@
+import pytest
+
+from summary_merge import apply_resolutions, merge_extractions, resolve_conflicts_locally, schema_from_prompt
+
+SCHEMA = {
+    "overview": {"agency": None, "due_date": None, "set_aside": None},
+    "requirements": {"items": [], "certifications": []},
+}
+
+
+def test_schema_from_prompt_reads_the_embedded_template():
+    prompt = 'Extract:\n{"overview": {"agency": null, "tags": []}}\nReturn JSON only. {not json}'
+    assert schema_from_prompt(prompt) == {"overview": {"agency": None, "tags": []}}
+    with pytest.raises(ValueError):
+        schema_from_prompt("no template")
+
+
+def test_agreeing_fields_resolve_locally_and_nulls_are_ignored():
+    documents = [
+        {"document_index": 1, "overview": {"agency": "Army", "due_date": "N/A", "set_aside": True}},
+        {"document_index": 2, "overview": {"agency": " army. ", "due_date": "2025-03-01", "set_aside": "yes"}},
+    ]
+    merged, conflicts, provenance, unstructured = merge_extractions(documents, SCHEMA)
+    assert merged["overview"] == {"agency": "Army", "due_date": "2025-03-01", "set_aside": True}
+    assert merged["requirements"] == {"items": [], "certifications": []}
+    assert conflicts == {}
+    assert provenance["overview.agency"] == {"resolved": "local", "documents": [1, 2]}
+    assert provenance["overview.due_date"]["documents"] == [2]
+    assert unstructured == []
+
+
+def test_list_fields_are_concatenated_and_deduplicated():
+    documents = [
+        {"requirements": {"items": ["Trucks", "Spare parts"], "certifications": "ISO 9001"}},
+        {"requirements": {"items": ["trucks", "Training", None]}},
+    ]
+    merged, _, provenance, _ = merge_extractions(documents, SCHEMA)
+    assert merged["requirements"]["items"] == ["Trucks", "Spare parts", "Training"]
+    assert merged["requirements"]["certifications"] == ["ISO 9001"]
+    assert provenance["requirements.items"]["item_documents"] == [[1, 2], [1], [2]]
+
+
+def test_disagreeing_scalars_become_conflicts_for_the_model():
+    documents = [
+        {"document_index": 3, "overview": {"due_date": "2025-03-01"}},
+        {"document_index": 5, "overview": {"due_date": "2025-04-01"}},
+        {"document_index": 7, "overview": {"due_date": "2025-03-01"}},
+        {"raw_text": "could not parse"},
+    ]
+    merged, conflicts, provenance, unstructured = merge_extractions(documents, SCHEMA)
+    assert merged["overview"]["due_date"] is None
+    assert conflicts["overview"]["due_date"] == [
+        {"document_index": 3, "value": "2025-03-01"},
+        {"document_index": 5, "value": "2025-04-01"},
+        {"document_index": 7, "value": "2025-03-01"},
+    ]
+    assert provenance["overview.due_date"]["resolved"] == "model"
+    assert provenance["overview.due_date"]["candidates"] == [
+        {"value": "2025-03-01", "documents": [3, 7]},
+        {"value": "2025-04-01", "documents": [5]},
+    ]
+    assert unstructured == [{"raw_text": "could not parse"}]
+
+
+def test_apply_resolutions_falls_back_to_the_first_value():
+    documents = [
+        {"overview": {"agency": "Army", "due_date": "2025-03-01"}},
+        {"overview": {"agency": "Navy", "due_date": "2025-04-01"}},
+    ]
+    merged, conflicts, provenance, _ = merge_extractions(documents, SCHEMA)
+    apply_resolutions(merged, conflicts, provenance, {"overview": {"due_date": "2025-04-01", "agency": None}})
+    assert merged["overview"]["due_date"] == "2025-04-01"
+    assert merged["overview"]["agency"] == "Army"
+    assert provenance["overview.agency"]["resolved"] == "first_value_fallback"
+    assert provenance["overview.due_date"]["resolved"] == "model"
+
+
+def test_resolve_conflicts_locally_joins_long_text():
+    first = "The contractor shall deliver trucks to Fort Bragg in two lots over the first quarter of the year."
+    second = "Training for twenty operators is required within thirty days of the final delivery of vehicles."
+    documents = [
+        {"overview": {"agency": "Army", "set_aside": first}},
+        {"overview": {"agency": "Navy", "set_aside": second}},
+    ]
+    merged, conflicts, _, _ = merge_extractions(documents, SCHEMA)
+    resolve_conflicts_locally(merged, conflicts)
+    assert merged["overview"]["agency"] == "Army"
+    assert merged["overview"]["set_aside"] == first + "\n\n" + second
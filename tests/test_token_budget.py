@@ -0,0 +1,72 @@
+from token_budget import (PromptBudget, compact_json, compact_text, count_tokens, digest_turns, get_budget_stats,
+                          truncate_to_tokens)
+
+
+def _turns(count, words=60):
+    return [{"label": f"turn{i}", "content": f"Point {i} is made here. " + "detail " * words} for i in range(count)]
+
+
+def test_compact_text_collapses_spacing():
+    assert compact_text("  a   b\t c \n\n\n\n  d  ") == "a b c\n\nd"
+
+
+def test_compact_json_drops_empty_fields_and_requested_keys():
+    value = {"a": 1, "b": None, "c": "", "d": [], "e": {"f": None}, "g": [{"h": None}, 2], "raw": "x"}
+    assert compact_json(value, drop_keys=("raw",)) == {"a": 1, "g": [2]}
+
+
+def test_truncate_to_tokens_fits_and_marks_the_cut():
+    text = " ".join(f"word{i}" for i in range(500))
+    cut = truncate_to_tokens(text, 50)
+    assert count_tokens(cut) <= 50
+    assert cut.endswith(" [...]")
+    assert text.startswith(cut[:-len(" [...]")])
+    assert truncate_to_tokens("short", 50) == "short"
+
+
+def test_digest_keeps_newest_first_sentences_within_budget():
+    turns = _turns(10)
+    digest = digest_turns(turns, 60)
+    lines = digest.splitlines()[1:]
+    assert sum(count_tokens(line) + 1 for line in lines) <= 60
+    assert "Point 9 is made here." in digest
+    assert "Point 0 is made here." not in digest
+    assert "oldest omitted" in digest
+
+
+def test_fit_leaves_prompts_under_budget_alone():
+    budget = PromptBudget("test.fits", 10_000)
+    budget.fixed("system", "You are helpful.")
+    budget.text("context", "Some   context.", priority=1)
+    fitted = budget.fit()
+    assert fitted == {"system": "You are helpful.", "context": "Some context."}
+    assert budget.report["shrunk"] == [] and not budget.report["over_budget"]
+
+
+def test_fit_shrinks_least_important_parts_first():
+    budget = PromptBudget("test.shrinks", 400)
+    budget.fixed("system", "You are helpful.")
+    budget.text("notes", "note " * 400, priority=1, min_tokens=50)
+    budget.json("records", {"rows": [{"id": i, "raw": "x" * 40, "empty": None} for i in range(40)]}, priority=2,
+                drop_first=("raw",))
+    budget.turns("history", _turns(12), priority=3, min_tokens=100)
+    fitted = budget.fit()
+    report = budget.report
+
+    assert report["prompt_tokens"] <= 400 and not report["over_budget"]
+    assert report["shrunk"][0] == "history"
+    assert report["tokens_saved"] == report["baseline_tokens"] - report["prompt_tokens"]
+    assert fitted["system"] == "You are helpful."
+    digest, kept = fitted["history"]
+    assert kept and kept[-1]["label"] == "turn11"
+    assert digest.startswith("Earlier conversation")
+    assert '"raw"' not in fitted["records"]
+    assert get_budget_stats()["test.shrinks"]["shrunk"] == 1
+
+
+def test_fixed_parts_are_never_shrunk():
+    budget = PromptBudget("test.fixed", 10)
+    budget.fixed("system", "instructions " * 50)
+    fitted = budget.fit()
+    assert fitted["system"] == "instructions " * 50
+    assert budget.report["over_budget"]
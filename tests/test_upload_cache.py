@@ -0,0 +1,17 @@
+import app
+from cache_store import SqliteCache
+
+
+def test_aliases_do_not_count_file_bytes_twice(tmp_path, monkeypatch):
+    cache = SqliteCache("uploads.db", table="uploads")
+    cache.path = str(tmp_path / "uploads.db")
+    monkeypatch.setattr(app, "upload_cache", cache)
+    monkeypatch.setattr(app, "UPLOAD_CACHE_ENABLED", True)
+
+    app._remember_upload(["converted:xlsx:src", "upload:pdfhash"], "file-1", "pdfhash", 1000)
+
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["total_size"] == 1000
+    assert cache.get("converted:xlsx:src")["file_id"] == "file-1"
+    assert cache.get("upload:pdfhash")["size"] == 1000
@@ -0,0 +1,260 @@
+"""
+Token Budget Module
+Fits prompts to a per-route token budget. Parts of a prompt are added with a
+priority; when the total is over budget, whitespace and empty JSON fields
+are dropped first, then the least important parts are shrunk (old chat
+turns folded into a short digest, long text truncated) until it fits.
+Tokens are counted locally with tiktoken, or estimated when it is missing
+"""
+
+import re
+import json
+import math
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Per-message overhead of the chat format (role, separators), as documented
+# for the gpt-4 family.
+MESSAGE_OVERHEAD_TOKENS = 4
+_CHARS_PER_TOKEN = 4
+DIGEST_LINE_TOKENS = 40
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def _encoding(model):
+    """tiktoken encoding for a model, or None when tiktoken is unavailable."""
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                import tiktoken
+                try:
+                    _encodings[model] = tiktoken.encoding_for_model(model or "gpt-4o")
+                except KeyError:
+                    _encodings[model] = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                # Not installed, or its encoding files could not be fetched.
+                print(f"[token-budget] tiktoken unavailable ({e}); estimating tokens from length", flush=True)
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def count_tokens(text, model=None):
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / _CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens, model=None, marker=" [...]"):
+    """Cut text to at most max_tokens, at a word boundary where possible."""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding(model)
+    keep = max(0, max_tokens - count_tokens(marker, model))
+    if encoding is None:
+        cut = text[:keep * _CHARS_PER_TOKEN]
+    else:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[:keep])
+    if " " in cut[len(cut) // 2:]:
+        cut = cut[:cut.rindex(" ")]
+    return cut.rstrip() + marker
+
+
+def compact_text(text):
+    """Collapse runs of spaces and blank lines; leading indentation carries no meaning for the model."""
+    text = re.sub(r"[ \t]+", " ", text or "")
+    text = re.sub(r" ?\n ?", "\n", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def compact_json(value, drop_keys=()):
+    """Drop null/empty fields (and drop_keys) recursively."""
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if key in drop_keys:
+                continue
+            item = compact_json(item, drop_keys)
+            if item not in (None, "", [], {}):
+                result[key] = item
+        return result
+    if isinstance(value, list):
+        return [item for item in (compact_json(v, drop_keys) for v in value) if item not in (None, "", [], {})]
+    return value
+
+
+def _first_sentence(text):
+    text = " ".join((text or "").split())
+    match = re.match(r"(.+?[.!?])(\s|$)", text)
+    return match.group(1) if match else text
+
+
+def digest_turns(turns, max_tokens, model=None):
+    """
+    Extractive summary of older chat turns: the opening sentence of each,
+    newest kept first when they do not all fit. No model call is made, so
+    it costs nothing and adds no latency.
+    """
+    lines = []
+    used = 0
+    for turn in reversed(turns):
+        line = truncate_to_tokens(f"- {turn['label']}: {_first_sentence(turn['content'])}", DIGEST_LINE_TOKENS, model)
+        tokens = count_tokens(line, model) + 1
+        if used + tokens > max_tokens:
+            break
+        lines.append(line)
+        used += tokens
+    omitted = len(turns) - len(lines)
+    header = f"Earlier conversation ({len(turns)} turn(s) condensed" + (f", {omitted} oldest omitted" if omitted else "") + "):"
+    return header + "\n" + "\n".join(reversed(lines)) if lines else ""
+
+
+class _Part:
+    def __init__(self, name, value, priority, min_tokens, baseline_tokens, measure, shrink=None):
+        self.name = name
+        self.value = value
+        self.priority = priority
+        self.min_tokens = min_tokens
+        self.baseline_tokens = baseline_tokens
+        self.measure = measure
+        self.shrink = shrink
+        self.tokens = measure(value)
+
+
+class PromptBudget:
+    """
+    Assemble the parts of one prompt within max_tokens.
+
+    fixed() parts are always kept whole. text(), json() and turns() parts are
+    compacted, and if the total is still over budget they are shrunk in
+    order of priority, highest number (least important) first, each down to
+    its min_tokens. fit() returns {name: fitted value}; report holds the
+    token counts before and after.
+    """
+
+    def __init__(self, route, max_tokens, model=None):
+        self.route = route
+        self.max_tokens = max_tokens
+        self.model = model
+        self.parts = []
+        self.report = None
+
+    def _count(self, text):
+        return count_tokens(text, self.model)
+
+    def _turn_tokens(self, turns):
+        return sum(self._count(t["content"]) + MESSAGE_OVERHEAD_TOKENS for t in turns)
+
+    def fixed(self, name, text):
+        tokens = self._count(text)
+        self.parts.append(_Part(name, text, None, tokens, tokens, self._count))
+
+    def text(self, name, text, priority, min_tokens=0):
+        self.parts.append(_Part(name, compact_text(text), priority, min_tokens, self._count(text), self._count,
+                                lambda value, max_tokens: truncate_to_tokens(value, max_tokens, self.model)))
+
+    def json(self, name, value, priority, min_tokens=0, drop_first=()):
+        """
+        A JSON context block. Its baseline is the indented dump it replaces;
+        drop_first keys are removed before any truncation.
+        """
+        def shrink(text, max_tokens):
+            if drop_first:
+                text = json.dumps(compact_json(value, drop_first), separators=(",", ":"))
+            return truncate_to_tokens(text, max_tokens, self.model)
+
+        self.parts.append(_Part(name, json.dumps(compact_json(value), separators=(",", ":")), priority, min_tokens,
+                                self._count(json.dumps(value, indent=2)), self._count, shrink))
+
+    def turns(self, name, turns, priority, min_tokens=0, digest_share=0.25):
+        """
+        Conversation turns ({"label", "content", ...}, oldest first). When
+        shrunk, the newest turns that fit are kept verbatim and the older ones
+        are folded into a digest of at most digest_share of the allowance.
+        The fitted value is (digest_text, kept_turns).
+        """
+        compacted = [dict(turn, content=compact_text(turn["content"])) for turn in turns]
+
+        def measure(value):
+            digest, kept = value
+            return (self._count(digest) + MESSAGE_OVERHEAD_TOKENS if digest else 0) + self._turn_tokens(kept)
+
+        def shrink(value, max_tokens):
+            kept = list(compacted)
+            verbatim = max_tokens - int(max_tokens * digest_share)
+            while kept and self._turn_tokens(kept) > verbatim:
+                kept.pop(0)
+            if not kept and compacted:
+                # Even the newest turn is too long: keep it, truncated.
+                kept = [dict(compacted[-1], content=truncate_to_tokens(
+                    compacted[-1]["content"], max(0, verbatim - MESSAGE_OVERHEAD_TOKENS), self.model))]
+            overflow = compacted[:len(compacted) - len(kept)]
+            digest_tokens = max_tokens - self._turn_tokens(kept) - MESSAGE_OVERHEAD_TOKENS
+            digest = digest_turns(overflow, digest_tokens, self.model) if overflow and digest_tokens > 0 else ""
+            return digest, kept
+
+        self.parts.append(_Part(name, ("", compacted), priority, min_tokens, self._turn_tokens(turns),
+                                measure, shrink))
+
+    def fit(self):
+        baseline = sum(part.baseline_tokens for part in self.parts)
+        compacted = total = sum(part.tokens for part in self.parts)
+        shrunk = []
+        for part in sorted((p for p in self.parts if p.shrink), key=lambda p: -p.priority):
+            if total <= self.max_tokens:
+                break
+            allowance = max(part.min_tokens, part.tokens - (total - self.max_tokens))
+            if allowance >= part.tokens:
+                continue
+            part.value = part.shrink(part.value, allowance)
+            tokens = part.measure(part.value)
+            total -= part.tokens - tokens
+            part.tokens = tokens
+            shrunk.append(part.name)
+
+        self.report = {
+            "route": self.route,
+            "budget": self.max_tokens,
+            "baseline_tokens": baseline,
+            "compacted_tokens": compacted,
+            "prompt_tokens": total,
+            "tokens_saved": max(0, baseline - total),
+            "shrunk": shrunk,
+            "over_budget": total > self.max_tokens,
+        }
+        _record(self.report)
+        if shrunk or self.report["over_budget"]:
+            print(f"[token-budget] {self.route}: {baseline} -> {total} tokens (budget {self.max_tokens}), "
+                  f"shrunk {', '.join(shrunk) or 'nothing'}", flush=True)
+        return {part.name: part.value for part in self.parts}
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(report):
+    with _stats_lock:
+        stats = _stats.setdefault(report["route"], {
+            "prompts": 0, "baseline_tokens": 0, "prompt_tokens": 0, "tokens_saved": 0, "shrunk": 0, "over_budget": 0,
+        })
+        stats["prompts"] += 1
+        stats["baseline_tokens"] += report["baseline_tokens"]
+        stats["prompt_tokens"] += report["prompt_tokens"]
+        stats["tokens_saved"] += report["tokens_saved"]
+        stats["shrunk"] += 1 if report["shrunk"] else 0
+        stats["over_budget"] += 1 if report["over_budget"] else 0
+
+
+def get_budget_stats():
+    """Per-route prompt counts and tokens saved against the uncompacted prompts."""
+    with _stats_lock:
+        return {route: dict(stats) for route, stats in _stats.items()}